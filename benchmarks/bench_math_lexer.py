@@ -0,0 +1,90 @@
+import re
+import time
+import random
+import argparse
+
+from math_lexer import iter_math_spans, transform_outside_math
+
+'''
+수식 영역 렉서(math_lexer.py) 처리량 벤치마크입니다.
+한글 문장, 인라인/디스플레이 수식, array 환경이 섞인 큰 합성 텍스트를 만들어
+기존 방식(정규식 split 후 구간마다 re.match / 수식마다 text.replace)과 처리 속도를 비교합니다.
+
+실행 예시 (저장소 루트에서) >
+  python -m benchmarks.bench_math_lexer --mb 20
+'''
+
+SNIPPETS = [
+    "다음은 (주)한국의 제25기 자료이다. ",
+    "법인세법상 익금에 산입할 금액은? ",
+    "$70,000,000$원 ",
+    "$x + y = z$ ",
+    "$$다음은 제25기(2025.1.1. $\\sim$ 12.31.) 자료이다.$$ ",
+    "\\[ \\frac{a}{b} \\] ",
+    "\\begin{array}{l r} \\text{매출액} & 1,000 \\\\ \\text{원가} & 600 \\end{array} ",
+    "① $\\,$ 1,000,000원 $\\quad$ ② $\\,$ 2,000,000원 ",
+    "\\textbf{주의} 사항\n",
+]
+
+
+def make_text(size_bytes, seed=0):
+    rng = random.Random(seed)
+    parts, total = [], 0
+    while total < size_bytes:
+        s = rng.choice(SNIPPETS)
+        parts.append(s)
+        total += len(s.encode('utf-8'))
+    return ''.join(parts)
+
+
+# 기존 parse.py 방식
+OLD_PATTERN = re.compile(r'(\\begin\{array\}.*?\\end\{array\}|\${1,2}.*?\${1,2})', re.DOTALL)
+
+
+def old_remove_backslash(text):
+    result = []
+    for part in OLD_PATTERN.split(text):
+        if re.match(r'(\\begin\{array\}.*?\\end\{array\}|\${1,2}.*?\${1,2})', part, re.DOTALL):
+            result.append(part)
+        else:
+            result.append(part.replace("\\", ""))
+    return ''.join(result)
+
+
+# 기존 mathpix_spacing.py 방식 (spacing 모델 호출은 제외하고 치환/복원 비용만 측정)
+def old_placeholder_roundtrip(text):
+    math_patterns = re.findall(r'\$.*?\$', text)
+    for i, formula in enumerate(math_patterns):
+        text = text.replace(formula, f"<<MATH_{i}>>")
+    for i, formula in enumerate(math_patterns):
+        text = text.replace(f"<<MATH_{i}>>", formula)
+    return text
+
+
+def measure(name, fn, text, mb):
+    start = time.perf_counter()
+    fn(text)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<36}: {elapsed:8.3f}s ({mb / elapsed:8.2f} MB/s)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=10)
+    # 기존 치환 방식은 O(수식 수 × 길이)라 큰 입력에서는 끝나지 않으므로 별도 크기로 측정
+    parser.add_argument('--placeholder-kb', type=float, default=200)
+    args = parser.parse_args()
+
+    text = make_text(int(args.mb * 1024 * 1024))
+    print(f"입력 크기: {args.mb} MB")
+    measure("lexer: iter_math_spans", lambda t: sum(1 for _ in iter_math_spans(t)), text, args.mb)
+    measure("lexer: remove backslash", lambda t: transform_outside_math(t, lambda p: p.replace("\\", "")),
+            text, args.mb)
+    measure("old: regex split + re.match", old_remove_backslash, text, args.mb)
+
+    small_mb = args.placeholder_kb / 1024
+    small = make_text(int(args.placeholder_kb * 1024))
+    print(f"\n입력 크기: {args.placeholder_kb} KB")
+    measure("lexer: transform (identity)", lambda t: transform_outside_math(t, lambda p: p), small, small_mb)
+    measure("old: placeholder replace", old_placeholder_roundtrip, small, small_mb)
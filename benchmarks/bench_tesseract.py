@@ -0,0 +1,65 @@
+import time
+import argparse
+
+import cv2
+import numpy as np
+import pytesseract
+
+from tesseract_pool import TesseractPool, DIGIT_CONFIG
+
+'''
+문제번호 OCR 마이크로벤치마크입니다.
+question_crop_by_img.py가 만드는 것과 같은 형태(검은 배경에 흰 숫자)의 문제번호 영역 이미지를 합성하여
+기존 pytesseract 경로와 tesserocr 엔진 풀(단건 / batch)의 처리 속도와 인식 결과를 비교합니다.
+
+실행 예시 (저장소 루트에서) >
+  python -m benchmarks.bench_tesseract --pages 50 --threads 4
+'''
+
+
+# 300dpi 기준 문제번호 클립 영역(약 1250 x 2400px)에 숫자 2~3개를 세로로 배치한 이진 이미지
+def make_number_strip(numbers, width=1250, height=2400):
+    img = np.zeros((height, width), dtype=np.uint8)
+    step = height // (len(numbers) + 1)
+    for i, number in enumerate(numbers):
+        y = step * (i + 1)
+        cv2.rectangle(img, (60, y - 70), (260, y + 30), 255, -1)
+        cv2.rectangle(img, (70, y - 60), (250, y + 20), 0, -1)
+        cv2.putText(img, f"{number:02d}", (90, y), cv2.FONT_HERSHEY_SIMPLEX, 2.5, 255, 6)
+    return img
+
+
+def numbers_in(ocr_data):
+    return [int(t) for t in ocr_data['text'] if t.isdigit()]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    strips = [make_number_strip([2 * i + 1, 2 * i + 2]) for i in range(args.pages)]
+
+    t_pytesseract, base = timed(lambda: [
+        pytesseract.image_to_data(s, config=DIGIT_CONFIG, output_type=pytesseract.Output.DICT) for s in strips
+    ])
+
+    with TesseractPool(size=args.threads, config=DIGIT_CONFIG) as pool:
+        pool.warm_up()  # 스레드마다 엔진을 미리 초기화하여 초기화 비용은 측정에서 제외
+        t_single, single = timed(lambda: [pool.image_to_data(s) for s in strips])
+        t_batch, batch = timed(lambda: pool.batch(strips))
+
+    expected = [numbers_in(d) for d in base]
+    same = expected == [numbers_in(d) for d in single] == [numbers_in(d) for d in batch]
+    print(f"페이지 수: {args.pages}, 스레드: {args.threads}")
+    print(f"pytesseract      : {t_pytesseract:.3f}s ({args.pages / t_pytesseract:.1f} pages/s)")
+    print(f"tesserocr 단건    : {t_single:.3f}s ({args.pages / t_single:.1f} pages/s, x{t_pytesseract / t_single:.1f})")
+    print(f"tesserocr batch  : {t_batch:.3f}s ({args.pages / t_batch:.1f} pages/s, x{t_pytesseract / t_batch:.1f})")
+    print(f"인식 결과 일치: {same}")
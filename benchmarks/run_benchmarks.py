@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import synthetic
+
+'''
+crop / parse / DB 저장 단계의 처리 속도를 합성 데이터로 측정하고, JSON 기준값(baseline)과 비교하는 벤치마크 실행기입니다.
+
+측정 항목 >
+  crop_text       : question_crop_by_text.crop_pdf (텍스트 레이어 PDF)            → pages/s
+  crop_text_2col  : 같은 cropper에 2단 배치 PDF                                  → pages/s
+  crop_img        : question_crop_by_img.crop_pdf (마젠타 번호, 스캔본 PDF)       → pages/s (tesseract가 없으면 건너뜀)
+  parse           : parse.parse_file (.tex → JSON)                               → blocks/s
+  ox_parse        : ox_question_parse.txt.py의 parse_ox_txt_file                 → blocks/s
+  db_load         : insertDB.load_problem_group                                  → rows/s
+                    --dsn을 주면 실제 PostgreSQL에 저장 후 롤백, 없으면 execute_values가 쓰는 커서 동작만 흉내낸 가짜 커서 사용
+
+각 항목은 새 프로세스에서 실행하여 peak RSS(최대 메모리)를 항목별로 따로 측정합니다. (crop 워커 프로세스는 별도 항목으로 기록)
+--repeat 번 실행하여 가장 빠른 결과를 사용합니다.
+
+실행 예시 (저장소 루트에서) >
+  python -m benchmarks.run_benchmarks --save benchmarks/baseline.json
+  python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json --tolerance 0.15
+  python -m benchmarks.run_benchmarks --only parse --only db_load --dsn "dbname=taxpass_bench"
+'''
+
+BENCHMARKS = ("crop_text", "crop_text_2col", "crop_img", "parse", "ox_parse", "db_load")
+
+
+# 이 프로세스 / 자식 프로세스의 최대 RSS (MB), macOS는 byte, Linux는 KB 단위
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def load_ox_parser():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ox_question_parse.txt.py")
+    spec = importlib.util.spec_from_file_location("ox_question_parse", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# execute_values / load_problem_group이 사용하는 커서 동작만 흉내낸 가짜 커서
+# mogrify로 행을 직렬화하고, RETURNING 절이 있으면 직렬화된 행 수만큼 (id, 문제번호)를 돌려줌 (SELECT 결과는 항상 없음)
+class FakeCursor:
+    class connection:
+        encoding = "UTF8"
+
+    def __init__(self):
+        self.next_id = 1
+        self.pending = []
+        self.result = []
+        self.statements = 0
+
+    def mogrify(self, template, args):
+        self.pending.append(args)
+        return json.dumps(args, ensure_ascii=False).encode("utf-8")
+
+    def execute(self, sql, params=None):
+        self.statements += 1
+        sql = sql.decode("utf-8") if isinstance(sql, bytes) else sql
+        rows = self.pending if self.pending else [params]
+        self.result = []
+        if "RETURNING" in sql:
+            for args in rows:
+                # 문제 INSERT는 (id, number), 그 외는 (id,)
+                self.result.append((self.next_id, args[1]) if "number" in sql else (self.next_id,))
+                self.next_id += 1
+        self.pending = []
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+# ---- 벤치마크 항목: (처리량 단위 개수, 단위) 반환 ----
+
+def bench_crop(workdir, args, columns=1):
+    import question_crop_by_text
+    pdf_path = os.path.join(workdir, f"exam_{columns}col.pdf")
+    pages = synthetic.make_exam_pdf(pdf_path, questions=args.questions, columns=columns)
+    start = time.perf_counter()
+    outputs, errors = question_crop_by_text.crop_pdf(pdf_path, os.path.join(workdir, f"crop_{columns}col"),
+                                                     workers=args.workers, verbose=False)
+    return pages, "pages", time.perf_counter() - start, {"crops": len(outputs), "errors": len(errors)}
+
+
+def bench_crop_img(workdir, args):
+    import pytesseract
+    import question_crop_by_img
+    pytesseract.get_tesseract_version()  # tesseract 실행 파일이 없으면 예외 → 건너뜀
+
+    pdf_path = os.path.join(workdir, "exam_scan.pdf")
+    pages = synthetic.make_exam_pdf(pdf_path, questions=args.questions, badges=True, image_only=True, dpi=300)
+    start = time.perf_counter()
+    outputs, errors = question_crop_by_img.crop_pdf(pdf_path, os.path.join(workdir, "crop_img"),
+                                                    pages=range(pages), workers=args.workers, clip_rects={})
+    return pages, "pages", time.perf_counter() - start, {"crops": len(outputs), "errors": len(errors)}
+
+
+def bench_parse(workdir, args):
+    import parse
+    tex_path = os.path.join(workdir, "exam.tex")
+    with open(tex_path, "w", encoding="utf-8") as f:
+        f.write(synthetic.make_tex(args.blocks))
+    start = time.perf_counter()
+    _, _, results, exceptions = parse.parse_file(tex_path, os.path.join(workdir, "exam"), exception_mode="w")
+    return results + exceptions, "blocks", time.perf_counter() - start, {"exceptions": exceptions}
+
+
+def bench_ox_parse(workdir, args):
+    ox_parser = load_ox_parser()
+    txt_path = os.path.join(workdir, "ox.txt")
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write(synthetic.make_ox_txt(args.blocks))
+    start = time.perf_counter()
+    parsed = ox_parser.parse_ox_txt_file(txt_path)
+    return len(parsed), "blocks", time.perf_counter() - start, {}
+
+
+def bench_db_load(workdir, args):
+    import insertDB
+    question_data = synthetic.make_question_data(args.rows)
+    answer_data = synthetic.make_answer_data(args.rows)
+
+    if args.dsn:
+        import psycopg2
+        conn = psycopg2.connect(args.dsn)
+        cur = conn.cursor()
+    else:
+        conn, cur = None, FakeCursor()
+
+    try:
+        start = time.perf_counter()
+        rows = insertDB.load_problem_group(cur, "벤치마크", "벤치마크_문제묶음", question_data, answer_data, ["벤치마크"])
+        elapsed = time.perf_counter() - start
+    finally:
+        # 실제 DB는 항상 롤백하여 벤치마크 데이터를 남기지 않음
+        if conn:
+            conn.rollback()
+            cur.close()
+            conn.close()
+    return rows, "rows", elapsed, {"backend": "postgresql" if args.dsn else "fake"}
+
+
+BENCH_FUNCTIONS = {
+    "crop_text": lambda workdir, args: bench_crop(workdir, args, columns=1),
+    "crop_text_2col": lambda workdir, args: bench_crop(workdir, args, columns=2),
+    "crop_img": bench_crop_img,
+    "parse": bench_parse,
+    "ox_parse": bench_ox_parse,
+    "db_load": bench_db_load,
+}
+
+
+# 새 프로세스에서 항목 하나를 repeat번 실행 → 결과 dict
+def run_one(name, args):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        best = None
+        for _ in range(args.repeat):
+            count, unit, elapsed, extra = BENCH_FUNCTIONS[name](workdir, args)
+            if best is None or elapsed < best[2]:
+                best = (count, unit, elapsed, extra)
+        count, unit, elapsed, extra = best
+        return {
+            "throughput": round(count / elapsed, 2) if elapsed else None,
+            "unit": f"{unit}/s",
+            "count": count,
+            "seconds": round(elapsed, 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "peak_rss_children_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            **extra,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_all(names, args):
+    results = {}
+    # fork 대신 spawn으로 항목마다 깨끗한 프로세스에서 측정 (이전 항목의 메모리 사용량이 섞이지 않음)
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                results[name] = executor.submit(run_one, name, args).result()
+            except Exception as e:
+                results[name] = {"skipped": f"{e.__class__.__name__}: {e}"}
+        print_result(name, results[name])
+    return results
+
+
+def print_result(name, result):
+    if "skipped" in result:
+        print(f"{name:<16} 건너뜀 ({result['skipped']})")
+        return
+    print(f"{name:<16} {result['throughput']:>12,.1f} {result['unit']:<9} "
+          f"{result['seconds']:8.3f}s  peak RSS {result['peak_rss_mb']:7.1f} MB"
+          f" (자식 {result['peak_rss_children_mb']:.1f} MB)")
+
+
+# 기준값 대비 처리량 변화 비교 → 허용 범위를 넘게 느려진 항목 목록
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n기준값 비교 (허용 하락폭 {tolerance:.0%})")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "throughput" not in base or "throughput" not in result:
+            continue
+        change = result["throughput"] / base["throughput"] - 1
+        rss_change = result["peak_rss_mb"] - base["peak_rss_mb"]
+        flag = ""
+        if change < -tolerance:
+            flag = "  <-- 느려짐"
+            regressions.append(name)
+        print(f"{name:<16} {base['throughput']:>12,.1f} → {result['throughput']:>12,.1f} {result['unit']:<9}"
+              f" ({change:+.1%}, RSS {rss_change:+.1f} MB){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="실행할 항목 (여러 번 지정 가능)")
+    parser.add_argument("--questions", type=int, default=40, help="시험지 PDF의 문제 수")
+    parser.add_argument("--blocks", type=int, default=20000, help=".tex 블록 / OX 문제 수")
+    parser.add_argument("--rows", type=int, default=2000, help="DB 저장 벤치마크의 문제 수")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="crop 워커 프로세스 수")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dsn", help="실제 PostgreSQL 접속 문자열 (없으면 가짜 커서)")
+    parser.add_argument("--save", help="결과를 기준값 JSON으로 저장")
+    parser.add_argument("--compare", help="비교할 기준값 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="허용 처리량 하락 비율")
+    args = parser.parse_args()
+
+    results = run_all(args.only or BENCHMARKS, args)
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("save", "compare", "dsn")},
+        },
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n기준값 저장: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n!!! 처리량 하락: {', '.join(regressions)}")
+            sys.exit(1)
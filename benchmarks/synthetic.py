@@ -0,0 +1,149 @@
+import random
+
+import fitz
+
+'''
+벤치마크용 합성 데이터 생성기입니다.
+실제 시험지/OCR 결과 대신 크기와 형태를 조절할 수 있는 입력을 만들어, 단계별 처리 속도를 같은 조건에서 비교합니다.
+
+- make_exam_pdf : "1." ~ "40." 문제번호가 있는 시험지 PDF
+    - columns=2    : 2단 배치 (왼쪽 단 → 오른쪽 단 순서)
+    - badges=True  : 문제번호를 마젠타 색으로 표시 (question_crop_by_img.py용)
+    - image_only   : 페이지를 이미지로 렌더링해 텍스트 레이어가 없는 스캔본 형태로 저장
+- make_tex      : run_openai.py 출력 형태의 ```latex 블록이 이어 붙은 .tex 텍스트 (parse.py용)
+- make_ox_txt   : OX 문제 은행 .txt 텍스트 (ox_question_parse.txt.py의 parse_ox_txt_file용)
+- make_question_data / make_answer_data : insertDB.py에 넣을 문제 / 정답 데이터
+'''
+
+# PDF에 한글을 쓰기 위한 PyMuPDF 내장 CJK 폰트
+KOREAN_FONT = "korea"
+MAGENTA = (1, 0, 1)
+
+SENTENCES = [
+    "다음은 (주)한국의 제25기 사업연도 자료이다.",
+    "법인세법상 각 사업연도 소득금액 계산 시 익금에 산입할 금액은?",
+    "상여로 처분된 금액은 근로소득에 해당한다.",
+    "감가상각비 한도초과액은 손금불산입하고 유보로 처분한다.",
+    "다음 중 부가가치세법상 옳지 않은 것은?",
+    "기업업무추진비 한도는 수입금액에 비례하여 증가한다.",
+]
+CHOICES = ["① 1,000,000원", "② 2,000,000원", "③ 3,000,000원", "④ 4,000,000원", "⑤ 5,000,000원"]
+INLINE_CHOICES = " $\\quad$ ".join(CHOICES)
+MATH = [
+    "$70,000,000$원",
+    "$x + y = z$",
+    "$$다음은 제25기(2025.1.1. $\\sim$ 12.31.) 자료이다.$$",
+    "\\begin{array}{l r} \\text{매출액} & 1,000 \\\\ \\text{원가} & 600 \\end{array}",
+]
+
+
+# 시험지 PDF 생성, 생성된 페이지 수 반환
+# 한 단에 per_column개의 문제를 세로로 배치하고, 문제 사이는 지문/보기 텍스트로 채움
+def make_exam_pdf(path, questions=40, per_column=4, columns=1, badges=False, image_only=False, dpi=150, seed=0):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = None
+    width, height = fitz.paper_size("a4")
+    top, bottom = 80, height - 60
+    column_width = (width - 80) / columns
+    slot = (bottom - top) / per_column
+
+    for i in range(questions):
+        position = i % (per_column * columns)
+        if position == 0:
+            page = doc.new_page(width=width, height=height)
+            page.insert_text((40, 50), "2025. 세무사 기출문제", fontname=KOREAN_FONT, fontsize=9)
+        column, row = divmod(position, per_column)
+        x = 40 + column * column_width
+        y = top + row * slot
+
+        number = f"{i + 1}."
+        if badges:
+            page.insert_text((x, y + 14), number, fontsize=18, color=MAGENTA)
+        else:
+            page.insert_text((x, y + 12), number, fontsize=11)
+
+        # 지문 + 보기
+        line_y = y + 12
+        for _ in range(rng.randint(2, 4)):
+            page.insert_text((x + 24, line_y), rng.choice(SENTENCES), fontname=KOREAN_FONT, fontsize=9)
+            line_y += 14
+        page.insert_text((x + 24, line_y + 4), "   ".join(CHOICES[:3 if columns > 1 else 5]),
+                         fontname=KOREAN_FONT, fontsize=9)
+
+    if image_only:
+        doc = rasterize(doc, dpi)
+    page_count = len(doc)
+    doc.save(path)
+    doc.close()
+    return page_count
+
+
+# 페이지마다 렌더링한 이미지만 담은 새 PDF (텍스트 레이어 없음)
+def rasterize(doc, dpi):
+    scanned = fitz.open()
+    for page in doc:
+        pix = page.get_pixmap(dpi=dpi, alpha=False)
+        new_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, pixmap=pix)
+    doc.close()
+    return scanned
+
+
+# ```latex 블록 텍스트, broken_ratio 비율만큼 <<choice>> 태그가 없는 블록 포함
+def make_tex(blocks, broken_ratio=0.05, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for i in range(blocks):
+        description = " ".join(rng.choice(SENTENCES + MATH) for _ in range(rng.randint(2, 6)))
+        choice = f"<<choice>>\n{INLINE_CHOICES}\n<</choice>>\n"
+        if rng.random() < broken_ratio:
+            choice = ""
+        parts.append(
+            "```latex\n"
+            "<<problemInfo>> • 2024. 세무사 <</problemInfo>>\n"
+            f"<<problem_num>> {i + 1}. <</problem_num>>\n"
+            f"<<description>>\n{description}\n<</description>>\n"
+            f"{choice}"
+            "```\n"
+        )
+    return "".join(parts)
+
+
+# OX 문제 은행 텍스트
+def make_ox_txt(count, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for i in range(count):
+        parts.append(
+            f"{i + 1}. {rng.choice(SENTENCES)}\n"
+            f"정답: {rng.choice('OX')}\n"
+            "세부 카테고리: 법인세법 / 소득처분\n"
+            f"해설: {' '.join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 3)))}\n"
+        )
+    return "\n".join(parts)
+
+
+# parse.py 결과 형태의 문제 데이터 (table형 보기 포함)
+def make_question_data(count, table_ratio=0.1, seed=0):
+    rng = random.Random(seed)
+    data = []
+    for i in range(count):
+        if rng.random() < table_ratio:
+            choice = ('{"choices": [{"number": "①", "상여": "$11,000,000$", "배당": "$1,000,000$"},'
+                      ' {"number": "②", "상여": "$10,000,000$", "배당": "$2,000,000$"}]}')
+        else:
+            choice = " ".join(CHOICES)
+        data.append({
+            "problem_num": str(i + 1),
+            "description": " ".join(rng.choice(SENTENCES) for _ in range(3)),
+            "choice": choice,
+            "problem_info": "2024. 세무사",
+        })
+    return data
+
+
+def make_answer_data(count, seed=0):
+    rng = random.Random(seed)
+    return [{"번호": str(i + 1), "정답": rng.choice("①②③④⑤"), "해설": rng.choice(SENTENCES)}
+            for i in range(count)]
@@ -0,0 +1,99 @@
+import numpy as np
+
+'''
+문제 crop 이미지에서 잉크가 있는 영역만 남기는 여백 제거 모듈입니다.
+
+question_crop_by_text.py / question_crop_by_img.py는 문제 영역을 페이지(또는 단) 전체 너비로,
+다음 문제번호 또는 페이지 끝(y2 = img_height)까지 자르므로 crop 대부분이 흰 여백입니다.
+페이지의 마지막 문제에는 아래쪽 꼬리말(페이지 번호, 시험명, 구분선)까지 함께 잘려 들어갑니다.
+
+1. 투영 프로파일 : 밝기가 threshold 미만인 픽셀을 잉크로 보고, 행/열별로 잉크가 있는지만 계산 (NumPy 한 번, 픽셀 단위 파이썬 반복 없음)
+2. 잉크 띠 : 잉크가 있는 행이 이어진 구간(띠)을 np.diff로 한 번에 구함
+3. 꼬리말 분리 : crop 아래 끝 edge_zone 안에 있는 띠 몇 개(구분선 + 페이지 번호 등)가 합쳐서 두 줄 높이 이하이고
+   본문과 edge_gap 이상 떨어져 있으면 꼬리말로 보고 잘라냄
+   페이지 끝까지 잘린 crop(각 단의 마지막 문제)만 검사합니다.
+   crop은 항상 문제번호 위치에서 시작하므로 위쪽에는 머리말이 들어가지 않습니다.
+4. 남은 잉크 영역의 경계 상자 + padding 만큼만 남김
+
+px 값은 crop 해상도 300dpi 기준입니다. (image_encoder.py는 해상도와 상관없이 trim_margins만 사용)
+'''
+
+TRIM_OPTIONS = {
+    "threshold": 245,        # 이 값 이상 밝기는 여백으로 판단
+    "padding": 12,           # 여백 제거 후 남겨둘 px
+    "edge_zone": 300,        # 꼬리말이 있을 수 있는 페이지 아래 끝 범위 (px, 약 25mm)
+    "edge_gap": 90,          # 꼬리말과 본문 사이 최소 빈 행 수 (px, 약 7.6mm)
+    "edge_max_height": 150,  # 꼬리말 전체 최대 높이 (px, 약 두 줄)
+    "edge_max_count": 2,     # 꼬리말 최대 띠 수 (예: 구분선 + 페이지 번호)
+}
+
+
+# 채널별 최솟값 (가장 어두운 채널 = 흑백 밝기 대신 사용, 색 글씨도 잉크로 봄)
+# img.min(axis=2)는 길이 3인 축을 픽셀마다 줄이느라 300dpi 페이지 한 장에 수백 ms가 걸리므로 채널끼리 np.minimum으로 비교
+def darkest_channel(img):
+    if img.ndim == 2:
+        return img
+    gray = img[..., 0]
+    for c in range(1, img.shape[2]):
+        gray = np.minimum(gray, img[..., c])
+    return gray
+
+
+# 투영 프로파일: 흑백 이미지의 행/열별 잉크 여부 (bool 배열 2개)
+def ink_profile(gray, threshold):
+    return gray.min(axis=1) < threshold, gray.min(axis=0) < threshold
+
+
+# 잉크가 있는 행이 이어진 구간 → (띠 수 x 2) 배열, 각 행은 [시작, 끝) 인덱스
+def ink_bands(has_ink):
+    edges = np.diff(np.concatenate(([0], has_ink.astype(np.int8), [0])))
+    return np.stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=1)
+
+
+# 가장자리에서부터 꼬리말로 잘라낼 띠 수
+# distances : 가장자리에서 가까운 순서의 띠 목록, 각 행은 가장자리까지의 [가까운 쪽, 먼 쪽] 거리
+# 가장자리 쪽 k개 띠(k <= edge_max_count)가 edge_zone 안에 있고, 합친 높이가 edge_max_height 이하이며,
+# 다음 띠(본문)와 edge_gap 이상 떨어져 있으면 잘라냄 (구분선 + 페이지 번호처럼 붙어 있는 띠를 한 꼬리말로 봄)
+# 본문 띠는 하나 이상 남김
+def edge_band_count(distances, options):
+    count = 0
+    for k in range(1, min(options["edge_max_count"], len(distances) - 1) + 1):
+        far = distances[k - 1][1]
+        if far <= options["edge_zone"] and far - distances[0][0] <= options["edge_max_height"] \
+                and distances[k][0] - far >= options["edge_gap"]:
+            count = k
+    return count
+
+
+# 흰 여백 제거: 행/열별로 어두운 픽셀이 있는지만 보고 잉크 영역의 경계 상자를 구함
+def trim_margins(img, threshold, padding):
+    rows, cols = (np.flatnonzero(profile) for profile in ink_profile(darkest_channel(img), threshold))
+    if rows.size == 0:
+        return img
+    y0, y1 = max(0, rows[0] - padding), min(img.shape[0], rows[-1] + 1 + padding)
+    x0, x1 = max(0, cols[0] - padding), min(img.shape[1], cols[-1] + 1 + padding)
+    return img[y0:y1, x0:x1]
+
+
+# 문제 crop 여백 제거 + 꼬리말 분리
+# bottom : crop이 페이지 아래 끝에 닿아 있어 꼬리말이 들어갔을 수 있는지
+# (잘라낸 이미지(view), 잘라낸 꼬리말 행 범위 [(y0, y1), ...]) 반환, 잉크가 없으면 원본 그대로
+def tighten_crop(img, options=TRIM_OPTIONS, bottom=False):
+    gray = darkest_channel(img)
+    row_ink = gray.min(axis=1) < options["threshold"]
+    bands = ink_bands(row_ink)
+    if len(bands) == 0:
+        return img, []
+    last = len(bands)
+    if bottom:
+        # 아래 끝에서 가까운 순서로 뒤집고 y좌표를 아래 끝까지의 거리로 바꿈
+        last -= edge_band_count(img.shape[0] - bands[::-1, ::-1], options)
+    removed = [tuple(int(v) for v in band) for band in bands[last:]]
+
+    # 남은 띠 범위 안에서만 열 프로파일을 다시 계산 (꼬리말의 가로 위치가 경계 상자를 넓히지 않도록)
+    y0, y1 = bands[0][0], bands[last - 1][1]
+    cols = np.flatnonzero(gray[y0:y1].min(axis=0) < options["threshold"])
+    padding = options["padding"]
+    y0, y1 = max(0, y0 - padding), min(img.shape[0], y1 + padding)
+    x0, x1 = max(0, cols[0] - padding), min(img.shape[1], cols[-1] + 1 + padding)
+    return img[y0:y1, x0:x1], removed
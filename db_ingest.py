@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import metrics
+from file_io import read_records
+from insertDB import get_or_create_subject, load_problem_group
+from ox_insertDB import OX_FILE_SUFFIX, subject_from_path, load_ox_questions
+
+'''
+폴더 안의 문제 / 정답 / OX JSON 파일을 한 번에 PostgreSQL에 저장하는 스크립트입니다.
+insertDB.py / ox_insertDB.py는 파일 하나씩 새 연결로 저장하므로, 한 학기 과목 전체를 넣으려면 과목마다 설정을 고쳐 실행해야 했습니다.
+
+1. 폴더에서 저장할 파일을 찾습니다.
+   - OX 문제 : <과목>_ox_questions.json                        → ox_insertDB.load_ox_questions (과목이름은 파일명에서 추출)
+   - 문제    : <이름>.json 또는 <이름>.jsonl (parse.py 결과)   → insertDB.load_problem_group
+     정답    : <이름>_답안_parsed.json
+     문제 묶음 이름은 <이름>, 태그는 <이름>을 '_'로 나눈 값 중 숫자가 아닌 것 (2025_재정학 → ['재정학'])
+   - 짝이 없는 정답 파일은 실패로 보고합니다. (<이름>_exception.json 등 나머지 파일은 무시)
+2. 문제 파일의 과목은 저장을 시작하기 전에 과목이름마다 한 번만 조회 / 생성(get_or_create_subject)하고,
+   모든 파일이 같은 과목 id를 사용합니다. (파일마다 과목 행이 새로 생기지 않음)
+   --replace를 주면 같은 과목 / 이름의 기존 문제 묶음을 같은 트랜잭션에서 지우고 저장하므로, 폴더를 다시 넣어도 문제 묶음이 중복되지 않습니다.
+   (OX 문제 파일에는 적용되지 않음)
+3. DB 저장은 최대 --connections 개의 연결을 가진 ThreadedConnectionPool을 스레드들이 나누어 쓰며,
+   파일(문제+정답 한 쌍) 하나를 트랜잭션 하나로 저장합니다. 오류가 나면 그 파일만 롤백하고 나머지 파일은 계속 저장합니다.
+   JSON 디코딩도 같은 스레드에서 처리합니다. 별도 프로세스에서 디코딩하면 결과를 다시 pickle로 보내는 비용이
+   디코딩 비용만큼 들기 때문이며, 한 스레드가 디코딩하는 동안 다른 스레드는 DB 응답을 기다립니다.
+4. 파일별 성공/실패, 저장 행 수, rows/s를 출력하고 --report 경로에 JSON으로 저장합니다.
+
+실행 예시 >
+  python db_ingest.py data/output
+  python db_ingest.py data/output --subject 세법 --connections 8 --report ingest_report.json
+  python db_ingest.py data/output --replace       # 이미 저장한 문제 묶음은 지우고 다시 저장
+  python db_ingest.py data/output --dry-run       # 찾은 파일 목록만 출력
+'''
+
+SUBJECT_NAME = '세법'
+DEFAULT_CONNECTIONS = 4
+
+ANSWER_FILE_SUFFIX = "_답안_parsed.json"
+
+
+def db_config():
+    return dict(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+
+
+# 2025_재정학 → ['재정학']
+def tags_from_name(name):
+    return [part for part in name.split("_") if part and not part.isdigit()]
+
+
+# 폴더 → 저장 작업 목록
+# {"kind": "ox" | "questions" | "invalid", "name": 이름, "files": [경로, ...], ...}
+def discover_files(directory, subject_name=SUBJECT_NAME):
+    names = sorted(os.listdir(directory))
+    jobs = []
+    for file_name in names:
+        path = os.path.join(directory, file_name)
+        if file_name.endswith(OX_FILE_SUFFIX):
+            name = subject_from_path(file_name)
+            jobs.append({"kind": "ox", "name": name, "files": [path], "subject": name})
+        elif file_name.endswith(ANSWER_FILE_SUFFIX):
+            name = file_name[:-len(ANSWER_FILE_SUFFIX)]
+            question_file = next((f"{name}{ext}" for ext in (".json", ".jsonl") if f"{name}{ext}" in names), None)
+            if question_file is None:
+                jobs.append({"kind": "invalid", "name": name, "files": [path],
+                             "error": f"문제 파일 없음 ({name}.json / {name}.jsonl)"})
+                continue
+            jobs.append({"kind": "questions", "name": name,
+                         "files": [os.path.join(directory, question_file), path],
+                         "subject": subject_name, "problem_group": name, "tag": tags_from_name(name)})
+    return jobs
+
+
+# 문제 파일들의 과목이름 → 과목 id (과목이름마다 한 번만 조회 / 생성, 트랜잭션 하나로 커밋)
+# 저장 스레드들이 같은 과목을 동시에 만들지 않도록 저장을 시작하기 전에 호출
+def resolve_subjects(pool, jobs):
+    names = sorted({job["subject"] for job in jobs if job["kind"] == "questions"})
+    if not names:
+        return {}
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            subject_ids = {name: get_or_create_subject(cur, name) for name in names}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+    return subject_ids
+
+
+# 저장 스레드: 연결 풀에서 연결 하나를 빌려 파일 하나를 트랜잭션 하나로 저장 → (저장 행 수, 저장 시간)
+# replace : 문제 파일이면 같은 과목 / 이름의 기존 문제 묶음을 지우고 저장
+def load_job(pool, job, data, subject_ids, replace=False):
+    start = time.perf_counter()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            if job["kind"] == "ox":
+                rows = load_ox_questions(cur, job["subject"], data[0])
+            else:
+                rows = load_problem_group(cur, job["subject"], job["problem_group"], data[0], data[1], job["tag"],
+                                          subject_id=subject_ids[job["subject"]], replace=replace)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+    return rows, time.perf_counter() - start
+
+
+def job_result(job, status, rows=0, seconds=0.0, error=None):
+    metrics.inc("files_loaded" if status == "ok" else "files_failed")
+    return {
+        "name": job["name"],
+        "kind": job["kind"],
+        "files": job["files"],
+        "status": status,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "error": error,
+    }
+
+
+# 전체 과정: 과목 조회 / 생성 → 파일별 디코딩 + 저장(스레드 + 연결 풀), 작업 순서대로 결과 목록 반환
+def ingest(jobs, pool, connections=DEFAULT_CONNECTIONS, on_result=None, replace=False):
+    results = [None] * len(jobs)
+    lock = threading.Lock()
+
+    def finish(i, result):
+        with lock:
+            results[i] = result
+        if on_result:
+            on_result(result)
+
+    # 파일 디코딩과 저장을 같은 스레드에서 처리 (디코딩 결과를 프로세스 사이에 주고받지 않음)
+    def load(i, job):
+        try:
+            data = [read_records(path) for path in job["files"]]
+        except Exception as e:
+            finish(i, job_result(job, "failed", error=f"JSON 읽기 실패: {e.__class__.__name__}: {e}"))
+            return
+        try:
+            rows, seconds = load_job(pool, job, data, subject_ids, replace)
+            finish(i, job_result(job, "ok", rows, seconds))
+        except Exception as e:
+            finish(i, job_result(job, "failed", error=f"{e.__class__.__name__}: {e}"))
+
+    subject_ids = resolve_subjects(pool, jobs)
+    with ThreadPoolExecutor(max_workers=connections) as loaders:
+        for i, job in enumerate(jobs):
+            if job["kind"] == "invalid":
+                finish(i, job_result(job, "failed", error=job["error"]))
+            else:
+                loaders.submit(load, i, job)
+    return results
+
+
+def print_result(result):
+    if result["status"] == "ok":
+        print(f"  [성공] {result['name']:<30} {result['kind']:<9} {result['rows']:>7}행 "
+              f"{result['seconds']:7.2f}s ({result['rows_per_second'] or 0:,.0f} rows/s)")
+    else:
+        print(f"  [실패] {result['name']:<30} {result['kind']:<9} {result['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--subject", default=SUBJECT_NAME, help="문제 / 정답 파일을 저장할 과목이름")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, help="DB 연결 풀 최대 크기 (동시 저장 파일 수)")
+    parser.add_argument("--report", help="파일별 결과를 저장할 JSON 경로")
+    parser.add_argument("--replace", action="store_true", help="같은 과목 / 이름의 기존 문제 묶음을 지우고 다시 저장")
+    parser.add_argument("--dry-run", action="store_true", help="찾은 파일 목록만 출력")
+    args = parser.parse_args()
+
+    jobs = discover_files(args.directory, args.subject)
+    print(f"저장할 파일: {len(jobs)}개")
+    if args.dry_run:
+        for job in jobs:
+            print(f"  {job['kind']:<9} {job['name']:<30} {', '.join(os.path.basename(p) for p in job['files'])}")
+        raise SystemExit(0)
+
+    from psycopg2.pool import ThreadedConnectionPool
+
+    load_dotenv()
+    pool = ThreadedConnectionPool(1, args.connections, **db_config())
+    start = time.perf_counter()
+    try:
+        with metrics.run("db_ingest", labels={"directory": args.directory}):
+            results = ingest(jobs, pool, args.connections, on_result=print_result, replace=args.replace)
+    finally:
+        pool.closeall()
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r["status"] != "ok"]
+    rows = sum(r["rows"] for r in results)
+    print(f"\n완료: 성공 {len(results) - len(failed)}개 / 실패 {len(failed)}개, "
+          f"{rows}행, {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    for r in failed:
+        print(f"!!! 실패: {r['name']} ({r['error']})")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_seconds": round(elapsed, 4), "rows": rows, "files": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"결과 저장: {args.report}")
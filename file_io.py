@@ -0,0 +1,32 @@
+import os
+import json
+import tempfile
+
+'''
+여러 스크립트가 함께 쓰는 파일 읽기 / 쓰기 헬퍼입니다.
+(pipeline.py, metrics.py, ocr_journal.py, mathpix.py, mathpix_spacing.py, db_ingest.py, openai_batch.py)
+
+1. write_atomic : 같은 폴더의 임시 파일에 쓴 뒤 os.replace로 교체합니다.
+   쓰는 도중 종료되어도 깨진 파일이 남지 않고, 다른 프로세스가 쓰는 도중의 파일을 읽지 않습니다.
+2. read_records : parse.py 결과(JSON 배열 또는 JSON Lines)를 확장자로 구분하여 읽습니다.
+'''
+
+
+def write_atomic(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # 쓰기 / 교체에 실패하면 임시 파일을 남기지 않음
+        os.unlink(tmp_path)
+        raise
+
+
+# JSON 배열 또는 JSON Lines 파일 읽기
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
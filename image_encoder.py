@@ -0,0 +1,130 @@
+import math
+import struct
+
+import cv2
+import numpy as np
+
+from crop_trim import trim_margins
+
+'''
+문제 이미지를 OCR API에 올리기 전에 용량과 비전 토큰 수를 줄이는 인코더입니다.
+
+question_crop_by_text.py는 300dpi 무압축 PNG로 crop을 저장하고
+run_openai.py는 그 바이트를 그대로 base64로 인코딩해서 보냅니다.
+업로드 시간과 비전 토큰 비용을 줄이기 위해 업로드 직전에 다음 단계를 거칩니다.
+
+1. 흰 여백 제거 (잉크가 있는 영역만 남기고 약간의 여백 추가, crop_trim.py)
+2. 흑백 변환 (컬러가 거의 없는 이미지만 자동 변환하거나 항상 변환) / 선택적으로 밝기 단계 수 줄이기
+3. 긴 변 최대 길이로 축소 (비전 모델 타일 수 기준)
+4. 최대 압축 PNG와 무손실 WebP 중 더 작은 쪽 선택
+
+비전 토큰 추정은 OpenAI high detail 기준입니다.
+(2048x2048 안으로 축소 → 짧은 변 768 이하로 축소 → 512px 타일당 170토큰 + 기본 85토큰)
+'''
+
+# 인코딩 옵션 (캐시 키에도 포함됨)
+ENCODER_OPTIONS = {
+    "trim_threshold": 245,   # 이 값 이상 밝기는 여백으로 판단
+    "trim_padding": 12,      # 여백 제거 후 남겨둘 px
+    "grayscale": "auto",     # "auto" / True / False
+    "quantize_levels": None,  # 예: 16 → 밝기를 16단계로 줄임 (None이면 사용 안 함)
+    "max_long_edge": 2048,   # 긴 변 최대 px (1536, 1024 등으로 줄이면 타일 수가 줄어듦)
+}
+
+# 컬러 판정 기준: 채널 간 최대 차이가 이 값 이하인 픽셀 비율이 99.5% 이상이면 흑백 이미지로 봄
+GRAY_CHANNEL_TOLERANCE = 16
+GRAY_PIXEL_RATIO = 0.995
+
+
+# 비전 토큰 추정 (OpenAI high detail)
+def estimate_image_tokens(width, height):
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 170 * tiles + 85
+
+
+# PNG 파일 헤더(IHDR)에서 디코딩 없이 크기 읽기 → (width, height), PNG가 아니면 None
+def read_png_size(data):
+    if data[:8] != b'\x89PNG\r\n\x1a\n' or len(data) < 24:
+        return None
+    return struct.unpack('>II', data[16:24])
+
+
+# 축소 후 크기
+def downscaled_size(width, height, max_long_edge):
+    scale = min(1.0, max_long_edge / max(width, height)) if max_long_edge else 1.0
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# 컬러가 거의 없는 이미지인지 판단
+def is_near_gray(img):
+    if img.ndim == 2:
+        return True
+    spread = img.max(axis=2).astype(np.int16) - img.min(axis=2)
+    return np.mean(spread <= GRAY_CHANNEL_TOLERANCE) >= GRAY_PIXEL_RATIO
+
+
+# 밝기 단계 수 줄이기 (PNG 압축률 향상)
+def quantize_levels(gray, levels):
+    step = 256 / levels
+    return (np.floor(gray / step) * step + step / 2).clip(0, 255).astype(np.uint8)
+
+
+def encode_png(img):
+    ok, buf = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    return buf.tobytes() if ok else None
+
+
+# 품질 100 초과 값은 무손실 WebP
+def encode_webp_lossless(img):
+    ok, buf = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, 101])
+    return buf.tobytes() if ok else None
+
+
+# 이미지 바이트 → 업로드용 인코딩 결과
+# {'data', 'mime', 'width', 'height', 'original_bytes', 'encoded_bytes', 'tokens_before', 'tokens_after'}
+def encode_for_upload(image_bytes, options=ENCODER_OPTIONS):
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("이미지를 디코딩할 수 없습니다.")
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    tokens_before = estimate_image_tokens(img.shape[1], img.shape[0])
+
+    # 1. 흰 여백 제거
+    img = trim_margins(img, options["trim_threshold"], options["trim_padding"])
+
+    # 2. 흑백 변환 / 밝기 단계 줄이기
+    grayscale = options["grayscale"]
+    if img.ndim == 3 and (grayscale is True or (grayscale == "auto" and is_near_gray(img))):
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if options["quantize_levels"] and img.ndim == 2:
+        img = quantize_levels(img, options["quantize_levels"])
+
+    # 3. 긴 변 기준 축소
+    width, height = downscaled_size(img.shape[1], img.shape[0], options["max_long_edge"])
+    if (width, height) != (img.shape[1], img.shape[0]):
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+    # 4. PNG / 무손실 WebP 중 작은 쪽 선택
+    candidates = [(data, mime) for data, mime in (
+        (encode_png(img), 'image/png'),
+        (encode_webp_lossless(img), 'image/webp'),
+    ) if data]
+    data, mime = min(candidates, key=lambda c: len(c[0]))
+
+    return {
+        'data': data,
+        'mime': mime,
+        'width': width,
+        'height': height,
+        'original_bytes': len(image_bytes),
+        'encoded_bytes': len(data),
+        'tokens_before': tokens_before,
+        'tokens_after': estimate_image_tokens(width, height),
+    }
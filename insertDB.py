@@ -1,8 +1,11 @@
 import os
 import re
 import json
+import time
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
+from metrics import metrics
 
 '''
 이 스크립트는 LaTeX에서 추출된 문제 및 보기 데이터를 JSON 파일로부터 불러와,
@@ -10,48 +13,60 @@ PostgreSQL 데이터베이스에 과목, 문제 묶음, 문제, 보기, 정답,
 
 주요 기능은 다음과 같습니다:
 1. `.env` 환경변수로부터 DB 접속 정보를 로드하여 PostgreSQL에 연결합니다.
-2. 과목(subjects)과 문제 그룹(problem_groups)을 생성하고 해당 ID를 가져옵니다.
+2. 과목(subjects)은 같은 이름이 있으면 그 ID를 그대로 쓰고 없을 때만 생성하며, 문제 그룹(problem_groups)을 생성하고 해당 ID를 가져옵니다.
 3. 문제 JSON 파일을 순회하며 각 문제의 번호, 설명, 연도, 시험명을 추출하고 `questions` 테이블에 저장합니다.
     - 보기 항목은 text형(①~⑤) 또는 JSON table형으로 판단하여 `choices` 테이블에 각각 다르게 저장합니다.
 4. 정답 JSON 파일을 로딩한 뒤, 문제번호 기준으로 `questions` 테이블의 ID를 매핑하여 정답 및 해설을 `answers` 테이블에 저장합니다.
 5. 처리 중 오류 발생 시 트랜잭션을 롤백하고, 정상 처리 시 커밋 후 연결을 종료합니다.
+
+문제/보기/정답은 한 행씩 INSERT 하지 않고 다중 VALUES(execute_values)로 묶어서 저장합니다.
+문제 ID는 INSERT ... RETURNING으로 돌려받은 (id, 문제번호)로 바로 매핑하므로 다시 SELECT 하지 않으며,
+과목 하나를 저장하는 데 필요한 DB 왕복 횟수가 문제/보기 수와 상관없이 몇 번으로 줄어듭니다.
+폴더 안의 여러 문제/정답 파일을 한 번에 저장하려면 db_ingest.py를 사용합니다.
 '''
 
-# .env 파일 로드
-load_dotenv()
-
-# PostgreSQL 연결
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT"),
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
-)
-
-# 기본정보 설정
-subject_name = '세법'
-problem_group_name = '김문철_법인세법_법인세법총론_기본문제'
-question_file = '법인세법_기본문제_수정.json'
-answer_file = '법인세법총론_기본문제_답안_parsed.json'
-tag = ['법인세법', '법인세법총론']  # PostgreSQL 배열로 들어감
-
-try:
-    cur = conn.cursor()
+# 다중 VALUES 한 번에 묶을 최대 행 수
+PAGE_SIZE = 1000
 
-    # 과목 생성
-    cur.execute("INSERT INTO subjects(name) VALUES (%s) RETURNING id", (subject_name,))
-    subject_id = cur.fetchone()[0]
 
-    # 문제 묶음 생성
-    cur.execute("INSERT INTO problem_groups(subjects_id, name) VALUES (%s, %s) RETURNING id",
-                (subject_id, problem_group_name))
-    problem_group_id = cur.fetchone()[0]
+# problem_info("2020. 세무사")에서 시험 연도/종류 추출
+def parse_problem_info(raw_info):
+    exam_year, exam_name = None, None
+    match = re.match(r'(\d{4})\.\s*(.*)', raw_info or '')
+    if match:
+        exam_year = int(match.group(1))
+        exam_name = match.group(2).strip()
+    return exam_year, exam_name
+
+
+# 보기 문자열 → [(choice_index, choice_type, content), ...]
+# text형(①~⑤) 또는 JSON table형으로 판단
+def split_choices(choices_raw):
+    # table형인지 먼저 검사
+    table_data = None
+    try:
+        # JSON 파싱 시도
+        parsed = json.loads(choices_raw)
+        if isinstance(parsed, dict) and 'choices' in parsed:
+            table_data = parsed['choices']
+    except Exception:
+        pass
+
+    if table_data:  # table형 보기 (인덱스 없음)
+        return [(None, 'table', json.dumps(table_option, ensure_ascii=False)) for table_option in table_data]
+
+    rows = []
+    if isinstance(choices_raw, str):  # text형 보기
+        options = re.split(r'(?=\s*[①-⑤])', choices_raw.strip())
+        for idx, option in enumerate([o.strip() for o in options if o.strip()], start=1):
+            cleaned_option = re.sub(r"^\s*[①-⑤]\s*", "", option).strip()
+            rows.append((idx, 'text', cleaned_option))
+    return rows
 
-    # 문제 JSON 로딩
-    with open(question_file, 'r', encoding='utf-8') as f:
-        question_data = json.load(f)
 
+# 문제 + 보기 일괄 저장, 문제번호 → question_id 매핑과 저장한 행 수 반환
+def insert_questions(cur, problem_group_id, question_data, tag):
+    question_rows = []
     for item in question_data:
         # description
         description = item.get('description')
@@ -61,25 +76,8 @@ try:
             formatted_description = description
 
         # 시험 연도/종류는 problem_info에서 추출
-        raw_info = item.get('problem_info', '')
-        exam_year, exam_name = None, None
-        match = re.match(r'(\d{4})\.\s*(.*)', raw_info)
-        if match:
-            exam_year = int(match.group(1))
-            exam_name = match.group(2).strip()
-
-        # INSERT questions
-        cur.execute("""
-            INSERT INTO questions (
-                problem_group_id,
-                number,
-                exam_year,
-                exam_name,
-                description,
-                tag
-            ) VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (
+        exam_year, exam_name = parse_problem_info(item.get('problem_info', ''))
+        question_rows.append((
             problem_group_id,
             item.get('problem_num'),
             exam_year,
@@ -87,63 +85,53 @@ try:
             formatted_description,
             tag  # PostgreSQL array
         ))
-        question_id = cur.fetchone()[0]
-
-        # INSERT 보기 (text형 or table형 판단)
-        choices_raw = item.get('choice')
-
-        # table형인지 먼저 검사
-        table_data = None
-        try:
-            # JSON 파싱 시도
-            parsed = json.loads(choices_raw)
-            if isinstance(parsed, dict) and 'choices' in parsed:
-                table_data = parsed['choices']
-        except Exception:
-            pass
-
-        if table_data:  # table형 보기
-            for table_option in table_data:
-                cur.execute("""
-                           INSERT INTO choices (
-                               question_id,
-                               choice_index,
-                               choice_type,
-                               content
-                           ) VALUES (%s, %s, %s, %s)
-                       """, (
-                    question_id,
-                    None,  # table형은 인덱스 없음
-                    'table',
-                    json.dumps(table_option, ensure_ascii=False)
-                ))
-        else:  # text형 보기
-            if isinstance(choices_raw, str):
-                options = re.split(r'(?=\s*[①-⑤])', choices_raw.strip())
-                for idx, option in enumerate([o.strip() for o in options if o.strip()], start=1):
-                    cleaned_option = re.sub(r"^\s*[①-⑤]\s*", "", option).strip()
-                    cur.execute("""
-                               INSERT INTO choices (
-                                   question_id,
-                                   choice_index,
-                                   choice_type,
-                                   content
-                               ) VALUES (%s, %s, %s, %s)
-                           """, (
-                        question_id,
-                        idx,
-                        'text',
-                        cleaned_option
-                    ))
+
+    if not question_rows:
+        return {}, 0
+
+    # INSERT questions (RETURNING 행의 순서는 보장되지 않으므로 돌려받은 문제번호로 question_id를 찾음)
+    returned = execute_values(cur, """
+        INSERT INTO questions (
+            problem_group_id,
+            number,
+            exam_year,
+            exam_name,
+            description,
+            tag
+        ) VALUES %s
+        RETURNING id, number
+    """, question_rows, page_size=PAGE_SIZE, fetch=True)
+    # 문제번호 → 그 번호로 저장된 question_id 목록 (한 파일에 같은 번호가 여러 번 나오면 하나씩 나누어 배정)
+    ids_by_number = {}
+    for question_id, number in returned:
+        ids_by_number.setdefault(str(number), []).append(question_id)
+    for ids in ids_by_number.values():
+        ids.reverse()
+
+    # INSERT 보기 (문제번호로 찾은 question_id에 연결)
+    choice_rows = []
+    for item in question_data:
+        question_id = ids_by_number[str(item.get('problem_num'))].pop()
+        choice_rows.extend((question_id, choice_index, choice_type, content)
+                           for choice_index, choice_type, content in split_choices(item.get('choice')))
+    if choice_rows:
+        execute_values(cur, """
+            INSERT INTO choices (
+                question_id,
+                choice_index,
+                choice_type,
+                content
+            ) VALUES %s
+        """, choice_rows, page_size=PAGE_SIZE)
 
     # 문제번호 → question_id 매핑
-    cur.execute("SELECT id, number FROM questions WHERE problem_group_id = %s", (problem_group_id,))
-    question_map = {row[1]: row[0] for row in cur.fetchall()}
+    question_map = {number: question_id for question_id, number in returned}
+    return question_map, len(question_rows) + len(choice_rows)
 
-    # 정답 로딩
-    with open(answer_file, 'r', encoding='utf-8') as f:
-        answer_data = json.load(f)
 
+# 정답 + 해설 일괄 저장, 저장한 행 수 반환
+def insert_answers(cur, question_map, answer_data):
+    answer_rows = []
     for item in answer_data:
         q_num = str(item.get('번호')).strip()
         correct_answer = item.get('정답')
@@ -154,25 +142,120 @@ try:
 
         question_id = question_map.get(q_num)
         if question_id and correct_answer:
-            cur.execute("""
-                INSERT INTO answers (
-                    question_id,
-                    correct_answer,
-                    explanation
-                ) VALUES (%s, %s, %s)
-            """, (
+            answer_rows.append((
                 question_id,
                 correct_answer.strip(),
                 explanation
             ))
 
-    conn.commit()
-    print("데이터베이스 저장 성공!")
+    if answer_rows:
+        execute_values(cur, """
+            INSERT INTO answers (
+                question_id,
+                correct_answer,
+                explanation
+            ) VALUES %s
+        """, answer_rows, page_size=PAGE_SIZE)
+    return len(answer_rows)
+
+
+# 과목이름 → 과목 id (같은 이름의 과목이 있으면 그 id, 없으면 새로 생성)
+# 파일마다 과목을 새로 INSERT하면 같은 과목이 파일 수만큼 생기므로 이름으로 먼저 조회
+def get_or_create_subject(cur, subject_name):
+    cur.execute("SELECT id FROM subjects WHERE name = %s ORDER BY id LIMIT 1", (subject_name,))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    cur.execute("INSERT INTO subjects(name) VALUES (%s) RETURNING id", (subject_name,))
+    metrics.inc("rows_inserted")
+    return cur.fetchone()[0]
+
+
+# 과목의 같은 이름 문제 묶음과 그 문제/보기/정답을 모두 삭제, 삭제한 행 수 반환
+# 외래키 ON DELETE CASCADE 여부와 상관없이 동작하도록 참조하는 테이블부터 지움
+def delete_problem_groups(cur, subject_id, problem_group_name):
+    cur.execute("SELECT id FROM problem_groups WHERE subjects_id = %s AND name = %s",
+                (subject_id, problem_group_name))
+    group_ids = [row[0] for row in cur.fetchall()]
+    if not group_ids:
+        return 0
+
+    deleted = 0
+    question_ids = "SELECT id FROM questions WHERE problem_group_id = ANY(%s)"
+    for sql in (f"DELETE FROM answers WHERE question_id IN ({question_ids})",
+                f"DELETE FROM choices WHERE question_id IN ({question_ids})",
+                "DELETE FROM questions WHERE problem_group_id = ANY(%s)",
+                "DELETE FROM problem_groups WHERE id = ANY(%s)"):
+        cur.execute(sql, (group_ids,))
+        deleted += cur.rowcount
+    metrics.inc("rows_deleted", deleted)
+    return deleted
+
+
+# 과목 → 문제 묶음 → 문제/보기 → 정답 순서로 저장 (커밋/롤백은 호출하는 쪽에서 처리)
+# subject_id : 이미 조회한 과목 id (없으면 subject_name으로 조회 / 생성)
+# replace : 같은 과목 / 이름의 기존 문제 묶음을 같은 트랜잭션에서 지우고 저장 (다시 실행해도 중복 저장되지 않음)
+# 저장한 전체 행 수 반환 (과목 행 제외)
+@metrics.timed("insert")
+def load_problem_group(cur, subject_name, problem_group_name, question_data, answer_data, tag,
+                       subject_id=None, replace=False):
+    if subject_id is None:
+        subject_id = get_or_create_subject(cur, subject_name)
+    if replace:
+        delete_problem_groups(cur, subject_id, problem_group_name)
+
+    # 문제 묶음 생성
+    cur.execute("INSERT INTO problem_groups(subjects_id, name) VALUES (%s, %s) RETURNING id",
+                (subject_id, problem_group_name))
+    problem_group_id = cur.fetchone()[0]
+
+    question_map, question_rows = insert_questions(cur, problem_group_id, question_data, tag)
+    answer_rows = insert_answers(cur, question_map, answer_data)
+    metrics.inc("rows_inserted", 1 + question_rows + answer_rows)
+    return 1 + question_rows + answer_rows
+
+
+if __name__ == "__main__":
+    # .env 파일 로드
+    load_dotenv()
+
+    # PostgreSQL 연결
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+
+    # 기본정보 설정
+    subject_name = '세법'
+    problem_group_name = '김문철_법인세법_법인세법총론_기본문제'
+    question_file = '법인세법_기본문제_수정.json'
+    answer_file = '법인세법총론_기본문제_답안_parsed.json'
+    tag = ['법인세법', '법인세법총론']  # PostgreSQL 배열로 들어감
+
+    cur = conn.cursor()
+    try:
+        # 문제 / 정답 JSON 로딩
+        with open(question_file, 'r', encoding='utf-8') as f:
+            question_data = json.load(f)
+        with open(answer_file, 'r', encoding='utf-8') as f:
+            answer_data = json.load(f)
+
+        start = time.perf_counter()
+        with metrics.run("insertDB", labels={"subject": subject_name, "problem_group": problem_group_name}):
+            rows = load_problem_group(cur, subject_name, problem_group_name, question_data, answer_data, tag)
+            conn.commit()
+        elapsed = time.perf_counter() - start
+
+        print("데이터베이스 저장 성공!")
+        print(f"저장 행 수: {rows}개, {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)")
 
-except Exception as e:
-    conn.rollback()
-    print(f"!!! 에러 발생: {e}")
+    except Exception as e:
+        conn.rollback()
+        print(f"!!! 에러 발생: {e}")
 
-finally:
-    cur.close()
-    conn.close()
+    finally:
+        cur.close()
+        conn.close()
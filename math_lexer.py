@@ -0,0 +1,107 @@
+import re
+
+'''
+텍스트를 수식 영역 / 일반 텍스트 영역으로 나누는 렉서입니다.
+parse.py(수식 밖 백슬래시 제거)와 mathpix_spacing.py(수식 밖 한글 띄어쓰기 교정)에서 함께 사용합니다.
+
+인식하는 수식 영역 >
+  $$...$$, $...$, \[...\], \begin{array}...\end{array}, \begin{aligned}...\end{aligned}
+
+1. 문자열을 처음부터 끝까지 한 번만 훑으면서 (시작, 끝, 수식 여부) 구간을 반환합니다.
+2. $$...$$ 안에 $...$가 들어있는 경우(예: `$$다음은 제25기(2025.1.1. $\sim$ 12.31.) 자료이다.$$`)도
+   바깥 $$ 전체를 하나의 수식 영역으로 인식합니다.
+3. \$ 처럼 이스케이프된 기호는 구분자로 보지 않고, 같은 환경이 중첩된 array도 짝을 맞춰 닫습니다.
+4. 닫히지 않은 구분자는 일반 텍스트로 취급하고, 같은 종류의 뒤쪽 구분자는 닫는 구분자를 다시 찾지 않습니다.
+5. 구간 오프셋만 반환하므로, 호출하는 쪽에서 일반 텍스트 구간만 변환하고 마지막에 한 번만 이어 붙이면 됩니다.
+'''
+
+MATH_ENVIRONMENTS = ('array', 'aligned')
+
+# 수식이 시작될 수 없는 일반 텍스트 구간 (이스케이프(\$, \\ 등)는 두 글자씩 건너뜀)
+# 반복을 정규식 엔진 안에서 처리하여 글자 단위 파이썬 루프를 피함
+TEXT_RUN_PATTERN = re.compile(
+    r'[^\\$]*(?:\\(?!\[|begin\{(?:' + '|'.join(MATH_ENVIRONMENTS) + r')\})[\s\S][^\\$]*)*'
+)
+BEGIN_PATTERN = re.compile(r'\\begin\{(' + '|'.join(MATH_ENVIRONMENTS) + r')\}')
+# 닫는 구분자까지의 수식 내용 (이스케이프된 기호는 닫는 구분자로 보지 않음)
+CLOSE_PATTERNS = {
+    '$': re.compile(r'[^\\$]*(?:\\[\s\S][^\\$]*)*\$'),
+    '$$': re.compile(r'[^\\$]*(?:(?:\\[\s\S]|\$(?!\$))[^\\$]*)*\$\$'),
+    '\\[': re.compile(r'[^\\]*(?:\\[^\]][^\\]*)*\\\]'),
+}
+
+
+# start부터 \begin{name} ... \end{name} 짝이 맞는 \end{name}의 끝 위치 (없으면 -1)
+# unclosed[name] : 이 위치 이후에는 \end{name}이 없음 (찾기에 실패한 위치를 기록하여 이후 검색을 바로 끝냄)
+def find_environment_end(text, name, start, unclosed=None):
+    unclosed = {} if unclosed is None else unclosed
+    begin, end = f'\\begin{{{name}}}', f'\\end{{{name}}}'
+    depth = 1
+    i = start
+    while depth:
+        next_end = text.find(end, i) if i < unclosed.get(name, len(text) + 1) else -1
+        if next_end < 0:
+            unclosed[name] = min(i, unclosed.get(name, i))
+            return -1
+        next_begin = text.find(begin, i, next_end)
+        if next_begin >= 0:
+            depth += 1
+            i = next_begin + len(begin)
+        else:
+            depth -= 1
+            i = next_end + len(end)
+    return i
+
+
+# pos 위치에서 시작하는 수식 영역의 끝 위치 (수식 시작이 아니면 None)
+# unclosed : 구분자 종류별로 닫는 구분자를 찾지 못한 검색 시작 위치
+#   그 위치 이후에는 닫는 구분자가 없으므로, 같은 종류의 뒤쪽 여는 구분자는 다시 끝까지 훑지 않고 바로 일반 텍스트로 처리
+#   (닫히지 않은 \[ 가 많은 OCR 결과에서 여는 구분자마다 끝까지 다시 훑어 전체가 O(n²)이 되는 것을 막음)
+def match_math(text, pos, unclosed=None):
+    unclosed = {} if unclosed is None else unclosed
+    for opener in ('$$', '$', '\\['):
+        if text.startswith(opener, pos):
+            start = pos + len(opener)
+            if start >= unclosed.get(opener, len(text) + 1):
+                return None
+            close = CLOSE_PATTERNS[opener].match(text, start)
+            if close is None:
+                unclosed[opener] = start
+                return None
+            return close.end()
+    begin = BEGIN_PATTERN.match(text, pos)
+    if begin:
+        end = find_environment_end(text, begin.group(1), begin.end(), unclosed)
+        return end if end >= 0 else None
+    return None
+
+
+# (start, end, is_math) 구간을 순서대로 반환, 모든 구간을 이으면 원문 전체가 됨
+def iter_math_spans(text):
+    text_start = 0
+    pos = 0
+    n = len(text)
+    unclosed = {}
+    while True:
+        pos = TEXT_RUN_PATTERN.match(text, pos).end()
+        if pos >= n:
+            break
+        end = match_math(text, pos, unclosed)
+        if end is None:
+            # 닫히지 않은 구분자는 일반 텍스트로 취급하고 다음 글자부터 계속
+            pos += 2 if text[pos] == '\\' else 1
+            continue
+        if text_start < pos:
+            yield text_start, pos, False
+        yield pos, end, True
+        text_start = pos = end
+    if text_start < n:
+        yield text_start, n, False
+
+
+# 일반 텍스트 구간에만 fn을 적용하고 수식 구간은 그대로 유지
+def transform_outside_math(text, fn):
+    return ''.join(
+        text[start:end] if is_math else fn(text[start:end])
+        for start, end, is_math in iter_math_spans(text)
+    )
@@ -1,36 +1,178 @@
 import os
+import time
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from ocr_cache import OCRCache
+from file_io import write_atomic
+from ocr_dispatcher import call_with_retry, dispatch, is_retryable
+from metrics import metrics
 
 '''
 Mathpix는 이미지나 PDF에서 수식, 텍스트, 표 등을 추출해주는 OCR API 입니다.
-이 코드는 Mathpix API를 이용하여 
+이 코드는 Mathpix API를 이용하여
 텍스트와 수식이 섞인 이미지로부터
 일반 텍스트와 LaTeX 형식으로 변환해주는 기능을 수행합니다.
 블로그에 관련 내용 정리해두었습니다.
 링크 : https://choddu.tistory.com/29
+
+MathpixClient >
+1. requests.Session의 커넥션 풀(keep-alive)을 재사용하여 요청마다 새로 연결하지 않습니다.
+2. 이미지 폴더 전체를 동시 요청 개수를 제한하여 병렬로 처리하고, 결과는 각 이미지 옆에 `<이름>.json`으로 저장합니다.
+3. 429 / 5xx / 네트워크 오류는 지수 백오프로 재시도합니다.
+4. PDF 비동기 처리(제출 → 상태 확인 → 결과 받기)를 지원하여 시험지 PDF 전체를 한 번에 보낼 수 있습니다.
+5. MATHPIX_API_URL 환경변수로 로컬 스텁 서버(stub_server.py)를 지정할 수 있습니다.
 '''
 load_dotenv()
 
-r = requests.post("https://api.mathpix.com/v3/text",
-    files={"file": open("2025_재정학/26.png", "rb")},
-                  data={
-                      "options_json": json.dumps({
-                          "math_inline_delimiters": ["$", "$"],
-                          "rm_spaces": True,
-                          "include_line_data": True,
-                          "formats": ["latex_styled", "text"]
-                      })
-                  },
-    headers={
-        "app_id": os.getenv("MATHPIX_APP_ID"),
-        "app_key": os.getenv("MATHPIX_APP_KEY"),
-    }
-)
-# Mathpix 응답 JSON 저장
-output_path = "result.json"
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(r.json(), f, ensure_ascii=False, indent=4)
-
-print(f" Mathpix 결과 저장 완료: {output_path}")
+MATHPIX_API_URL = os.getenv("MATHPIX_API_URL", "https://api.mathpix.com")
+
+# Mathpix 요청 옵션
+OPTIONS = {
+    "math_inline_delimiters": ["$", "$"],
+    "rm_spaces": True,
+    "include_line_data": True,
+    "formats": ["latex_styled", "text"]
+}
+
+# PDF 요청 옵션
+PDF_OPTIONS = {
+    "math_inline_delimiters": ["$", "$"],
+    "rm_spaces": True,
+}
+
+# 동시 요청 수 / 재시도 / PDF 상태 확인 간격(초)
+CONCURRENCY = 4
+MAX_RETRIES = 5
+POLL_INTERVAL = 3
+REQUEST_TIMEOUT = 60
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+# 네트워크 오류(requests 예외)도 재시도 대상에 포함
+def is_retryable_mathpix(exc):
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout)) or is_retryable(exc)
+
+
+class MathpixClient:
+    def __init__(self, app_id, app_key, base_url=MATHPIX_API_URL, pool_size=CONCURRENCY,
+                 cache=None, max_retries=MAX_RETRIES):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "app_id": app_id or "",
+            "app_key": app_key or "",
+        })
+
+    # 재시도 포함 요청 (오류 상태코드는 예외로 변환하여 재시도 여부 판단)
+    def _request(self, method, path, **kwargs):
+        def send():
+            metrics.inc("requests")
+            with metrics.timer("request"):
+                r = self.session.request(method, f"{self.base_url}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+            r.raise_for_status()
+            return r
+        return call_with_retry(send, max_retries=self.max_retries, retryable=is_retryable_mathpix,
+                               on_retry=lambda n, e, d: metrics.inc("retries"))
+
+    # 이미지 1장 OCR (/v3/text)
+    def ocr_image(self, image_path, options=OPTIONS):
+        options_json = json.dumps(options)
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+
+        # 같은 이미지 + 같은 options_json 이면 캐시된 응답 사용
+        key = OCRCache.make_key(image_bytes, api="mathpix/v3/text", options_json=options_json)
+        if self.cache:
+            cached = self.cache.get(key)
+            metrics.inc("cache_hits" if cached is not None else "cache_misses")
+            if cached is not None:
+                return cached
+
+        metrics.inc("bytes_uploaded", len(image_bytes))
+        r = self._request("POST", "/v3/text",
+                          files={"file": (os.path.basename(image_path), image_bytes)},
+                          data={"options_json": options_json})
+        result = r.json()
+        # 오류 응답은 캐시하지 않음
+        if self.cache and 'error' not in result:
+            self.cache.put(key, result)
+        return result
+
+    # 폴더 안의 이미지 전체를 병렬 OCR, 결과는 각 이미지 옆에 <이름>.json 으로 저장
+    # (파일명, 결과 경로, 오류)를 파일명 순서대로 반환
+    def ocr_directory(self, input_folder, concurrency=CONCURRENCY, options=OPTIONS):
+        files = sorted(f for f in os.listdir(input_folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+        # 재시도는 _request 안에서 처리하므로 dispatch에서는 재시도하지 않음
+        def work(f):
+            result = self.ocr_image(os.path.join(input_folder, f), options)
+            output_path = os.path.join(input_folder, os.path.splitext(f)[0] + ".json")
+            # 중간에 종료되어도 잘린 .json이 남지 않도록 임시 파일에 쓴 뒤 교체
+            write_atomic(output_path, json.dumps(result, ensure_ascii=False, indent=4))
+            return output_path
+
+        return list(dispatch(files, work, concurrency=concurrency, max_retries=0))
+
+    # PDF 제출 (/v3/pdf) → pdf_id
+    def submit_pdf(self, pdf_path, options=PDF_OPTIONS):
+        with open(pdf_path, "rb") as f:
+            r = self._request("POST", "/v3/pdf",
+                              files={"file": (os.path.basename(pdf_path), f.read())},
+                              data={"options_json": json.dumps(options)})
+        return r.json()["pdf_id"]
+
+    # PDF 처리 완료까지 상태 확인 → 마지막 상태 응답
+    def wait_pdf(self, pdf_id, poll_interval=POLL_INTERVAL, timeout=3600):
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self._request("GET", f"/v3/pdf/{pdf_id}").json()
+            if status.get("status") == "completed":
+                return status
+            if status.get("status") == "error" or "error" in status:
+                raise RuntimeError(f"Mathpix PDF 처리 실패: {status}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Mathpix PDF 처리 시간 초과: {pdf_id}")
+            time.sleep(poll_interval)
+
+    # 처리 완료된 PDF 결과 받기 (fmt: "mmd", "lines.json", "tex.zip" 등)
+    def fetch_pdf(self, pdf_id, fmt="lines.json"):
+        return self._request("GET", f"/v3/pdf/{pdf_id}.{fmt}").content
+
+    # PDF 전체 OCR: 제출 → 상태 확인 → 결과 저장
+    def ocr_pdf(self, pdf_path, output_path, fmt="lines.json", options=PDF_OPTIONS, poll_interval=POLL_INTERVAL):
+        pdf_id = self.submit_pdf(pdf_path, options)
+        print(f" Mathpix PDF 제출 완료: {pdf_id}")
+        self.wait_pdf(pdf_id, poll_interval)
+        with open(output_path, "wb") as f:
+            f.write(self.fetch_pdf(pdf_id, fmt))
+        return output_path
+
+
+if __name__ == "__main__":
+    # 처리 방식: "images" (crop된 문제 이미지 폴더) / "pdf" (시험지 PDF 전체를 한 번에)
+    MODE = "images"
+
+    client = MathpixClient(os.getenv("MATHPIX_APP_ID"), os.getenv("MATHPIX_APP_KEY"), cache=OCRCache())
+
+    with metrics.run("mathpix", labels={"mode": MODE}):
+        if MODE == "pdf":
+            pdf_path = "2025_재정학.pdf"
+            output_path = client.ocr_pdf(pdf_path, pdf_path.replace(".pdf", ".lines.json"))
+            print(f" Mathpix 결과 저장 완료: {output_path}")
+        else:
+            input_folder = "2025_재정학"
+            for f, output_path, error in client.ocr_directory(input_folder):
+                if error:
+                    print(f"!!! 에러 발생: {f} ({error})")
+                else:
+                    print(f" Mathpix 결과 저장 완료: {output_path}")
+
+    print(f" 캐시 통계: {client.cache.stats()}")
@@ -1,43 +1,233 @@
+import os
 import re
 import json
-from pykospacing import Spacing
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math_lexer import iter_math_spans
+from spacing_engine import SpacingEngine
+from multi_replace import MultiReplacer
+from file_io import write_atomic
+from metrics import metrics
 
 '''
 이 코드는 OCR 결과(mathpix API 이용)에서 줄바꿈으로 인해 잘못 붙은 단어들을 PyKoSpacing으로 교정하는 로직입니다.
 각 줄의 마지막 단어와 다음 줄의 첫 단어를 붙여 띄어쓰기 보정을 수행하고, 교정 결과를 원문에 반영합니다.
 줄 단위 후처리를 통해 한국어 문장을 더 자연스럽게 정제할 수 있습니다.
+교정할 후보는 페이지(또는 여러 파일) 단위로 모두 모은 뒤 SpacingEngine으로 한 번에 묶어서 추론하며,
+같은 단어 조합은 한 번만 추론합니다.
+교정 결과는 MultiReplacer로 원문을 한 번만 훑으면서 반영하고, 수식 구간은 건드리지 않습니다.
 링크 : https://choddu.tistory.com/26
 위 링크에 자세한 내용 정리해두었습니다. 
 
+폴더를 주면 폴더 안의 Mathpix 결과(*.json)를 모두 교정하여 파일마다 <이름>_fullText.txt를 저장합니다.
+- 워커 프로세스마다 시작할 때 SpacingEngine(TensorFlow 모델)을 한 번만 만들고, 워커가 끝날 때까지 여러 파일에 재사용합니다.
+  (부모 프로세스는 모델을 만들지 않으며, 교정 결과 캐시도 워커 안에서 파일끼리 공유됩니다.)
+- 워커마다 TensorFlow 내부 스레드를 1개로 제한하여, 처리량이 워커(코어) 수에 비례하도록 합니다.
+- Mathpix 결과는 JSON 전체를 읽지 않고 청크 단위로 훑으면서 최상위 line_data 배열의 원소만 하나씩 만듭니다.
+  (전체 text / html 등 나머지 값은 객체로 만들지 않고 건너뛰며, line_data 배열이 끝나면 나머지 파일은 읽지 않음)
+
+실행 예시 >
+  python mathpix_spacing.py mathpix_result.json                    # 파일 하나 → fullText.txt
+  python mathpix_spacing.py mathpix_results/ --workers 4           # 폴더 → mathpix_results/<이름>_fullText.txt
+  python mathpix_spacing.py mathpix_results/ --output-dir spaced/
 '''
 
-spacing = Spacing()
+# 한글 문장 패턴
+KOREAN_PATTERN = re.compile(r'[가-힣\s\,\.]+')
+
+# 폴더 모드 결과 파일 이름 : <이름>_fullText.txt
+OUTPUT_SUFFIX = "_fullText.txt"
+# 폴더 모드 워커 프로세스 수
+WORKERS = os.cpu_count() or 1
+
+# Mathpix 결과 JSON을 읽는 단위 (문자 수)
+STREAM_CHUNK_SIZE = 1 << 16
+# JSON 문자열 / 문자열 내용(닫는 따옴표 전까지) / 건너뛸 때 구조 문자가 아닌 구간 / 숫자·true·false·null / 공백
+JSON_STRING_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+JSON_STRING_BODY_PATTERN = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+JSON_SKIP_PATTERN = re.compile(r'[^"\[\]{}]+')
+JSON_SCALAR_PATTERN = re.compile(r'[^,\]}\s]+')
+JSON_WHITESPACE_PATTERN = re.compile(r'\s*')
+
+
+# 수식($...$ 등) 밖에 있는 한글 문장 구간 (start, end) 목록
+def korean_runs(text):
+    runs = []
+    for start, end, is_math in iter_math_spans(text):
+        if not is_math:
+            runs.extend(match.span() for match in KOREAN_PATTERN.finditer(text, start, end))
+    return runs
+
+
+# 수식 구간은 그대로 두고 나머지 구간의 한글 문장에만 spacing 적용
+def apply_spacing_exclude_math(text, engine):
+    runs = korean_runs(text)
+    spaced_runs = engine.space_many([text[start:end] for start, end in runs])
+
+    parts = []
+    prev = 0
+    for (start, end), spaced in zip(runs, spaced_runs):
+        parts.append(text[prev:start])
+        parts.append(spaced)
+        prev = end
+    parts.append(text[prev:])
+    return ''.join(parts)
+
+
+# JSON을 청크 단위로 읽으면서 값을 하나씩 꺼내거나 건너뛰는 읽기 도구
+# 버퍼에는 아직 처리하지 않은 부분과 새로 읽은 청크만 유지
+class JsonStreamReader:
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    # 청크 하나를 더 읽어 버퍼 뒤에 붙임 (처리한 앞부분은 버림), 파일 끝이면 False
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
 
-def apply_spacing_exclude_math(text):
-    # 수식 부분 임시 치환
-    math_patterns = re.findall(r'\$.*?\$', text)
-    for i, formula in enumerate(math_patterns):
-        text = text.replace(formula, f"<<MATH_{i}>>")
+    def error(self, message):
+        return ValueError(f"JSON 형식 오류: {message}")
 
-    # 한글 문장에만 spacing 적용
-    def spacing_korean(match):
-        return spacing(match.group())
+    # 공백을 건너뛰고 다음 글자 반환 (파일 끝이면 '')
+    def peek(self):
+        while True:
+            self.pos = JSON_WHITESPACE_PATTERN.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
 
-    spaced = re.sub(r'[가-힣\s\,\.]+', spacing_korean, text)
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error(f"'{char}'가 있어야 합니다.")
+        self.pos += 1
 
-    # 수식 복원
-    for i, formula in enumerate(math_patterns):
-        spaced = spaced.replace(f"<<MATH_{i}>>", formula)
+    # pattern이 버퍼 끝에 걸리지 않고 끝나는 위치까지 읽어서 match 반환
+    # (complete_at_end : 버퍼 끝에서 끝나도 완성된 값인지, 예: 닫는 따옴표로 끝나는 문자열)
+    def match(self, pattern, complete_at_end):
+        while True:
+            match = pattern.match(self.buffer, self.pos)
+            if match and (complete_at_end or match.end() < len(self.buffer)):
+                return match
+            if not self.fill():
+                if match:
+                    return match
+                raise self.error("값이 끝나지 않았습니다.")
 
-    return spaced
+    def read_string(self):
+        if self.peek() != '"':
+            raise self.error("문자열이 있어야 합니다.")
+        match = self.match(JSON_STRING_PATTERN, complete_at_end=True)
+        self.pos = match.end()
+        return json.loads(match.group())
 
+    # 값 하나를 파이썬 객체로 읽음 (배열 원소처럼 작은 값에 사용)
+    # 숫자·true 등은 청크 경계에서 잘린 앞부분(예: "-25")도 값으로 읽히므로 토큰 끝까지 읽은 뒤 변환
+    def read_value(self):
+        if self.peek() not in '"[{':
+            match = self.match(JSON_SCALAR_PATTERN, complete_at_end=False)
+            self.pos = match.end()
+            return json.loads(match.group())
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    # 문자열 하나를 건너뜀 (전체 text처럼 긴 문자열도 청크마다 이어서 훑고 읽은 부분은 버림)
+    def skip_string(self):
+        self.pos += 1
+        while True:
+            self.pos = JSON_STRING_BODY_PATTERN.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) and self.buffer[self.pos] == '"':
+                self.pos += 1
+                return
+            # 버퍼 끝 (이스케이프 문자 \ 하나만 남은 경우 포함) → 다음 청크에서 계속
+            if not self.fill():
+                raise self.error("문자열이 끝나지 않았습니다.")
+
+    # 값 하나를 객체로 만들지 않고 건너뜀
+    def skip_value(self):
+        char = self.peek()
+        if not char:
+            raise self.error("값이 있어야 합니다.")
+        if char == '"':
+            self.skip_string()
+        elif char in '[{':
+            depth = 0
+            while True:
+                char = self.peek()
+                if not char:
+                    raise self.error("배열 / 객체가 끝나지 않았습니다.")
+                if char == '"':
+                    self.skip_string()
+                elif char in '[{':
+                    depth += 1
+                    self.pos += 1
+                elif char in ']}':
+                    depth -= 1
+                    self.pos += 1
+                    if depth == 0:
+                        return
+                else:
+                    self.pos = JSON_SKIP_PATTERN.match(self.buffer, self.pos).end()
+        else:
+            self.pos = self.match(JSON_SCALAR_PATTERN, complete_at_end=False).end()
+
+
+# 최상위 객체의 line_data 배열 원소를 하나씩 반환 (다른 키의 값은 건너뜀, line_data 배열이 끝나면 더 읽지 않음)
+def iter_line_data(f, chunk_size=STREAM_CHUNK_SIZE):
+    reader = JsonStreamReader(f, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.read_string()
+        reader.expect(':')
+        if key == 'line_data' and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() != ']':
+                while True:
+                    yield reader.read_value()
+                    if reader.peek() != ',':
+                        break
+                    reader.pos += 1
+            reader.expect(']')
+            return
+        reader.skip_value()
+        if reader.peek() != ',':
+            reader.expect('}')
+            return
+        reader.pos += 1
+
+
+# Mathpix 결과에서 line_data[*].text 값만 읽기
+# 파일을 청크 단위로 훑으며 line_data 원소만 하나씩 만드므로, 큰 결과 파일도 파일 전체를 메모리에 올리지 않음
 def extract_text_list(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return [line['text'] for line in data.get('line_data', []) if 'text' in line]
+        return [line['text'] for line in iter_line_data(f) if isinstance(line, dict) and 'text' in line]
 
-def get_spacing_corrections(lines):
-    corrections = []
+# 줄 경계 후보 목록: 각 줄의 마지막 단어 + 다음 줄의 첫 단어
+def boundary_candidates(lines):
+    candidates = []
 
     for i in range(len(lines) - 1):
         curr_line = lines[i].strip()
@@ -53,16 +243,42 @@ def get_spacing_corrections(lines):
         first_token = next_tokens[0] if next_tokens else None
 
         if last_token and first_token:
-            joined = last_token + first_token
-            spaced_result = apply_spacing_exclude_math(joined)
+            candidates.append(last_token + first_token)
+
+    return candidates
+
+
+# 여러 페이지의 줄 목록을 받아 페이지별 교정 목록 반환
+# 모든 페이지의 후보 한글 구간을 먼저 모아 한 번에 추론하고, 이후에는 캐시된 결과로 교정 목록을 만듦
+def get_spacing_corrections_batch(pages, engine):
+    page_candidates = [boundary_candidates(lines) for lines in pages]
+    unique = dict.fromkeys(joined for candidates in page_candidates for joined in candidates)
+    engine.space_many([joined[start:end] for joined in unique for start, end in korean_runs(joined)])
+
+    results = []
+    for candidates in page_candidates:
+        corrections = []
+        for joined in candidates:
+            spaced_result = apply_spacing_exclude_math(joined, engine)
 
             if spaced_result != joined:
                 corrections.append({
                     "joined": joined,
                     "spaced": spaced_result
                 })
+        results.append(corrections)
+    return results
+
 
-    return corrections  #  빠진 부분
+def get_spacing_corrections(lines, engine):
+    return get_spacing_corrections_batch([lines], engine)[0]
+
+# 교정 목록을 텍스트에 반영 → (교정된 텍스트, 교정별 치환 횟수)
+# 모든 교정을 한 번의 스캔으로 적용하며(leftmost-longest), 수식 구간 안은 바꾸지 않음
+def apply_corrections(full_text, corrections):
+    replacer = MultiReplacer({c["joined"]: c["spaced"] for c in corrections})
+    math_spans = [(start, end) for start, end, is_math in iter_math_spans(full_text) if is_math]
+    return replacer.replace(full_text, math_spans)
 
 def smart_lstrip_preserve_newlines(texts):
     cleaned = []
@@ -73,28 +289,142 @@ def smart_lstrip_preserve_newlines(texts):
         cleaned.append(cleaned_text)
     return ''.join(cleaned)
 
-# 실행 
-texts = extract_text_list('mathpix_result.json')
-print('texts',texts)
-full_text = smart_lstrip_preserve_newlines(texts)
-print(full_text)
 
-corrections = get_spacing_corrections(texts)
-print('corrections', corrections)
+# 줄 목록 → (교정된 전체 텍스트, 교정 목록, 교정별 치환 횟수)
+def correct_text(texts, engine):
+    full_text = smart_lstrip_preserve_newlines(texts)
+    corrections = get_spacing_corrections(texts, engine)
+    full_text, counts = apply_corrections(full_text, corrections)
+    return full_text, corrections, counts
+
+
+# 폴더 안의 Mathpix 결과 파일 목록
+def list_result_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(".json") and os.path.isfile(os.path.join(directory, name)))
+
+
+def output_path_for(input_path, output_dir):
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, name + OUTPUT_SUFFIX)
+
+
+# 워커 프로세스마다 하나씩 만드는 SpacingEngine (init_worker에서 생성)
+_engine = None
+
+
+# 워커 프로세스 초기화: 모델을 한 번만 만들어 워커가 끝날 때까지 재사용
+# 프로세스 여러 개가 동시에 모델을 돌리므로 TensorFlow 내부 멀티스레드는 끔 (코어 과점유 방지)
+def init_worker():
+    global _engine
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", "1")
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    _engine = SpacingEngine()
+
+
+# 워커 프로세스: 파일 하나를 교정하여 저장 → (결과 dict, 이 파일에서 기록한 계측값)
+def space_file(input_path, output_path):
+    metrics.reset()
+    start = time.perf_counter()
+    model_calls = _engine.model_calls
+    with metrics.timer("read"):
+        texts = extract_text_list(input_path)
+    with metrics.timer("spacing"):
+        full_text, corrections, counts = correct_text(texts, _engine)
+    with metrics.timer("write"):
+        write_atomic(output_path, full_text)
+    metrics.inc("files_spaced")
+    metrics.inc("lines", len(texts))
+    metrics.inc("corrections", sum(counts.values()))
+    metrics.inc("model_calls", _engine.model_calls - model_calls)
+    result = {
+        "input": input_path,
+        "output": output_path,
+        "lines": len(texts),
+        "corrections": sum(counts.values()),
+        "model_calls": _engine.model_calls - model_calls,
+        "seconds": round(time.perf_counter() - start, 4),
+        "error": None,
+    }
+    return result, metrics.snapshot()
+
+
+# 폴더 모드: 파일마다 워커 프로세스에 나누어 교정 → 입력 순서대로 결과 목록 반환
+# 파일별 오류는 결과의 error에 기록하고 나머지 파일은 계속 처리
+def space_directory(input_paths, output_dir, workers=WORKERS, on_result=None):
+    os.makedirs(output_dir, exist_ok=True)
+    results = [None] * len(input_paths)
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(input_paths))), initializer=init_worker) as executor:
+        futures = {executor.submit(space_file, path, output_path_for(path, output_dir)): i
+                   for i, path in enumerate(input_paths)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result, snapshot = future.result()
+                metrics.merge(snapshot)
+            except Exception as e:
+                metrics.inc("files_failed")
+                result = {"input": input_paths[i], "output": None, "error": f"{e.__class__.__name__}: {e}"}
+            results[i] = result
+            if on_result:
+                on_result(result)
+    return results
+
+
+def print_result(result):
+    if result["error"]:
+        print(f"  [실패] {os.path.basename(result['input'])} ({result['error']})")
+    else:
+        print(f"  [완료] {os.path.basename(result['input'])} → {result['output']} "
+              f"({result['lines']}줄, 교정 {result['corrections']}회, 모델 실행 {result['model_calls']}회, {result['seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default="mathpix_result.json", help="Mathpix 결과 JSON 파일 또는 폴더")
+    parser.add_argument("--output", default="fullText.txt", help="파일 하나를 교정할 때 결과 경로")
+    parser.add_argument("--output-dir", help="폴더 모드 결과 폴더 (기본값: 입력 폴더)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="폴더 모드 워커 프로세스 수")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        input_paths = list_result_files(args.path)
+        print(f"교정할 파일: {len(input_paths)}개")
+        start = time.perf_counter()
+        with metrics.run("mathpix_spacing", labels={"directory": args.path}):
+            results = space_directory(input_paths, args.output_dir or args.path, args.workers, on_result=print_result)
+        elapsed = time.perf_counter() - start
+
+        failed = [r for r in results if r["error"]]
+        print(f"\n완료: 성공 {len(results) - len(failed)}개 / 실패 {len(failed)}개, "
+              f"{elapsed:.2f}s ({len(results) / elapsed if elapsed else 0:.1f} files/s)")
+        for r in failed:
+            print(f"!!! 실패: {r['input']} ({r['error']})")
+        raise SystemExit(1 if failed else 0)
+
+    engine = SpacingEngine()
+
+    # 실행 
+    texts = extract_text_list(args.path)
+    print('texts',texts)
+    print(smart_lstrip_preserve_newlines(texts))
 
-# 교정된 텍스트 생성
-for c in corrections:
-    if c["joined"] in full_text:
-        print(f" 교체: {c['joined']} → {c['spaced']}")
-        full_text = full_text.replace(c["joined"], c["spaced"])
+    # 교정된 텍스트 생성
+    full_text, corrections, counts = correct_text(texts, engine)
+    print('corrections', corrections)
+    spaced = {c["joined"]: c["spaced"] for c in corrections}
+    for joined, count in counts.items():
+        print(f" 교체: {joined} → {spaced[joined]} ({count}회)")
 
-# 최종 결과 출력
-print("\n 최종 교정된 텍스트:")
-print(full_text)
+    # 최종 결과 출력
+    print("\n 최종 교정된 텍스트:")
+    print(full_text)
 
-# 파일로 저장
-output_path = "fullText.txt"
-with open(output_path, "w", encoding="utf-8") as f:
-    f.write(full_text)
+    # 파일로 저장
+    output_path = args.output
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(full_text)
 
-print(f"\n 파일 저장 완료: {output_path}")
\ No newline at end of file
+    print(f"\n 파일 저장 완료: {output_path}")
+    print(f" 모델 실행 횟수: {engine.model_calls}회")
@@ -0,0 +1,213 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from file_io import write_atomic
+
+'''
+파이프라인 단계별 처리 시간과 비용(토큰, 업로드 용량 등)을 기록하는 계측 모듈입니다.
+
+1. 단계 시간 측정 : `with metrics.timer("render"):` 또는 `@metrics.timed("parse")`
+   단계별 호출 횟수 / 합계 / 최댓값(초)을 기록합니다. (render, mask, ocr, encode, request, parse, insert 등)
+2. 카운터 : `metrics.inc("prompt_tokens", usage.prompt_tokens)`
+   페이지 수, crop 수, 업로드 바이트, 프롬프트/응답 토큰, 재시도, 캐시 hit 등을 누적합니다.
+3. 실행 단위 기록 : `with metrics.run("run_openai"):` 블록이 끝나면
+   - METRICS_DIR/runs.jsonl   : 실행 1회당 JSON 한 줄 (카운터, 단계 시간, 프로파일 요약)
+   - METRICS_DIR/<이름>.prom  : Prometheus 텍스트 형식 (node_exporter textfile collector로 수집 가능)
+4. METRICS_TRACEMALLOC=1 이면 tracemalloc으로 최대 Python 메모리와 할당 상위 위치를,
+   METRICS_PROFILE=1 이면 cProfile 결과(<이름>.prof)와 누적 시간 상위 함수를 함께 기록합니다.
+
+스레드에서 동시에 기록해도 안전하며, page_pool.py의 워커 프로세스에서 기록한 값은 부모 프로세스로 합쳐집니다.
+'''
+
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+METRICS_PROFILE = os.getenv("METRICS_PROFILE") == "1"
+METRICS_TRACEMALLOC = os.getenv("METRICS_TRACEMALLOC") == "1"
+
+# Prometheus 지표 이름 앞에 붙는 접두어
+PROMETHEUS_PREFIX = "taxpass_ocr"
+# 프로파일 / 메모리 할당 요약에 남길 상위 항목 수
+TOP_N = 15
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.timings = {}  # 단계 → [호출 횟수, 합계(초), 최댓값(초)]
+
+    # ---- 기록 ----
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            t = self.timings.setdefault(stage, [0, 0.0, 0.0])
+            t[0] += 1
+            t[1] += seconds
+            t[2] = max(t[2], seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ---- 프로세스 간 합치기 ----
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": {k: list(v) for k, v in self.timings.items()},
+            }
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.gauges.update(snapshot["gauges"])
+            for stage, (count, total, longest) in snapshot["timings"].items():
+                t = self.timings.setdefault(stage, [0, 0.0, 0.0])
+                t[0] += count
+                t[1] += total
+                t[2] = max(t[2], longest)
+
+    # ---- 실행 단위 기록 ----
+
+    @contextmanager
+    def run(self, name, metrics_dir=METRICS_DIR, profile=METRICS_PROFILE, trace_memory=METRICS_TRACEMALLOC, labels=None):
+        self.reset()
+        os.makedirs(metrics_dir, exist_ok=True)
+        started_at = time.time()
+        start = time.perf_counter()
+        profiler = cProfile.Profile() if profile else None
+        if trace_memory:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+
+        status = "ok"
+        try:
+            yield self
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            record = {
+                "run": name,
+                "status": status,
+                "labels": labels or {},
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started_at)),
+                "duration_seconds": round(time.perf_counter() - start, 4),
+                **self.snapshot(),
+            }
+            if trace_memory:
+                record["tracemalloc"] = memory_summary()
+                tracemalloc.stop()
+            if profiler:
+                prof_path = os.path.join(metrics_dir, f"{name}.prof")
+                profiler.dump_stats(prof_path)
+                record["profile"] = {"path": prof_path, "top": profile_summary(profiler)}
+
+            with open(os.path.join(metrics_dir, "runs.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            write_atomic(os.path.join(metrics_dir, f"{name}.prom"), prometheus_text(record))
+
+
+# 최대 메모리 + 할당량 상위 위치
+def memory_summary():
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics("lineno")[:TOP_N]
+    return {
+        "current_bytes": current,
+        "peak_bytes": peak,
+        "top": [{"where": str(stat.traceback), "bytes": stat.size, "count": stat.count} for stat in top],
+    }
+
+
+# 누적 시간 상위 함수
+def profile_summary(profiler):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({func})", "calls": nc,
+                     "tottime": round(tt, 4), "cumtime": round(ct, 4)})
+    rows.sort(key=lambda r: r["cumtime"], reverse=True)
+    return rows[:TOP_N]
+
+
+def prometheus_label(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+# Prometheus 텍스트 형식 (https://prometheus.io/docs/instrumenting/exposition_formats/)
+def prometheus_text(record):
+    base = {"run": record["run"], **record["labels"]}
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        full = f"{PROMETHEUS_PREFIX}_{name}"
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{full}{suffix}{prometheus_label({**base, **labels})} {value}")
+
+    metric("run_duration_seconds", "gauge", "Wall-clock duration of the run.",
+           [("", {"status": record["status"]}, record["duration_seconds"])])
+    metric("run_finished_timestamp_seconds", "gauge", "Unix time the run finished.",
+           [("", {}, round(time.time(), 3))])
+    for name, value in sorted(record["counters"].items()):
+        metric(f"{name}_total", "counter", f"Total {name.replace('_', ' ')}.", [("", {}, value)])
+    for name, value in sorted(record["gauges"].items()):
+        metric(name, "gauge", name.replace("_", " ").capitalize() + ".", [("", {}, value)])
+    if record["timings"]:
+        samples = []
+        for stage, (count, total, longest) in sorted(record["timings"].items()):
+            samples.append(("_count", {"stage": stage}, count))
+            samples.append(("_sum", {"stage": stage}, round(total, 6)))
+        metric("stage_seconds", "summary", "Time spent per pipeline stage.", samples)
+        metric("stage_max_seconds", "gauge", "Longest single call per pipeline stage.",
+               [("", {"stage": stage}, round(t[2], 6)) for stage, t in sorted(record["timings"].items())])
+    if "tracemalloc" in record:
+        metric("python_peak_bytes", "gauge", "Peak traced Python memory.",
+               [("", {}, record["tracemalloc"]["peak_bytes"])])
+    return "\n".join(lines) + "\n"
+
+
+# 모든 모듈이 함께 쓰는 기본 인스턴스
+metrics = Metrics()
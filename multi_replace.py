@@ -0,0 +1,106 @@
+from bisect import bisect_right
+
+'''
+여러 개의 (찾을 문자열 → 바꿀 문자열) 쌍을 텍스트 전체에 한 번의 스캔으로 적용하는 Aho-Corasick 치환기입니다.
+
+mathpix_spacing.py는 띄어쓰기 교정 결과를 `for c in corrections: full_text = full_text.replace(...)`로 반영했는데,
+교정 하나마다 전체 문자열을 새로 만들고, 앞선 교정 결과가 다음 교정의 검색 대상이 되어 적용 순서에 따라 결과가 달라졌습니다.
+
+1. 모든 패턴으로 오토마톤을 한 번 만든 뒤, 원문을 처음부터 끝까지 한 번만 훑으면서 치환합니다.
+2. 같은 위치에서 여러 패턴이 겹치면 가장 왼쪽에서 시작하는 것, 그중 가장 긴 것을 선택합니다. (leftmost-longest)
+3. 치환 결과는 다시 검색하지 않으므로 패턴 순서와 무관하게 결과가 항상 같습니다.
+4. protected_spans로 넘긴 구간(예: 수식 영역)의 내부에서 시작하거나 끝나는 매칭은 건너뜁니다.
+'''
+
+
+class MultiReplacer:
+    def __init__(self, mapping):
+        self.mapping = {k: v for k, v in mapping.items() if k}
+        # 노드별 전이 / 실패 링크 / 깊이 / 이 노드에서 끝나는 패턴 길이 목록(긴 순)
+        self.goto = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.outputs = [[]]
+        for pattern in self.mapping:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.depth.append(self.depth[node] + 1)
+                self.outputs.append([])
+            node = nxt
+        self.outputs[node].append(len(pattern))
+
+    # BFS로 실패 링크 계산, 실패 링크를 따라가며 끝나는 패턴도 출력 목록에 합침
+    def _build(self):
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.outputs[nxt] = sorted(set(self.outputs[nxt] + self.outputs[self.fail[nxt]]), reverse=True)
+                queue.append(nxt)
+
+    def _step(self, node, ch):
+        while node and ch not in self.goto[node]:
+            node = self.fail[node]
+        return self.goto[node].get(ch, 0)
+
+    # (치환된 텍스트, 패턴별 치환 횟수) 반환
+    def replace(self, text, protected_spans=()):
+        starts = [s for s, _ in protected_spans]
+        ends = [e for _, e in protected_spans]
+
+        # 위치 pos가 보호 구간 내부(경계 제외)인지 검사
+        def inside_protected(pos):
+            k = bisect_right(starts, pos) - 1
+            return k >= 0 and starts[k] < pos < ends[k]
+
+        parts = []
+        counts = {}
+        prev = 0
+        i = 0
+        node = 0
+        best = None  # (start, end)
+        n = len(text)
+        while True:
+            if i < n:
+                node = self._step(node, text[i])
+                i += 1
+                for length in self.outputs[node]:
+                    start = i - length
+                    if best and start > best[0]:
+                        break
+                    if inside_protected(start) or inside_protected(i):
+                        continue
+                    if best is None or start < best[0] or (start == best[0] and i > best[1]):
+                        best = (start, i)
+                    break
+            elif best is None:
+                break
+
+            # 앞으로 찾을 매칭은 (i - 현재 깊이) 이후에서만 시작할 수 있으므로, 그보다 앞선 후보는 확정
+            # (텍스트 끝에 도달한 경우에도 확정)
+            if best and (i >= n or best[0] < i - self.depth[node]):
+                start, end = best
+                pattern = text[start:end]
+                parts.append(text[prev:start])
+                parts.append(self.mapping[pattern])
+                counts[pattern] = counts.get(pattern, 0) + 1
+                # 확정된 매칭 뒤부터 다시 탐색
+                prev = i = end
+                node = 0
+                best = None
+
+        parts.append(text[prev:])
+        return ''.join(parts), counts
@@ -0,0 +1,158 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+'''
+OpenAI / Mathpix OCR 응답을 디스크에 저장해두는 content-addressed 캐시입니다.
+같은 이미지를 같은 설정으로 다시 요청하면 네트워크 호출 없이 저장된 응답을 돌려줍니다.
+
+1. 캐시 키는 (이미지 바이트, 시스템 프롬프트, 모델, temperature, max_tokens / Mathpix options_json 등)의 SHA-256 해시입니다.
+   프롬프트나 옵션이 바뀌면 해당 설정으로 만들어진 항목만 키가 달라지므로 나머지 항목은 그대로 재사용됩니다.
+2. 임시 파일에 쓴 뒤 os.replace로 교체하므로, 여러 워커(스레드/프로세스)가 동시에 써도 깨진 파일이 남지 않습니다.
+3. 전체 용량이 max_bytes를 넘으면 가장 오래 사용되지 않은(mtime 기준) 항목부터 max_bytes의 EVICT_LOW_WATER 비율까지 삭제합니다. (LRU)
+   한 번에 여유를 만들어 두므로 한도 근처에서 저장할 때마다 캐시 폴더 전체를 훑지 않으며,
+   폴더를 훑는 동안에는 lock을 잡지 않아 다른 워커의 get / put을 막지 않습니다.
+4. hit / miss 횟수를 기록하여 캐시 효율을 확인할 수 있습니다.
+   키 여러 개로 찾는 경우(get_any)나 이미 센 항목을 다시 확인하는 경우(count=False)에도 요청 하나당 한 번만 셉니다.
+'''
+
+DEFAULT_CACHE_DIR = os.getenv("OCR_CACHE_DIR", ".ocr_cache")
+DEFAULT_MAX_BYTES = 1 << 30  # 1GB
+# 용량 초과 시 max_bytes의 이 비율까지 줄임
+EVICT_LOW_WATER = 0.9
+
+
+class OCRCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    # 이미지 바이트 + 요청 파라미터로 캐시 키 생성
+    # 파라미터는 key 정렬된 JSON으로 직렬화하여 순서와 무관하게 같은 키가 나오도록 함
+    @staticmethod
+    def make_key(image_bytes, **params):
+        h = hashlib.sha256()
+        h.update(hashlib.sha256(image_bytes).digest())
+        h.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    # (경로, 마지막 사용 시각, 크기) 목록
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue  # 다른 워커가 방금 삭제한 경우
+                yield path, st.st_mtime, st.st_size
+
+    # count=False이면 hit / miss 횟수에 넣지 않음
+    def get(self, key, count=True):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)  # LRU 갱신
+        except (FileNotFoundError, json.JSONDecodeError):
+            value = None
+        if count:
+            self._count(value is not None)
+        return value
+
+    # 키를 순서대로 찾아 처음 찾은 값을 반환, hit / miss는 한 번만 셈
+    def get_any(self, keys):
+        value = None
+        for key in keys:
+            value = self.get(key, count=False)
+            if value is not None:
+                break
+        self._count(value is not None)
+        return value
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 같은 디렉토리에 임시 파일로 쓴 뒤 원자적으로 교체
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # 같은 키를 덮어쓰면 기존 파일 크기만큼 빼야 전체 용량이 실제와 같음
+            with self.lock:
+                try:
+                    old_size = os.stat(path).st_size
+                except FileNotFoundError:
+                    old_size = 0
+                os.replace(tmp_path, path)
+                self.total_bytes += len(data) - old_size
+                over_limit = self.total_bytes > self.max_bytes
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if over_limit:
+            self.evict()
+
+    # 용량 초과 시 오래된 항목부터 max_bytes * EVICT_LOW_WATER 이하가 될 때까지 삭제
+    # 폴더를 훑고 정렬하는 동안은 lock을 잡지 않고, 이미 다른 스레드가 정리 중이면 바로 반환
+    def evict(self):
+        if not self.evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = sorted(self._entries(), key=lambda e: e[1])
+            total = sum(size for _, _, size in entries)
+            target = self.max_bytes * EVICT_LOW_WATER
+            removed = 0
+            for path, _, size in entries:
+                if total - removed <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue  # 다른 워커가 이미 삭제한 경우
+                removed += size
+            # 훑는 동안 다른 스레드가 저장한 항목도 반영되도록 훑은 결과로 덮어쓰지 않고 삭제한 만큼만 뺌
+            with self.lock:
+                self.total_bytes -= removed
+        finally:
+            self.evict_lock.release()
+
+    # 캐시에 있으면 반환, 없으면 compute() 결과를 저장 후 반환
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'bytes': self.total_bytes,
+        }
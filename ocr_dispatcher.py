@@ -0,0 +1,144 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+OCR API 요청을 동시에 여러 개 보내기 위한 디스패처입니다.
+run_openai.py처럼 이미지 한 장당 한 번씩 API를 호출하는 스크립트에서,
+순차 루프 대신 스레드 풀로 요청을 병렬 처리하면서도 API 사용 한도를 넘지 않도록 조절합니다.
+
+1. 동시 요청 개수(concurrency)를 스레드 풀 크기로 제한합니다.
+2. 분당 요청 수(RPM)와 분당 토큰 수(TPM)를 토큰 버킷으로 제한합니다.
+   dispatch 밖에서 보내는 요청(예: 묶음 요청 실패 후 한 장씩 다시 보내는 요청)도 같은 RateLimiter를 넘겨 함께 제한할 수 있습니다.
+3. 429(Rate limit) / 5xx 응답은 지터가 포함된 지수 백오프로 재시도합니다.
+4. 요청이 끝나는 순서와 상관없이 결과는 입력 순서대로 돌려주므로, .tex 파일에 문제 순서대로 기록할 수 있습니다.
+'''
+
+
+# 분당 허용량을 기준으로 채워지는 토큰 버킷
+# acquire()는 필요한 양이 채워질 때까지 대기한 뒤 차감합니다.
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        # 버킷 용량보다 큰 요청은 용량만큼만 차감 (영원히 대기하는 것 방지)
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# RPM / TPM 토큰 버킷 한 쌍 (제한값이 None이면 해당 제한 없음)
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    # 요청 하나(예상 토큰 수 tokens)를 보낼 수 있을 때까지 대기
+    def wait(self, tokens=1):
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(tokens)
+
+
+# 예외에서 HTTP 상태코드 추출 (openai / requests 예외 모두 대응)
+def get_status_code(exc):
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        response = getattr(exc, 'response', None)
+        status = getattr(response, 'status_code', None)
+    return status
+
+
+# 429, 5xx, 네트워크 오류만 재시도 대상
+def is_retryable(exc):
+    status = get_status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+# 서버가 Retry-After 헤더를 준 경우 그 값(초)을 사용
+def get_retry_after(exc):
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+# Full jitter 지수 백오프: 0 ~ min(cap, base * 2^attempt) 사이 임의의 시간
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# 재시도 가능한 오류면 백오프 후 다시 호출
+# before_attempt는 매 시도 전에 호출됨 (rate limiter 대기용)
+def call_with_retry(fn, *args, max_retries=5, retryable=is_retryable,
+                    before_attempt=None, on_retry=None, **kwargs):
+    attempt = 0
+    while True:
+        if before_attempt:
+            before_attempt()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if on_retry:
+                on_retry(attempt + 1, e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+# items를 worker로 병렬 처리하고 (item, result, error)를 입력 순서대로 yield
+# cost(item)은 해당 요청이 소비할 것으로 예상되는 토큰 수 (TPM 제한용)
+# lookup(item)이 None이 아닌 값을 반환하면 (캐시 hit 등) rate limit 대기 없이 그 값을 결과로 사용
+# limiter : worker 안에서 보내는 추가 요청과 한도를 함께 쓰려면 RateLimiter를 넘김 (없으면 RPM / TPM으로 새로 만듦)
+def dispatch(items, worker, concurrency=4, requests_per_minute=None, tokens_per_minute=None,
+             cost=None, max_retries=5, retryable=is_retryable, on_retry=None, lookup=None, limiter=None):
+    limiter = limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def run(item):
+        if lookup:
+            found = lookup(item)
+            if found is not None:
+                return found
+
+        def wait_for_budget():
+            limiter.wait(cost(item) if cost else 1)
+
+        return call_with_retry(worker, item, max_retries=max_retries, retryable=retryable,
+                               before_attempt=wait_for_budget,
+                               on_retry=(lambda n, e, d: on_retry(item, n, e, d)) if on_retry else None)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [(item, executor.submit(run, item)) for item in items]
+        # 먼저 끝난 요청이 있더라도 앞 순번이 끝날 때까지 기다렸다가 순서대로 반환
+        for item, future in futures:
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import threading
+from file_io import write_atomic
+
+'''
+run_openai.py의 이미지별 진행 상황을 기록하는 저널(manifest)입니다.
+긴 변환 작업이 중간에 종료되어도(선점형 인스턴스 회수, Ctrl+C 등) 다시 실행하면 멈춘 지점부터 이어서 처리합니다.
+
+1. <폴더>.journal.json 에 이미지별 상태를 기록합니다.
+   - pending   : 아직 요청하지 않음
+   - in-flight : 요청을 보냈지만 결과를 저장하기 전
+   - done      : 결과가 <폴더>_latex/<이름>.tex 에 저장됨
+   - failed    : 재시도 후에도 실패 (다음 실행에서 다시 요청)
+2. 저널과 문제별 결과 파일은 모두 임시 파일에 쓴 뒤 os.replace로 교체하므로, 쓰는 도중 종료되어도 깨진 파일이 남지 않습니다.
+   결과 파일을 먼저 저장한 뒤 저널을 done으로 바꾸므로, done인 문제는 항상 결과 파일이 있습니다.
+3. 다시 실행하면 in-flight 상태였던 이미지는 pending으로 되돌려 다시 요청합니다.
+   이미 응답을 받은 요청은 OCR 캐시(ocr_cache.py)에 남아 있으므로 비용을 다시 내지 않습니다.
+4. .tex 파일은 결과를 이어 붙이지 않고, 매번 문제별 결과를 파일명 순서대로 모아 새로 만듭니다.
+   따라서 몇 번을 다시 실행해도 같은 문제가 두 번 들어가거나 일부만 들어가지 않습니다.
+
+openai_batch.py도 같은 문제별 결과 폴더(<폴더>_latex)를 사용하므로, 두 방식의 결과를 섞어서 이어 처리할 수 있습니다.
+'''
+
+PENDING = "pending"
+IN_FLIGHT = "in-flight"
+DONE = "done"
+FAILED = "failed"
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def list_images(input_folder):
+    return sorted(f for f in os.listdir(input_folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+# 문제별 결과 파일 경로: <폴더>_latex/<이미지 이름>.tex
+def result_path(output_folder, image_name):
+    return os.path.join(output_folder, os.path.splitext(image_name)[0] + ".tex")
+
+
+def write_result(output_folder, image_name, latex_output):
+    write_atomic(result_path(output_folder, image_name), latex_output)
+
+
+# 문제별 결과를 파일명 순서대로 이어 붙여 .tex 새로 작성 → 포함된 문제 수
+def assemble_tex(input_folder, output_folder, tex_path):
+    parts = []
+    for image_name in list_images(input_folder):
+        path = result_path(output_folder, image_name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                parts.append(f.read())
+    write_atomic(tex_path, "".join(parts))
+    return len(parts)
+
+
+class OCRJournal:
+    def __init__(self, input_folder, output_folder=None, path=None):
+        self.input_folder = input_folder
+        self.output_folder = output_folder or f"{input_folder}_latex"
+        self.path = path or f"{input_folder}.journal.json"
+        self.lock = threading.Lock()
+        self.images = {}
+        os.makedirs(self.output_folder, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.images = json.load(f).get("images", {})
+        self._recover()
+
+    # 이전 실행이 중간에 종료된 경우: in-flight → pending, 결과 파일이 없는 done → pending
+    def _recover(self):
+        for name, entry in self.images.items():
+            if entry["status"] == IN_FLIGHT or (
+                entry["status"] == DONE and not os.path.exists(result_path(self.output_folder, name))
+            ):
+                entry["status"] = PENDING
+
+    def _set(self, name, status, **fields):
+        entry = self.images.setdefault(name, {"status": PENDING, "attempts": 0})
+        entry.update(status=status, updated_at=time.strftime("%Y-%m-%dT%H:%M:%S"), **fields)
+        return entry
+
+    def save(self):
+        with self.lock:
+            text = json.dumps({"images": self.images}, ensure_ascii=False, indent=2)
+            write_atomic(self.path, text)
+
+    # 폴더의 이미지를 저널에 등록하고, 아직 끝나지 않은 이미지를 in-flight로 표시 → 요청할 이미지 이름 목록
+    # 결과 파일만 있고 저널에 없는 이미지(openai_batch.py 결과 등)는 done으로 등록
+    def start(self, image_names=None):
+        image_names = list_images(self.input_folder) if image_names is None else image_names
+        todo = []
+        with self.lock:
+            for name in image_names:
+                entry = self.images.get(name)
+                if entry is None and os.path.exists(result_path(self.output_folder, name)):
+                    self._set(name, DONE)
+                    continue
+                if entry is None or entry["status"] != DONE:
+                    entry = self._set(name, IN_FLIGHT, error=None)
+                    entry["attempts"] += 1
+                    todo.append(name)
+        self.save()
+        return todo
+
+    # 결과 파일을 먼저 저장한 뒤 저널에 done 기록
+    def mark_done(self, name, latex_output):
+        write_result(self.output_folder, name, latex_output)
+        with self.lock:
+            self._set(name, DONE, error=None)
+        self.save()
+
+    def mark_failed(self, name, error):
+        with self.lock:
+            self._set(name, FAILED, error=f"{error.__class__.__name__}: {error}"
+                      if isinstance(error, BaseException) else str(error))
+        self.save()
+
+    def assemble_tex(self, tex_path):
+        return assemble_tex(self.input_folder, self.output_folder, tex_path)
+
+    # 상태별 이미지 수
+    def summary(self):
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        with self.lock:
+            for entry in self.images.values():
+                counts[entry["status"]] += 1
+        return counts
+
+    def failures(self):
+        with self.lock:
+            return {name: entry.get("error") for name, entry in self.images.items() if entry["status"] == FAILED}
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import argparse
+import openai
+from dotenv import load_dotenv
+from ocr_cache import OCRCache
+from metrics import metrics
+from file_io import write_atomic
+from ocr_dispatcher import call_with_retry
+from ocr_journal import list_images, result_path, write_result, assemble_tex
+from run_openai import read_image, build_request_body, single_cache_key, is_retryable_openai, MAX_RETRIES
+
+'''
+대량의 문제 이미지를 OpenAI Batch API로 변환하는 스크립트입니다.
+지난 시험지 수천 장을 한꺼번에 변환할 때는 응답을 바로 받을 필요가 없으므로,
+run_openai.py처럼 동기 요청으로 rate limit과 정가를 부담하지 않고 Batch API(24시간 내 처리, 할인 요금)를 사용합니다.
+
+1. 이미지 폴더에서 요청 JSONL 파일을 만듭니다. (run_openai.py와 같은 시스템 프롬프트 / 모델 / 파라미터 / 이미지 인코딩)
+   custom_id는 이미지 파일명이며, 파일 하나에 최대 50,000개 / 약 190MB씩 나누어 만듭니다.
+2. JSONL 파일을 업로드하고 배치를 생성한 뒤, 완료될 때까지 상태를 확인합니다.
+3. 결과를 custom_id 기준으로 문제별 파일(<폴더>_latex/<이름>.tex)로 나누어 저장하고,
+   OCR 캐시(ocr_cache.py)에도 넣어 run_openai.py를 다시 실행해도 같은 이미지는 요청하지 않습니다.
+   모든 문제별 결과를 파일명 순서대로 이어 붙여 <폴더>.tex를 새로 만듭니다.
+   업로드 / 배치 생성 / 상태 확인 / 결과 다운로드 요청은 429 / 5xx / 네트워크 오류에서 run_openai.py와 같은 방식으로 재시도합니다.
+4. 실패한 요청만 모아 다시 배치를 만들어 제출합니다. (최대 MAX_ROUNDS회)
+   진행 상황은 <폴더>.batch.json에 저장되므로 중간에 종료해도 다시 실행하면 제출된 배치부터 이어서 처리합니다.
+
+실행 예시 >
+  python openai_batch.py 2024_행정소송법
+  python openai_batch.py 2024_행정소송법 --submit-only      # 제출만 하고 종료
+  OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=stub python openai_batch.py 2024_행정소송법 --poll-interval 1
+'''
+
+load_dotenv()
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Batch API 입력 파일 제한 (요청 50,000개, 200MB) 보다 약간 작게
+MAX_REQUESTS_PER_BATCH = 50000
+MAX_BATCH_FILE_BYTES = 190 * 1024 * 1024
+# 실패한 요청을 다시 제출하는 최대 횟수
+MAX_ROUNDS = 3
+POLL_INTERVAL = 60
+
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+# 진행 상황 파일: 제출한 배치 목록과 요청별 실패 사유
+class BatchState:
+    def __init__(self, path):
+        self.path = path
+        self.data = {"batches": [], "failures": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    @property
+    def batches(self):
+        return self.data["batches"]
+
+    @property
+    def failures(self):
+        return self.data["failures"]
+
+    def save(self):
+        write_atomic(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
+
+
+# 재시도 가능한 오류(429 / 5xx / 네트워크 오류)면 백오프 후 다시 호출
+def call_openai(fn, *args, **kwargs):
+    def on_retry(attempt, error, delay):
+        print(f"  재시도 {attempt}회: {getattr(fn, '__name__', 'request')} ({error.__class__.__name__}) → {delay:.1f}s 후")
+
+    return call_with_retry(fn, *args, max_retries=MAX_RETRIES, retryable=is_retryable_openai,
+                           on_retry=on_retry, **kwargs)
+
+
+# 1. 요청 JSONL 파일 생성 → (파일 경로, 파일에 들어간 custom_id 목록) 목록
+# 파일 하나가 요청 수 / 용량 제한을 넘으면 다음 파일로 나눔
+def build_batch_files(input_folder, custom_ids, prefix):
+    files = []
+    out, count, size = None, 0, 0
+    for custom_id in custom_ids:
+        image_path = os.path.join(input_folder, custom_id)
+        line = json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": ENDPOINT,
+            "body": build_request_body(image_path, read_image(image_path)),
+        }, ensure_ascii=False) + "\n"
+        data = line.encode("utf-8")
+
+        if out is None or count >= MAX_REQUESTS_PER_BATCH or size + len(data) > MAX_BATCH_FILE_BYTES:
+            if out:
+                out.close()
+            files.append((f"{prefix}.{len(files) + 1:03d}.jsonl", []))
+            out = open(files[-1][0], "wb")
+            count, size = 0, 0
+        out.write(data)
+        files[-1][1].append(custom_id)
+        count += 1
+        size += len(data)
+    if out:
+        out.close()
+    return files
+
+
+# 2. 업로드 + 배치 생성 → 배치 기록
+def submit_batch(client, jsonl_path, custom_ids, metadata=None):
+    # 재시도할 때마다 파일을 처음부터 다시 읽어 업로드
+    def upload():
+        with open(jsonl_path, "rb") as f:
+            return client.files.create(file=f, purpose="batch")
+
+    input_file = call_openai(upload)
+    batch = call_openai(
+        client.batches.create,
+        input_file_id=input_file.id,
+        endpoint=ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        metadata=metadata,
+    )
+    metrics.inc("batches_submitted")
+    metrics.inc("batch_requests", len(custom_ids))
+    return {"id": batch.id, "input_file": jsonl_path, "custom_ids": custom_ids,
+            "status": batch.status, "collected": False}
+
+
+# 배치가 끝날 때까지 상태 확인 → 마지막 배치 객체
+def wait_batch(client, batch_id, poll_interval=POLL_INTERVAL):
+    while True:
+        batch = call_openai(client.batches.retrieve, batch_id)
+        if batch.status in FINAL_STATUSES:
+            return batch
+        counts = batch.request_counts
+        progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else ""
+        print(f"  배치 {batch_id}: {batch.status} {progress}")
+        time.sleep(poll_interval)
+
+
+def read_jsonl_file(client, file_id):
+    if not file_id:
+        return []
+    text = call_openai(client.files.content, file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+# 3. 결과를 custom_id 기준으로 문제별 파일 / 캐시에 저장 → (성공 custom_id 목록, {실패 custom_id: 사유})
+def collect_batch(client, batch, input_folder, output_folder, cache=None):
+    succeeded, failed = [], {}
+    for line in read_jsonl_file(client, batch.output_file_id) + read_jsonl_file(client, batch.error_file_id):
+        custom_id = line["custom_id"]
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") != 200 or not body.get("choices"):
+            error = line.get("error") or body.get("error") or f"status {response.get('status_code')}"
+            failed[custom_id] = json.dumps(error, ensure_ascii=False) if not isinstance(error, str) else error
+            continue
+
+        latex_output = body["choices"][0]["message"]["content"]
+        write_result(output_folder, custom_id, latex_output)
+        if cache:
+            cache.put(single_cache_key(read_image(os.path.join(input_folder, custom_id))), {'content': latex_output})
+        usage = body.get("usage") or {}
+        metrics.inc("prompt_tokens", usage.get("prompt_tokens", 0))
+        metrics.inc("completion_tokens", usage.get("completion_tokens", 0))
+        succeeded.append(custom_id)
+    metrics.inc("batch_succeeded", len(succeeded))
+    metrics.inc("batch_failed", len(failed))
+    return succeeded, failed
+
+
+# 아직 결과가 없는 이미지 목록 (캐시에 결과가 있으면 문제별 파일로 바로 저장)
+def pending_images(input_folder, output_folder, cache=None):
+    pending = []
+    for custom_id in list_images(input_folder):
+        if os.path.exists(result_path(output_folder, custom_id)):
+            continue
+        entry = cache.get(single_cache_key(read_image(os.path.join(input_folder, custom_id)))) if cache else None
+        if entry:
+            metrics.inc("cache_hits")
+            write_result(output_folder, custom_id, entry['content'])
+        else:
+            pending.append(custom_id)
+    return pending
+
+
+# 제출되었지만 아직 결과를 가져오지 않은 배치를 기다렸다가 결과 저장
+def collect_open_batches(client, state, input_folder, output_folder, cache, poll_interval):
+    for record in state.batches:
+        if record["collected"]:
+            continue
+        batch = wait_batch(client, record["id"], poll_interval)
+        succeeded, failed = collect_batch(client, batch, input_folder, output_folder, cache)
+        # 결과 파일에 없는 요청(만료 / 취소 등)도 실패로 기록
+        for custom_id in record["custom_ids"]:
+            if custom_id not in succeeded and custom_id not in failed:
+                failed[custom_id] = f"batch {batch.status}"
+        for custom_id in succeeded:
+            state.failures.pop(custom_id, None)
+        state.failures.update(failed)
+        record.update(status=batch.status, collected=True)
+        state.save()
+        print(f"  배치 {batch.id}: {batch.status}, 성공 {len(succeeded)}개 / 실패 {len(failed)}개")
+
+
+# 전체 과정: 남은 배치 정리 → 결과 없는 이미지 제출 → 대기 / 수집 → 실패분 재제출 → .tex 생성
+# 남은 실패 {custom_id: 사유} 반환
+def run_batch(client, input_folder, cache=None, max_rounds=MAX_ROUNDS, poll_interval=POLL_INTERVAL, submit_only=False):
+    output_folder = f"{input_folder}_latex"
+    os.makedirs(output_folder, exist_ok=True)
+    state = BatchState(f"{input_folder}.batch.json")
+
+    for round_no in range(1, max_rounds + 1):
+        if not submit_only:
+            collect_open_batches(client, state, input_folder, output_folder, cache, poll_interval)
+
+        in_flight = {c for r in state.batches if not r["collected"] for c in r["custom_ids"]}
+        pending = [c for c in pending_images(input_folder, output_folder, cache) if c not in in_flight]
+        if not pending:
+            break
+        print(f"[{round_no}회차] 배치 제출: {len(pending)}개")
+        prefix = f"{input_folder}.batch_{len(state.batches) + 1:03d}"
+        for jsonl_path, custom_ids in build_batch_files(input_folder, pending, prefix):
+            state.batches.append(submit_batch(client, jsonl_path, custom_ids,
+                                              metadata={"input_folder": os.path.basename(input_folder)}))
+            state.save()
+        if submit_only:
+            return state.failures
+
+    if not submit_only:
+        collect_open_batches(client, state, input_folder, output_folder, cache, poll_interval)
+    # 4. 문제별 결과를 파일명 순서대로 이어 붙여 .tex 생성
+    count = assemble_tex(input_folder, output_folder, f"{input_folder}.tex")
+    print(f".tex 저장 완료: {input_folder}.tex ({count}개 문제)")
+    return {c: e for c, e in state.failures.items() if not os.path.exists(result_path(output_folder, c))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_folder")
+    parser.add_argument("--max-rounds", type=int, default=MAX_ROUNDS)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--submit-only", action="store_true", help="배치 제출만 하고 종료 (다시 실행하면 결과 수집)")
+    args = parser.parse_args()
+
+    # 재시도는 call_openai에서 처리
+    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    cache = OCRCache()
+
+    with metrics.run("openai_batch", labels={"input": args.input_folder}):
+        failures = run_batch(client, args.input_folder.rstrip("/"), cache, args.max_rounds,
+                             args.poll_interval, args.submit_only)
+
+    for custom_id, error in sorted(failures.items()):
+        print(f"!!! 실패: {custom_id} ({error})")
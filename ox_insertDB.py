@@ -1,13 +1,14 @@
 import os
 import json
+import time
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
-
-load_dotenv()
+from metrics import metrics
 
 '''
 OX 문제가 저장된 json 파일을 불러와 데이터베이스에 저장하는 스크립트입니다.
-.json 파일 형식 > 
+.json 파일 형식 >
   {
     "number": "1",
     "question": "조세법률주의는 헌법상 명시된 원칙이다.",
@@ -15,60 +16,99 @@ OX 문제가 저장된 json 파일을 불러와 데이터베이스에 저장하
     "category": "조세법의 기본원칙 / 헌법상 조세원칙",
     "explanation": "조세법률주의는 헌법 제59조에 따라 조세의 종목과 세율은 반드시 국회의 법률에 의해 정해져야 하며, 이는 자의적 과세를 방지하고 납세자의 재산권을 보호하기 위한 법치주의적 원칙이다."
   },
+
+문제는 한 행씩 INSERT 하지 않고 다중 VALUES(execute_values)로 묶어서 저장하며,
+오류가 나면 롤백하여 일부 문제만 저장된 상태가 남지 않습니다.
+폴더 안의 *_ox_questions.json 파일을 한 번에 저장하려면 db_ingest.py를 사용합니다.
 '''
 
-# ox 문제가 저장된 json 파일 불러오기
-JSON_PATH = 'data/output/행정소송법_ox_questions.json'
-SUBJECT_NAME = JSON_PATH.split("/")[-1].replace("_ox_questions.json","")
 CREATED_BY_USER_ID = 'admin'
 CREATED_BY_IP = '127.0.0.1'
 
-# DB 연결
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT"),
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
-)
-cur = conn.cursor()
-
-# subject_id 조회 (과목이름으로 과목 id 추출)
-cur.execute("SELECT id FROM subjects WHERE name = %s", (SUBJECT_NAME,))
-subject_row = cur.fetchone()
-if not subject_row:
-    raise Exception(f"Subject '{SUBJECT_NAME}' not found in subjects table.")
-subject_id = subject_row[0]
-
-with open(JSON_PATH, encoding='utf-8') as f:
-    questions = json.load(f)
-
-# INSERT 실행
-for q in questions:
-    number = q["number"]
-    question_text = q["question"]
-    answer = True if q["answer"].strip().upper() == "O" else False
-    explanation = q.get("explanation", "")
-    tag = q.get("category", "").strip().split("/") if q.get("category") else []
-
-    cur.execute("""
-        INSERT INTO ox_questions (
-            subject_id, number, question_text, answer,
-            explanation, tag,
+# 다중 VALUES 한 번에 묶을 최대 행 수
+PAGE_SIZE = 1000
+
+OX_FILE_SUFFIX = "_ox_questions.json"
+
+
+# 파일명에서 과목이름 추출 (data/output/행정소송법_ox_questions.json → 행정소송법)
+def subject_from_path(json_path):
+    return os.path.basename(json_path).replace(OX_FILE_SUFFIX, "")
+
+
+# OX 문제 → ox_questions 행 (subject_id 제외)
+def ox_rows(questions, created_by_ip=CREATED_BY_IP, created_by_user_id=CREATED_BY_USER_ID):
+    rows = []
+    for q in questions:
+        answer = True if q["answer"].strip().upper() == "O" else False
+        tag = q.get("category", "").strip().split("/") if q.get("category") else []
+        rows.append((
+            q["number"], q["question"], answer,
+            q.get("explanation", ""), tag,
             created_by_ip, created_by_user_id,
-            updated_by_ip, updated_by_user_id
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, (
-        subject_id, number, question_text, answer,
-        explanation, tag,
-        CREATED_BY_IP, CREATED_BY_USER_ID,
-        CREATED_BY_IP, CREATED_BY_USER_ID
-    ))
-
-# 커밋
-conn.commit()
-cur.close()
-conn.close()
-print("OX 문제 삽입 완료.")
+            created_by_ip, created_by_user_id
+        ))
+    return rows
+
+
+# 과목이름으로 과목 id 조회 후 OX 문제 일괄 저장 (커밋/롤백은 호출하는 쪽에서 처리)
+# 저장한 행 수 반환
+@metrics.timed("ox_insert")
+def load_ox_questions(cur, subject_name, questions):
+    # subject_id 조회 (과목이름으로 과목 id 추출)
+    cur.execute("SELECT id FROM subjects WHERE name = %s", (subject_name,))
+    subject_row = cur.fetchone()
+    if not subject_row:
+        raise Exception(f"Subject '{subject_name}' not found in subjects table.")
+    subject_id = subject_row[0]
+
+    rows = [(subject_id, *row) for row in ox_rows(questions)]
+    if rows:
+        execute_values(cur, """
+            INSERT INTO ox_questions (
+                subject_id, number, question_text, answer,
+                explanation, tag,
+                created_by_ip, created_by_user_id,
+                updated_by_ip, updated_by_user_id
+            ) VALUES %s
+        """, rows, page_size=PAGE_SIZE)
+    metrics.inc("rows_inserted", len(rows))
+    return len(rows)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    # ox 문제가 저장된 json 파일 불러오기
+    JSON_PATH = 'data/output/행정소송법_ox_questions.json'
+    SUBJECT_NAME = subject_from_path(JSON_PATH)
+
+    # DB 연결
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+    cur = conn.cursor()
+    try:
+        with open(JSON_PATH, encoding='utf-8') as f:
+            questions = json.load(f)
+
+        start = time.perf_counter()
+        with metrics.run("ox_insertDB", labels={"subject": SUBJECT_NAME}):
+            rows = load_ox_questions(cur, SUBJECT_NAME, questions)
+            # 커밋
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        print("OX 문제 삽입 완료.")
+        print(f"저장 행 수: {rows}개, {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"!!! 에러 발생: {e}")
 
+    finally:
+        cur.close()
+        conn.close()
@@ -55,15 +55,16 @@ def parse_ox_txt_file(file_path):
     return results
 
 
-# 실행
-file_path = "data/ox_question/회계학개론.txt"
-parsed = parse_ox_txt_file(file_path)
-subject = Path(file_path).stem
+if __name__ == "__main__":
+    # 실행
+    file_path = "data/ox_question/회계학개론.txt"
+    parsed = parse_ox_txt_file(file_path)
+    subject = Path(file_path).stem
 
-# 저장 디렉토리 생성
-os.makedirs("data/output", exist_ok=True)
+    # 저장 디렉토리 생성
+    os.makedirs("data/output", exist_ok=True)
 
-with open(f"data/output/{subject}_ox_questions.json", "w", encoding='utf-8') as f:
-    json.dump(parsed, f, ensure_ascii=False, indent=2)
+    with open(f"data/output/{subject}_ox_questions.json", "w", encoding='utf-8') as f:
+        json.dump(parsed, f, ensure_ascii=False, indent=2)
 
-print("JSON 저장 완료:", f"{subject}_ox_questions.json")
+    print("JSON 저장 완료:", f"{subject}_ox_questions.json")
@@ -0,0 +1,93 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from metrics import metrics
+
+'''
+PDF 페이지 단위 작업을 여러 프로세스로 나누어 실행하는 헬퍼입니다.
+question_crop_by_text.py, question_crop_by_img.py에서 렌더링/OCR처럼 CPU를 많이 쓰는 작업을 병렬화할 때 사용합니다.
+
+1. 페이지 목록을 워커 수만큼 연속된 구간으로 나눕니다.
+2. 각 워커는 fitz 문서를 직접 열어 자신에게 할당된 페이지만 처리합니다. (fitz 문서 객체는 프로세스 간 공유 불가)
+3. 페이지별 오류는 전체 실행을 중단하지 않고 모아서 반환합니다.
+4. 워커 프로세스에서 기록한 계측값(metrics.py)은 구간이 끝날 때 부모 프로세스로 합쳐집니다.
+5. 다른 스레드가 실행 중인 프로세스(예: pipeline.py의 시험지 병렬 처리)에서 호출되면 워커를 fork 대신 spawn으로 시작합니다.
+   여러 스레드가 있는 프로세스를 fork하면 다른 스레드가 잡고 있던 lock이 자식 프로세스에서 영원히 풀리지 않을 수 있습니다.
+6. 워커는 임시 파일명으로 저장하고, 모든 워커가 끝난 뒤 페이지 순서대로 최종 파일명으로 옮깁니다.
+   같은 문제번호가 여러 페이지에서 나오더라도 순차 실행과 똑같이 마지막 페이지의 결과가 남으므로 결과가 항상 같습니다.
+
+워커 함수 형식 >
+  worker(pdf_path, pages, **kwargs) -> (outputs, errors)
+  outputs : [{'page': 3, 'path': '최종 경로', 'tmp_path': '임시 경로'}, ...]
+  errors  : [{'page': 3, 'error': '오류 내용'}, ...]
+'''
+
+
+# 페이지 목록을 최대 workers개의 연속 구간으로 분할
+def split_page_ranges(pages, workers):
+    pages = list(pages)
+    if not pages:
+        return []
+    n = max(1, min(workers, len(pages)))
+    size = -(-len(pages) // n)  # 올림 나눗셈
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+
+# 워커가 먼저 저장할 임시 파일 경로 (확장자는 유지해야 cv2.imwrite가 포맷을 인식함)
+def temp_output_path(path, page):
+    root, ext = os.path.splitext(path)
+    return f"{root}.p{page:04d}.tmp{ext}"
+
+
+# 워커 프로세스에서 구간 하나를 실행하고 그 구간에서 기록한 계측값을 함께 반환
+def run_with_metrics(worker, pdf_path, pages, kwargs):
+    metrics.reset()
+    outputs, errors = worker(pdf_path, pages, **kwargs)
+    return outputs, errors, metrics.snapshot()
+
+
+# 워커 프로세스 시작 방식: 호출한 프로세스에 다른 스레드가 있으면 spawn, 아니면 플랫폼 기본값
+def worker_context():
+    if threading.active_count() > 1:
+        return multiprocessing.get_context("spawn")
+    return None
+
+
+# 페이지 구간별로 worker를 실행하고 (outputs, errors)를 페이지 순으로 합쳐서 반환
+# workers=1 이면 프로세스를 만들지 않고 현재 프로세스에서 실행
+def run_page_ranges(worker, pdf_path, pages, workers=None, **kwargs):
+    workers = workers or os.cpu_count() or 1
+    chunks = split_page_ranges(pages, workers)
+    outputs, errors = [], []
+
+    if workers == 1:
+        for chunk in chunks:
+            chunk_outputs, chunk_errors = worker(pdf_path, chunk, **kwargs)
+            outputs.extend(chunk_outputs)
+            errors.extend(chunk_errors)
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks), mp_context=worker_context()) as executor:
+            futures = {executor.submit(run_with_metrics, worker, pdf_path, chunk, kwargs): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    chunk_outputs, chunk_errors, snapshot = future.result()
+                    metrics.merge(snapshot)
+                except Exception as e:
+                    # 워커 자체가 죽은 경우 해당 구간 페이지 전체를 오류로 기록
+                    chunk_outputs = []
+                    chunk_errors = [{'page': p, 'error': repr(e)} for p in chunk]
+                outputs.extend(chunk_outputs)
+                errors.extend(chunk_errors)
+
+    # 구간은 서로 겹치지 않으므로 페이지 기준 stable sort로 순차 실행과 같은 순서가 됨
+    outputs.sort(key=lambda o: o['page'])
+    errors.sort(key=lambda e: e['page'])
+    return outputs, errors
+
+
+# 임시 파일을 페이지 순서대로 최종 파일명으로 이동
+def commit_outputs(outputs):
+    for o in outputs:
+        os.replace(o['tmp_path'], o['path'])
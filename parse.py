@@ -1,5 +1,7 @@
 import re
 import json
+from math_lexer import transform_outside_math
+from metrics import metrics
 
 '''
 이 스크립트는 LaTeX 형식으로 변환된 시험문제 `.tex` 파일을 불러와,
@@ -9,72 +11,97 @@ import json
 주요 기능은 다음과 같습니다:
 1. ```latex 블록 단위로 문제를 분리한 뒤,
 2. 각 블록에서 <<problem_num>>, <<description>>, <<choice>>, <<problemInfo>> 등의 태그를 추출합니다.
-3. 수식(`$...$`, `$$...$$`, `\begin{array}...\end{array}`) 외 일반 텍스트에서만 백슬래시(`\`)를 제거하여 React에서 수식 렌더링 시 오류를 방지합니다.
+3. 수식(`$...$`, `$$...$$`, `\[...\]`, `\begin{array}`/`\begin{aligned}`) 외 일반 텍스트에서만 백슬래시(`\`)를 제거하여 React에서 수식 렌더링 시 오류를 방지합니다.
 4. 모든 정보가 갖춰진 문제는 `output.json`에 저장하고, 필수 항목이 누락된 블록은 `exception.json`에 따로 기록하여 검토할 수 있도록 합니다.
 
+파일 전체를 한 번에 읽지 않고 일정 크기씩 읽으면서 블록이 닫히는 즉시 결과를 내보내므로,
+수백 MB 크기로 이어 붙인 .tex 파일도 일정한 메모리로 처리할 수 있습니다.
+블록마다 태그는 정규식 하나로 한 번만 훑어서 모두 추출합니다.
+
 이 스크립트는 MathJax 기반 수식 렌더링과 데이터베이스 저장을 위한 구조화된 문제 데이터를 생성하는 데 유용합니다.
 '''
 
-# 수식 영역($...$, $$...$$, \begin{array}...\end{array})을 보호하면서 그 외 텍스트의 백슬래시(\)만 제거하는 함수
+# 수식 영역($...$, $$...$$, \[...\], array/aligned 환경)을 보호하면서 그 외 텍스트의 백슬래시(\)만 제거하는 함수
 def remove_backslash_outside_math(text):
-    # 보호할 블록: $$...$$, $...$, \begin{array}...\end{array}
-    pattern = re.compile(
-        r'(\\begin\{array\}.*?\\end\{array\}|\${1,2}.*?\${1,2})',
-        re.DOTALL
-    )
-
-    parts = pattern.split(text)
-
-    result = []
-    for part in parts:
-        if re.match(r'(\\begin\{array\}.*?\\end\{array\}|\${1,2}.*?\${1,2})', part, re.DOTALL):
-            result.append(part)  # 보호 구간은 그대로 유지
-        else:
-            result.append(part.replace("\\", ""))  # 나머지 구간의 \ 제거
-    return ''.join(result)
+    return transform_outside_math(text, lambda part: part.replace("\\", ""))
 
 
-input_file="2024_행정소송법.tex"
-output_file=input_file.replace(".tex","")
+# latex 블록 구분자 / 추출할 태그
+BLOCK_DELIMITER = '```latex'
+TAG_PATTERN = re.compile(r'<<(/?)(problemInfo|problem_num|description|choice)>>')
+# 파일을 읽는 단위 (문자 수)
+CHUNK_SIZE = 1 << 20
+# 출력 형식: "json" (JSON 배열) / "jsonl" (한 줄에 문제 하나)
+OUTPUT_FORMAT = "json"
 
-with open(input_file, 'r', encoding='utf-8') as f:
-    content = f.read()
 
 # latex 블록 단위로 분리 + 공백 제거
-blocks = [b.strip() for b in content.split('```latex') if b.strip()]
+# 파일을 CHUNK_SIZE씩 읽으면서 구분자를 찾을 때마다 완성된 블록을 바로 반환
+# 블록마다 버퍼를 잘라내면 남은 버퍼 전체를 매번 복사하므로, 청크 안에서는 위치(start)만 옮기고 청크당 한 번만 잘라냄
+def iter_blocks(f, chunk_size=CHUNK_SIZE):
+    buffer = ''
+    search_from = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        start = 0
+        while True:
+            idx = buffer.find(BLOCK_DELIMITER, max(start, search_from))
+            if idx < 0:
+                break
+            block = buffer[start:idx].strip()
+            if block:
+                yield block
+            start = idx + len(BLOCK_DELIMITER)
+        buffer = buffer[start:]
+        # 구분자가 청크 경계에 걸친 경우를 위해 구분자 길이만큼 겹쳐서 다시 검색
+        search_from = max(0, len(buffer) - len(BLOCK_DELIMITER) + 1)
+
+    block = buffer.strip()
+    if block:
+        yield block
 
-# 결과 저장용 리스트
-result_list = []
-exception_list = []
 
 # 태그 추출 함수
-def extract_tag(text, tag):
-    pattern = fr'<<{tag}>>\s*(.*?)\s*<</{tag}>>'
-    match = re.search(pattern, text, re.DOTALL)
-    return match.group(1).strip() if match else None
+# 블록을 한 번만 훑으면서 각 태그의 첫 번째 <<tag>> ~ 그 뒤 첫 <</tag>> 사이 내용을 모두 추출
+def extract_tags(text):
+    found = {}
+    open_at = {}
+    for match in TAG_PATTERN.finditer(text):
+        closing, tag = match.groups()
+        if tag in found:
+            continue
+        if not closing:
+            open_at.setdefault(tag, match.end())
+        elif tag in open_at:
+            found[tag] = text[open_at.pop(tag):match.start()].strip()
+    return found
+
+
+# 블록 하나 처리 → (정상 데이터, None) 또는 (None, 예외 데이터)
+def parse_block(i, block):
+    tags = extract_tags(block)
 
-# 각 블록 처리
-for i, block in enumerate(blocks):
     # problem_info는 있을 수도 없음
-    raw_info = extract_tag(block, 'problemInfo')
+    raw_info = tags.get('problemInfo')
     problem_info = raw_info.replace("• ", "") if raw_info else None
     # problem_info = "2024. 세무사"
-    problem_num = extract_tag(block, 'problem_num')
+    problem_num = tags.get('problem_num')
     if problem_num:
         problem_num = problem_num.replace(".", "")
 
-    raw_description = extract_tag(block, 'description')
-    description = extract_tag(block, 'description')
-    raw_choice = extract_tag(block, 'choice')
+    description = tags.get('description')
+    raw_choice = tags.get('choice')
     choice = remove_backslash_outside_math(raw_choice) if raw_choice else None
 
     # 필수 요소 누락 시 예외 처리
     if not (problem_num and description and choice):
-        exception_list.append({
+        return None, {
             'index': i+1,
             'block': block
-        })
-        continue
+        }
 
     # 정상 데이터 저장
     result = {
@@ -86,14 +113,81 @@ for i, block in enumerate(blocks):
     if problem_info:  # 있을 때만 포함
         result['problem_info'] = problem_info
 
-    result_list.append(result)
+    return result, None
+
+
+# 각 블록 처리 결과를 블록이 닫히는 순서대로 반환
+def iter_records(f):
+    for i, block in enumerate(iter_blocks(f)):
+        yield parse_block(i, block)
+
+
+# json.dump(list, indent=2)와 같은 형식으로 배열 원소를 하나씩 기록
+class JsonArrayWriter:
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, item):
+        text = json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+        self.f.write(('[\n  ' if self.count == 0 else ',\n  ') + text)
+        self.count += 1
+
+    def close(self):
+        self.f.write('\n]' if self.count else '[]')
+
+
+# 한 줄에 하나씩 기록
+class JsonLinesWriter:
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, item):
+        self.f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+# .tex 파일 하나를 파싱하여 결과 / 예외 파일로 저장
+# exception_mode : 예외 파일 열기 모드 ('a'는 기존 예외 기록 뒤에 이어서 기록)
+# (결과 경로, 예외 경로, 결과 개수, 예외 개수) 반환
+def parse_file(input_file, output_file, output_format=OUTPUT_FORMAT, exception_mode='a'):
+    ext = 'jsonl' if output_format == 'jsonl' else 'json'
+    writer_class = JsonLinesWriter if output_format == 'jsonl' else JsonArrayWriter
+    result_path = f'{output_file}.{ext}'
+    exception_path = f'{output_file}_exception.{ext}'
+
+    with open(input_file, 'r', encoding='utf-8') as f, \
+            open(result_path, 'w', encoding='utf-8') as out, \
+            open(exception_path, exception_mode, encoding='utf-8') as exc_out:
+        result_writer = writer_class(out)
+        exception_writer = writer_class(exc_out)
+
+        # 결과 / 예외를 스트림으로 바로 저장
+        with metrics.timer("parse"):
+            for result, exception in iter_records(f):
+                if exception:
+                    exception_writer.write(exception)
+                else:
+                    result_writer.write(result)
+
+        result_writer.close()
+        exception_writer.close()
+
+    metrics.inc("blocks", result_writer.count + exception_writer.count)
+    metrics.inc("parse_exceptions", exception_writer.count)
+    return result_path, exception_path, result_writer.count, exception_writer.count
+
 
-# JSON 저장
-with open(f'{output_file}.json', 'w', encoding='utf-8') as f:
-    json.dump(result_list, f, ensure_ascii=False, indent=2)
+if __name__ == "__main__":
+    input_file="2024_행정소송법.tex"
+    output_file=input_file.replace(".tex","")
 
-with open(f'{output_file}_exception.json', 'a', encoding='utf-8') as f:
-    json.dump(exception_list, f, ensure_ascii=False, indent=2)
+    with metrics.run("parse", labels={"input": input_file}):
+        _, exception_path, result_count, exception_count = parse_file(input_file, output_file)
 
-print(f"저장 완료: {len(result_list)}개 문제")
-print(f"예외 처리된 항목: {len(exception_list)}개 → exceptions.json에서 확인")
+    print(f"저장 완료: {result_count}개 문제")
+    print(f"예외 처리된 항목: {exception_count}개 → {exception_path}에서 확인")
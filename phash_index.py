@@ -0,0 +1,273 @@
+import os
+import json
+import argparse
+import threading
+from itertools import combinations
+import numpy as np
+import cv2
+from crop_trim import TRIM_OPTIONS, trim_margins
+from ocr_journal import list_images
+
+'''
+문제 이미지의 지각 해시(dHash) 색인입니다.
+세무사 / 회계사 기출문제는 연도별 시험지와 여러 문제집에 같은 문제가 다시 실리는데,
+crop된 이미지가 조금씩 달라(해상도, 여백, 압축) OCR 캐시(이미지 바이트 해시)로는 같은 문제를 찾을 수 없습니다.
+
+1. 이미지 해시 : 흑백 변환 → 여백 제거 → (HASH_SIZE+1) x HASH_SIZE 축소 → 이웃 픽셀 밝기 비교 (HASH_SIZE² 비트)
+   여백 / 해상도 / PNG·JPEG 차이에는 거의 변하지 않고, 내용이 다르면 많은 비트가 달라집니다.
+2. 근접 검색 : multi-index hashing
+   해시를 16비트 조각 CHUNKS개로 나누어 조각별로 정렬해두면, 해밍 거리 MAX_DISTANCE 이내인 해시는
+   적어도 한 조각이 MAX_DISTANCE // CHUNKS 비트 이하로만 다르므로(비둘기집 원리) 그 조각 주변만 찾으면 됩니다. (np.searchsorted)
+   전체를 비교하지 않으므로 수십만 개를 색인해도 검색 한 번에 1ms 이내, 소수의 후보만 비교합니다.
+   실행 중에 추가된 항목은 REBUILD_EVERY개가 모일 때까지 따로 두고 하나씩 비교합니다.
+   가로세로 비율이 ASPECT_TOLERANCE 넘게 다른 후보는 제외합니다.
+3. 디스크 저장 : <색인 폴더>/index.jsonl 에 한 줄씩 추가 (다시 쓰지 않으므로 추가 비용이 일정함)
+   마지막 줄이 쓰다 만 상태로 종료되었으면 읽을 때 무시합니다.
+4. 해시는 금액 / 연도처럼 글자 몇 개만 다른 문제(세법 문제에 매우 흔함)를 구별하지 못하므로(해밍 거리 0~2),
+   해시가 가까운 후보는 pixel_difference로 두 이미지를 다시 비교합니다.
+   같은 폭으로 맞춘 잉크 마스크에서, 상대 이미지의 잉크와 1px 넘게 떨어진 잉크 픽셀을 구역별로 세므로
+   해상도 차이는 0에 가깝게 나오고 숫자 하나만 달라도 그 구역의 값이 커집니다.
+5. 항목에는 OCR 결과 자체가 아니라 OCR 캐시(ocr_cache.py) 키와 설정 지문(settings)을 저장합니다.
+   run_openai.py는 캐시에 없는 이미지를 요청하기 전에 색인에서 비슷한 이미지를 찾고,
+   같은 설정(모델 / 프롬프트 / 인코딩)으로 변환된 결과가 캐시에 있으면 문제번호만 바꾸어 재사용합니다.
+
+실행 예시 >
+  python phash_index.py stats
+  python phash_index.py scan 2024_행정소송법            # 폴더 안 이미지 중 색인과 겹치는 비율
+  python phash_index.py scan 2024_행정소송법 --distance 24
+  python phash_index.py scan 2024_행정소송법 --verify      # 원본 이미지와 픽셀 비교까지 통과한 것만 중복으로 셈
+'''
+
+DEFAULT_INDEX_DIR = os.getenv("PHASH_INDEX_DIR", ".phash_index")
+
+# 해시 한 변 크기 (비트 수 = HASH_SIZE²)
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# multi-index hashing 조각 크기 (16비트 → uint16 배열) / 조각 수
+CHUNK_BITS = 16
+CHUNKS = HASH_BITS // CHUNK_BITS
+# 같은 문제로 볼 최대 해밍 거리
+MAX_DISTANCE = 10
+# 가로세로 비율 허용 차이 (비율)
+ASPECT_TOLERANCE = 0.05
+# 여백 제거 기준 (crop_trim.py와 같은 값)
+TRIM_THRESHOLD = TRIM_OPTIONS["threshold"]
+# 정렬 배열을 다시 만들기 전까지 따로 모아두는 새 항목 수
+REBUILD_EVERY = 4096
+
+# 픽셀 비교: 두 이미지를 작은 쪽 폭(최대 VERIFY_WIDTH px)으로 맞춘 뒤 VERIFY_BLOCK x VERIFY_BLOCK 구역별로 잉크 위치를 비교
+VERIFY_WIDTH = 2048
+VERIFY_BLOCK = 16
+# 잉크로 볼 밝기 기준 / 잉크 위치 허용 오차 (px)
+VERIFY_INK_THRESHOLD = 128
+VERIFY_TOLERANCE = 2
+# 같은 문제로 볼 구역별 불일치 잉크 비율의 최댓값
+VERIFY_MAX_DIFF = 0.01
+# 비교하지 않는 첫 줄 왼쪽 문제번호 자리 (폭 대비 비율)
+VERIFY_NUMBER_WIDTH = 0.1
+# 같은 폭으로 맞췄을 때 허용하는 높이 차이 (비율)
+VERIFY_HEIGHT_TOLERANCE = 0.02
+
+
+# 이미지 바이트 → (해시 정수, 가로세로 비율), 읽을 수 없으면 (None, None)
+def image_hash(image_bytes):
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None, None
+    gray = trim_margins(gray, TRIM_THRESHOLD, 0)
+    aspect = gray.shape[1] / gray.shape[0]
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big"), aspect
+
+
+# 픽셀 비교용 흑백 이미지 (여백 제거), 읽을 수 없으면 None
+def trimmed_gray(image_bytes):
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return None if gray is None else trim_margins(gray, TRIM_THRESHOLD, 0)
+
+
+# 폭 width로 크기를 맞춘 잉크(어두운 픽셀) 마스크
+def ink_mask(gray, width):
+    height = max(1, round(gray.shape[0] * width / gray.shape[1]))
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA) < VERIFY_INK_THRESHOLD
+
+
+# 두 이미지의 픽셀 차이 (0: 같음 ~ 1: 완전히 다름), 비교할 수 없으면 1.0
+# 두 이미지를 작은 쪽 폭(최대 VERIFY_WIDTH)으로 맞추고, 한쪽의 잉크 픽셀 중 다른 쪽 잉크에서 VERIFY_TOLERANCE px 안에 없는
+# 픽셀을 구역(VERIFY_BLOCK)별로 세어 그 비율의 최댓값을 반환
+# 해상도 / 위치가 조금 다른 같은 문제는 0에 가깝고, 금액 숫자 하나만 달라도 그 구역의 값이 커짐
+def pixel_difference(image_bytes, other_bytes):
+    a, b = trimmed_gray(image_bytes), trimmed_gray(other_bytes)
+    if a is None or b is None:
+        return 1.0
+    width = min(a.shape[1], b.shape[1], VERIFY_WIDTH)
+    a, b = ink_mask(a, width), ink_mask(b, width)
+    if abs(a.shape[0] / b.shape[0] - 1) > VERIFY_HEIGHT_TOLERANCE:
+        return 1.0
+    # 높이를 맞추고 구역 크기의 배수가 되도록 빈 영역으로 채움 (잘라내면 마지막 줄이 비교에서 빠짐)
+    height = -(-max(a.shape[0], b.shape[0]) // VERIFY_BLOCK) * VERIFY_BLOCK
+    width = -(-a.shape[1] // VERIFY_BLOCK) * VERIFY_BLOCK
+    a, b = (np.pad(mask, ((0, height - mask.shape[0]), (0, width - mask.shape[1]))) for mask in (a, b))
+    kernel = np.ones((2 * VERIFY_TOLERANCE + 1,) * 2, dtype=np.uint8)
+    near_a, near_b = (cv2.dilate(mask.view(np.uint8), kernel).astype(bool) for mask in (a, b))
+    missing = (a & ~near_b) | (b & ~near_a)
+    # 재사용할 때 문제번호는 바꾸어 쓰므로 첫 줄 왼쪽의 문제번호 자리는 비교하지 않음
+    rows = np.flatnonzero((a | b).any(axis=1))
+    if rows.size:
+        first_line_end = rows[0] + np.argmax(np.diff(np.append(rows, rows[-1] + 2)) > 1) + 1
+        missing[:first_line_end, :round(width * VERIFY_NUMBER_WIDTH)] = False
+    blocks = missing.reshape(height // VERIFY_BLOCK, VERIFY_BLOCK, width // VERIFY_BLOCK, VERIFY_BLOCK)
+    return float(blocks.sum(axis=(1, 3)).max() / VERIFY_BLOCK ** 2)
+
+
+# 색인 항목의 원본 이미지와 픽셀 비교 → 차이 값, 원본 이미지가 없으면 None
+def verify_entry(image_bytes, entry):
+    path = entry.get("path")
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pixel_difference(image_bytes, f.read())
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+# 조각 값에서 radius 비트 이하로 다른 모든 값
+def chunk_neighbors(value, radius):
+    values = [value]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), r):
+            flipped = value
+            for pos in positions:
+                flipped ^= 1 << pos
+            values.append(flipped)
+    return np.array(values, dtype=np.uint16)
+
+
+def hash_hex(value):
+    return f"{value:0{HASH_BITS // 4}x}"
+
+
+# 16진수 해시 목록 → 조각 배열 (항목 수 x CHUNKS, uint16)
+def chunk_matrix(hex_hashes):
+    data = bytes.fromhex("".join(hex_hashes))
+    return np.frombuffer(data, dtype=">u2").astype(np.uint16).reshape(len(hex_hashes), CHUNKS)
+
+
+class PHashIndex:
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = index_dir
+        self.path = os.path.join(index_dir, "index.jsonl")
+        self.lock = threading.Lock()
+        self.entries = []          # [(해시, 가로세로 비율, 항목 dict)]
+        self.keys = set()          # 색인된 OCR 캐시 키
+        self.sorted_chunks = []    # 조각별 (정렬된 조각 값 배열, 항목 번호 배열)
+        self.built = 0             # 정렬 배열에 들어간 항목 수 (이후 항목은 하나씩 비교)
+        os.makedirs(index_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 쓰다 만 마지막 줄
+                    self._insert(entry)
+        self._build()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def _insert(self, entry):
+        self.entries.append((int(entry["hash"], 16), entry["aspect"], entry))
+        self.keys.add(entry.get("key"))
+
+    # 조각별로 값을 정렬한 배열을 만들어 np.searchsorted로 같은 조각 값을 찾음
+    def _build(self):
+        if not self.entries:
+            return
+        chunks = chunk_matrix([entry["hash"] for _, _, entry in self.entries])
+        self.sorted_chunks = []
+        for j in range(CHUNKS):
+            order = np.argsort(chunks[:, j], kind="stable")
+            self.sorted_chunks.append((chunks[order, j], order))
+        self.built = len(self.entries)
+
+    # 항목 추가 (같은 키가 이미 있으면 추가하지 않음)
+    # entry : {"key": OCR 캐시 키, "settings": 설정 지문, "path": 이미지 경로, ...}
+    def add(self, value, aspect, **entry):
+        entry = {"hash": hash_hex(value), "aspect": round(aspect, 4), **entry}
+        with self.lock:
+            if entry.get("key") in self.keys:
+                return False
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._insert(entry)
+            if len(self.entries) - self.built >= REBUILD_EVERY:
+                self._build()
+        return True
+
+    # 후보 항목 번호: 정렬 배열에서 조각이 radius 비트 이하로 다른 항목 + 아직 정렬 배열에 없는 새 항목
+    def _candidates(self, value, radius):
+        candidates = [np.arange(self.built, len(self.entries))]
+        chunks = chunk_matrix([hash_hex(value)])[0]
+        for (values, order), chunk in zip(self.sorted_chunks, chunks):
+            neighbors = chunk_neighbors(int(chunk), radius)
+            starts = np.searchsorted(values, neighbors, side="left")
+            ends = np.searchsorted(values, neighbors, side="right")
+            for start, end in zip(starts, ends):
+                if end > start:
+                    candidates.append(order[start:end])
+        return np.unique(np.concatenate(candidates))
+
+    def _search(self, value, aspect, max_distance, accept):
+        best = None
+        for i in self._candidates(value, max_distance // CHUNKS):
+            other, other_aspect, entry = self.entries[i]
+            distance = hamming(value, other)
+            if distance > max_distance or abs(other_aspect / aspect - 1) > ASPECT_TOLERANCE:
+                continue
+            if (best is None or distance < best[0]) and accept(entry):
+                best = (distance, entry)
+        return best
+
+    # 가장 가까운 항목 → (해밍 거리, 항목) 또는 None
+    # accept : 항목을 후보로 쓸 수 있는지 판단하는 함수 (예: 설정 지문이 같은지)
+    def search(self, value, aspect, max_distance=MAX_DISTANCE, accept=lambda entry: True):
+        with self.lock:
+            return self._search(value, aspect, max_distance, accept)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("stats", "scan"))
+    parser.add_argument("folder", nargs="?")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--distance", type=int, default=MAX_DISTANCE)
+    parser.add_argument("--verify", action="store_true", help="원본 이미지와 픽셀 비교까지 통과한 것만 중복으로 셈")
+    args = parser.parse_args()
+
+    index = PHashIndex(args.index_dir)
+    print(f"색인 항목: {len(index):,}개 ({index.path})")
+    if args.command == "scan":
+        paths = [os.path.join(args.folder, name) for name in list_images(args.folder)]
+        duplicates = 0
+        for path in paths:
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            value, aspect = image_hash(image_bytes)
+            match = index.search(value, aspect, args.distance) if value is not None else None
+            if not match:
+                continue
+            difference = verify_entry(image_bytes, match[1]) if args.verify else None
+            if args.verify and (difference is None or difference > VERIFY_MAX_DIFF):
+                continue
+            duplicates += 1
+            detail = f", 픽셀 차이 {difference:.3f}" if difference is not None else ""
+            print(f"  {os.path.basename(path)} ≈ {match[1].get('path')} (거리 {match[0]}{detail})")
+        rate = duplicates / len(paths) if paths else 0
+        print(f"중복: {duplicates}/{len(paths)}개 ({rate:.1%})")
@@ -0,0 +1,454 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics, METRICS_PROFILE, METRICS_TRACEMALLOC
+from file_io import write_atomic, read_records
+
+'''
+시험지 하나를 crop → OCR → parse → load 순서로 처리하는 증분 파이프라인 실행기입니다.
+
+각 단계는 스크립트마다 경로가 하드코딩되어 따로 실행했는데,
+프롬프트 한 줄만 바꿔도 어떤 시험지의 어느 단계를 다시 돌려야 하는지 직접 판단해야 했습니다.
+
+1. 단계마다 "입력 파일 내용 해시 + 결과에 영향을 주는 파라미터"로 지문(fingerprint)을 만들어 상태 파일에 저장합니다.
+   다시 실행하면 지문이 바뀐 단계와 그 뒤 단계만 다시 처리합니다.
+   - crop  : PDF 내용, crop 방식(text/img), DPI, 렌더링 방식 등
+   - ocr   : crop된 이미지 내용, 모델, SYSTEM_PROMPT 해시, USER_TEXT, 이미지 인코딩 옵션 등
+   - parse : .tex 내용, 블록 구분자 / 태그 패턴 / 출력 형식
+   - load  : 파싱 결과와 정답 파일 내용, 과목 / 문제 묶음 / 태그
+   다음 단계의 지문은 앞 단계 "결과 파일의 내용"으로 만들기 때문에,
+   앞 단계를 다시 돌렸어도 결과가 같으면 뒤 단계는 다시 처리하지 않습니다.
+2. 결과 파일을 직접 수정한 경우(예: .tex 수작업 수정)는 해당 단계를 다시 돌리지 않고, 수정된 내용을 입력으로 받는 다음 단계만 다시 처리합니다.
+   결과 파일이 없어졌으면 해당 단계를 다시 처리합니다.
+3. 서로 다른 시험지는 병렬로 처리합니다. (OCR 단계는 API rate limit을 공유하므로 한 번에 한 시험지씩 실행)
+   시험지마다 스레드에서 실행되므로 crop 단계의 워커 프로세스는 fork 대신 spawn으로 시작합니다. (page_pool.py)
+   load 단계는 같은 과목 / 문제 묶음으로 저장된 기존 행을 같은 트랜잭션에서 지운 뒤 저장하므로,
+   지문이 바뀌어 다시 실행해도 문제가 중복 저장되지 않습니다.
+4. --dry-run 으로 실제 실행 없이 다시 처리될 단계와 이유만 출력합니다.
+5. 실행마다 단계별 시간 / 토큰 / 업로드 용량 등을 metrics.py로 기록합니다. (--profile, --trace-memory)
+
+설정 파일(pipeline.json) 형식 >
+  {
+    "exams": [
+      {
+        "name": "2025_재정학",
+        "pdf": "2025_재정학.pdf",
+        "crop": "text",
+        "load": {
+          "subject": "세법",
+          "problem_group": "2025_재정학",
+          "answers": "2025_재정학_답안_parsed.json",
+          "tag": ["재정학"]
+        }
+      },
+      { "name": "법인세법_기본문제", "pdf": "법인세법_기본문제.pdf", "crop": "img", "pages": [6, 24] }
+    ]
+  }
+  - crop   : "text" (question_crop_by_text.py) / "img" (question_crop_by_img.py)
+  - pages  : crop이 "img"일 때 처리할 페이지 범위 [시작, 끝) (0부터 시작, 생략 시 PAGE_RANGE)
+  - load   : 없으면 load 단계는 건너뜀
+  - 이미지 폴더 / .tex / 파싱 결과 경로는 "image_folder", "tex", "output" 으로 바꿀 수 있음 (기본값은 name 기준)
+
+실행 예시 >
+  python pipeline.py --dry-run
+  python pipeline.py --jobs 4
+  python pipeline.py --exam 2025_재정학 --force ocr
+'''
+
+STAGES = ("crop", "ocr", "parse", "load")
+
+# 단계별 구현 버전: 파라미터로 드러나지 않는 처리 방식이 바뀌었을 때 올리면 해당 단계부터 다시 처리됨
+STAGE_VERSIONS = {"crop": 1, "ocr": 1, "parse": 1, "load": 1}
+
+DEFAULT_CONFIG = "pipeline.json"
+DEFAULT_STATE = ".pipeline_state.json"
+
+# 해시 계산 시 파일을 읽는 단위
+HASH_CHUNK_SIZE = 1 << 20
+
+# OCR 단계는 API rate limit을 공유하므로 시험지 여러 개를 동시에 돌리지 않음
+ocr_lock = threading.Lock()
+
+
+# 상태 파일: 단계별 지문 / 결과 파일 목록, 파일 해시 캐시
+class PipelineState:
+    def __init__(self, path=DEFAULT_STATE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"files": {}, "exams": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    def get(self, exam, stage):
+        with self.lock:
+            return self.data["exams"].get(exam, {}).get(stage)
+
+    def set(self, exam, stage, record):
+        with self.lock:
+            self.data["exams"].setdefault(exam, {})[stage] = record
+            self._save()
+
+    # 파일 내용 SHA-256 (크기 / 수정 시각이 같으면 저장해둔 해시 재사용)
+    def file_hash(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.data["files"].get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self.lock:
+            self.data["files"][path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    # 임시 파일에 쓴 뒤 교체 (중간에 종료되어도 상태 파일이 깨지지 않음)
+    def _save(self):
+        write_atomic(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# 시험지 설정 → 단계별 경로
+def exam_paths(exam):
+    name = exam["name"]
+    return {
+        "pdf": exam["pdf"],
+        "image_folder": exam.get("image_folder", os.path.splitext(exam["pdf"])[0]),
+        "tex": exam.get("tex", f"{name}.tex"),
+        "output": exam.get("output", name),
+    }
+
+
+# 시험지에서 실행할 단계 목록
+def exam_stages(exam):
+    return [s for s in exam.get("stages", STAGES) if s != "load" or exam.get("load")]
+
+
+# ---- 단계별 파라미터 (지문에 포함) ----
+
+def crop_params(exam):
+    if exam.get("crop", "text") == "img":
+        import question_crop_by_img as crop
+        return {
+            "method": "img",
+            "dpi": crop.DPI,
+            "pages": list(range(*exam["pages"])) if exam.get("pages") else list(crop.PAGE_RANGE),
+            "default_clip_rect": list(crop.DEFAULT_CLIP_RECT),
+            "clip_rects": {str(p): list(r) for p, r in crop.PAGE_CLIP_RECTS.items()},
+            "pink": [crop.LOWER_PINK.tolist(), crop.UPPER_PINK.tolist()],
+            "threshold": crop.THRESHOLD,
+            "trim": crop.TRIM_OPTIONS if crop.TRIM_CROPS else None,
+        }
+    import question_crop_by_text as crop
+    return {
+        "method": "text",
+        "dpi": crop.DPI,
+        "render_mode": crop.RENDER_MODE,
+        "pattern": crop.pattern.pattern,
+        "columns": [crop.COLUMN_GAP, crop.COLUMN_MIN_SHARE, crop.COLUMN_MIN_COUNT, crop.MIN_COLUMN_WIDTH,
+                    crop.X_TOLERANCE, crop.COLUMN_PADDING, crop.PAGE_COLUMN_MIN_CANDIDATES],
+        "trim": crop.TRIM_OPTIONS if crop.TRIM_CROPS else None,
+    }
+
+
+def ocr_params(exam):
+    import run_openai
+    import phash_index
+    return {
+        "model": run_openai.MODEL,
+        "max_tokens": run_openai.MAX_TOKENS,
+        "temperature": run_openai.TEMPERATURE,
+        "system_prompt_sha256": sha256_text(run_openai.SYSTEM_PROMPT),
+        "user_text": run_openai.USER_TEXT,
+        "encoder": run_openai.ENCODER_OPTIONS if run_openai.ENCODE_IMAGES else None,
+        "pack": [run_openai.PACK_SIZE, run_openai.PACK_INSTRUCTION] if run_openai.PACK_SIZE > 1 else None,
+        "phash_reuse": [run_openai.PHASH_REUSE, phash_index.MAX_DISTANCE, phash_index.VERIFY_MAX_DIFF]
+                       if run_openai.PHASH_REUSE else None,
+    }
+
+
+def parse_params(exam):
+    import parse
+    return {
+        "block_delimiter": parse.BLOCK_DELIMITER,
+        "tag_pattern": parse.TAG_PATTERN.pattern,
+        "output_format": parse.OUTPUT_FORMAT,
+    }
+
+
+def load_params(exam):
+    load = exam["load"]
+    return {
+        "subject": load["subject"],
+        "problem_group": load["problem_group"],
+        "tag": load.get("tag", []),
+    }
+
+
+# ---- 단계별 입력 파일 (앞 단계 결과 → 이 단계 입력) ----
+
+def crop_inputs(exam, upstream):
+    return [exam_paths(exam)["pdf"]]
+
+
+def ocr_inputs(exam, upstream):
+    return upstream["crop"]
+
+
+def parse_inputs(exam, upstream):
+    return upstream["ocr"]
+
+
+def load_inputs(exam, upstream):
+    # 파싱 결과 중 첫 번째(정상 데이터)만 사용, 예외 파일은 제외
+    return upstream["parse"][:1] + [exam["load"]["answers"]]
+
+
+# ---- 단계 실행: 결과 파일 목록과 부가 정보 반환 ----
+
+def run_crop(exam, inputs, workers):
+    paths = exam_paths(exam)
+    if exam.get("crop", "text") == "img":
+        import question_crop_by_img as crop
+        pages = range(*exam["pages"]) if exam.get("pages") else crop.PAGE_RANGE
+        outputs, errors = crop.crop_pdf(paths["pdf"], paths["image_folder"], pages=pages, workers=workers)
+    else:
+        import question_crop_by_text as crop
+        outputs, errors = crop.crop_pdf(paths["pdf"], paths["image_folder"], workers=workers, verbose=False)
+    if errors:
+        raise RuntimeError(f"crop 실패 페이지: {[e['page'] for e in errors]} ({errors[0]['error']})")
+    if not outputs:
+        raise RuntimeError("crop된 문제가 없습니다.")
+    return outputs, {"questions": len(outputs)}
+
+
+def run_ocr(exam, inputs, workers):
+    import openai
+    import run_openai
+    from ocr_cache import OCRCache
+    from phash_index import PHashIndex
+
+    tex_path = exam_paths(exam)["tex"]
+    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    cache = OCRCache()
+    # PHASH_REUSE가 꺼져 있으면 중복 후보만 출력하고 결과는 재사용하지 않음
+    index = PHashIndex()
+    results, failed = [], []
+    with ocr_lock:
+        for path, latex_output, error in run_openai.ocr_images(client, inputs, cache, index=index):
+            if error:
+                failed.append(os.path.basename(path))
+            else:
+                results.append(latex_output)
+
+    # 일부라도 실패하면 .tex를 만들지 않음 (성공한 결과는 캐시에 남으므로 다시 실행하면 실패한 이미지만 요청)
+    if failed:
+        raise RuntimeError(f"OCR 실패 {len(failed)}개: {', '.join(failed[:10])}")
+
+    # 이어 붙이지 않고 문제 순서대로 새로 작성
+    write_atomic(tex_path, "".join(results))
+    return [tex_path], {"images": len(inputs), "cache": cache.stats()}
+
+
+def run_parse(exam, inputs, workers):
+    import parse
+    result_path, exception_path, result_count, exception_count = parse.parse_file(
+        inputs[0], exam_paths(exam)["output"], exception_mode="w")
+    return [result_path, exception_path], {"questions": result_count, "exceptions": exception_count}
+
+
+def run_load(exam, inputs, workers):
+    import psycopg2
+    from dotenv import load_dotenv
+    from insertDB import load_problem_group
+
+    load_dotenv()
+    question_data = read_records(inputs[0])
+    with open(inputs[1], encoding="utf-8") as f:
+        answer_data = json.load(f)
+
+    load = exam["load"]
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+    try:
+        with conn.cursor() as cur:
+            # 이전 실행에서 저장한 같은 문제 묶음을 지우고 다시 저장 (지문이 바뀌어 다시 실행해도 중복 없음)
+            rows = load_problem_group(cur, load["subject"], load["problem_group"],
+                                      question_data, answer_data, load.get("tag", []), replace=True)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return [], {"rows": rows}
+
+
+STAGE_FUNCTIONS = {
+    "crop": (crop_params, crop_inputs, run_crop),
+    "ocr": (ocr_params, ocr_inputs, run_ocr),
+    "parse": (parse_params, parse_inputs, run_parse),
+    "load": (load_params, load_inputs, run_load),
+}
+
+
+# 단계 지문: 단계 이름 / 버전 / 파라미터 / 입력 파일 경로와 내용 해시
+def stage_fingerprint(state, stage, params, inputs):
+    payload = {
+        "stage": stage,
+        "version": STAGE_VERSIONS[stage],
+        "params": params,
+        "inputs": [[path, state.file_hash(path)] for path in inputs],
+    }
+    return sha256_text(json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+
+# 다시 처리해야 하는지 판단 → (다시 처리 여부, 이유, 지문)
+def plan_stage(state, exam, stage, upstream, force):
+    record = state.get(exam["name"], stage)
+    if stage in force:
+        return True, "강제 실행", None
+
+    params_fn, inputs_fn, _ = STAGE_FUNCTIONS[stage]
+    inputs = inputs_fn(exam, upstream)
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        return True, f"입력 파일 없음: {missing[0]}", None
+
+    fingerprint = stage_fingerprint(state, stage, params_fn(exam), inputs)
+    if record is None:
+        return True, "처리 기록 없음", fingerprint
+    if record["fingerprint"] != fingerprint:
+        return True, "입력 또는 파라미터 변경", fingerprint
+    if any(not os.path.exists(path) for path in record["outputs"]):
+        return True, "결과 파일 없음", fingerprint
+    return False, "최신", fingerprint
+
+
+# 시험지 하나의 단계를 순서대로 처리 → [(단계, 상태, 이유/오류, 소요 시간)]
+# dry_run이면 실제 실행 없이 다시 처리될 단계만 계산 (앞 단계가 다시 처리되면 뒤 단계도 모두 다시 처리)
+def run_exam(state, exam, force=(), until=None, dry_run=False, workers=None):
+    report = []
+    upstream = {}
+    rebuild_all = False
+    for stage in exam_stages(exam):
+        if until and STAGES.index(stage) > STAGES.index(until):
+            break
+
+        if rebuild_all:
+            rebuild, reason, fingerprint = True, "앞 단계 다시 처리", None
+        else:
+            try:
+                rebuild, reason, fingerprint = plan_stage(state, exam, stage, upstream, force)
+            except Exception as e:
+                report.append((stage, "failed", repr(e), 0.0))
+                break
+
+        if not rebuild:
+            upstream[stage] = state.get(exam["name"], stage)["outputs"]
+            report.append((stage, "up-to-date", reason, 0.0))
+            continue
+
+        if dry_run:
+            report.append((stage, "rebuild", reason, 0.0))
+            rebuild_all = True
+            continue
+
+        params_fn, inputs_fn, run_fn = STAGE_FUNCTIONS[stage]
+        start = time.perf_counter()
+        try:
+            inputs = inputs_fn(exam, upstream)
+            outputs, info = run_fn(exam, inputs, workers)
+            # 실행 후의 입력 내용으로 지문을 다시 계산 (실행 중 입력이 바뀌었으면 다음 실행에서 다시 처리됨)
+            fingerprint = stage_fingerprint(state, stage, params_fn(exam), inputs)
+        except Exception as e:
+            report.append((stage, "failed", repr(e), time.perf_counter() - start))
+            break
+
+        elapsed = time.perf_counter() - start
+        metrics.observe(f"pipeline_{stage}", elapsed)
+        state.set(exam["name"], stage, {
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            "info": info,
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": round(elapsed, 3),
+        })
+        upstream[stage] = outputs
+        report.append((stage, "rebuilt", reason, elapsed))
+    return report
+
+
+# 시험지 여러 개를 병렬 처리 → {시험지 이름: report}
+def run_pipeline(exams, state, jobs=1, force=(), until=None, dry_run=False):
+    jobs = max(1, min(jobs, len(exams) or 1))
+    # crop 단계의 프로세스 수를 시험지 병렬 수로 나누어 코어 과점유 방지
+    workers = max(1, (os.cpu_count() or 1) // jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            exam["name"]: executor.submit(run_exam, state, exam, force, until, dry_run, workers)
+            for exam in exams
+        }
+        reports = {name: future.result() for name, future in futures.items()}
+    # 파일 해시 캐시도 저장 (dry-run에서 계산한 해시도 다음 실행에 재사용)
+    state.save()
+    return reports
+
+
+def print_reports(reports):
+    for name, report in reports.items():
+        print(f"\n[{name}]")
+        for stage, status, reason, elapsed in report:
+            timing = f" ({elapsed:.1f}s)" if elapsed else ""
+            print(f"  {stage:<6} {status:<10} {reason}{timing}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="crop → OCR → parse → load 증분 파이프라인")
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument("--state", default=DEFAULT_STATE)
+    parser.add_argument("--exam", action="append", help="처리할 시험지 이름 (여러 번 지정 가능, 생략 시 전체)")
+    parser.add_argument("--jobs", type=int, default=2, help="동시에 처리할 시험지 수")
+    parser.add_argument("--force", action="append", default=[], choices=STAGES, help="지문과 상관없이 다시 처리할 단계")
+    parser.add_argument("--until", choices=STAGES, help="이 단계까지만 처리")
+    parser.add_argument("--dry-run", action="store_true", help="실행하지 않고 다시 처리될 단계만 출력")
+    parser.add_argument("--profile", action="store_true", help="cProfile 결과를 metrics 폴더에 저장")
+    parser.add_argument("--trace-memory", action="store_true", help="tracemalloc으로 메모리 사용량 기록")
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        exams = json.load(f)["exams"]
+    if args.exam:
+        exams = [e for e in exams if e["name"] in args.exam]
+
+    if args.dry_run:
+        reports = run_pipeline(exams, PipelineState(args.state), args.jobs, set(args.force), args.until, True)
+    else:
+        with metrics.run("pipeline", profile=args.profile or METRICS_PROFILE,
+                         trace_memory=args.trace_memory or METRICS_TRACEMALLOC):
+            reports = run_pipeline(exams, PipelineState(args.state), args.jobs, set(args.force), args.until)
+    print_reports(reports)
+
+    if any(status == "failed" for report in reports.values() for _, status, _, _ in report):
+        sys.exit(1)
@@ -4,63 +4,93 @@ import re
 import fitz
 import cv2
 import pytesseract
+from page_pool import run_page_ranges, temp_output_path, commit_outputs
+from crop_trim import TRIM_OPTIONS, tighten_crop
+from tesseract_pool import TesseractPool, DIGIT_CONFIG, tesserocr
+from metrics import metrics
 
 '''
 이미지 기반 PDF에서 문제 번호를 OCR로 인식하고, OpenCV를 이용해 문제 단위로 자동 분할하는 스크립트입니다.
+저장 전에 crop_trim.py로 잉크가 없는 여백과 페이지 끝의 꼬리말을 잘라냅니다.
 자세한 구현 방식은 블로그에 정리해두었습니다.
 링크 : https://choddu.tistory.com/28
 '''
 
-# PDF 경로
-pdf_path = "법인세법_기본문제.pdf"
-output_folder=pdf_path.replace(".pdf","")
-
-# 출력 폴더 생성
-os.makedirs(output_folder, exist_ok=True)
-
-# PDF 열기
-doc = fitz.open(pdf_path)
-
-# PDF 페이지 로드
-for p in range(6, 24):
-    page = doc.load_page(p)
-
-    # 페이지를 300dpi 해상도의 이미지(Pixmap)로 변환
-    full_pix = page.get_pixmap(dpi=300)
+# OCR/렌더링 병렬 프로세스 수 (1이면 단일 프로세스)
+WORKERS = os.cpu_count() or 1
+
+# 렌더링 해상도
+DPI = 300
+# 처리할 페이지 범위 (0부터 시작하는 페이지 인덱스)
+PAGE_RANGE = range(6, 24)
+# 문제번호 인식용 클립 영역 (PDF 좌표, pt)
+DEFAULT_CLIP_RECT = (0, 50, 300, 700)
+# 특정 페이지만 클립 영역이 다른 경우 {페이지 인덱스: (x0, y0, x1, y1)}
+PAGE_CLIP_RECTS = {6: (0, 120, 300, 700)}
+# clip_rect = (0, 50, 150, 680)
+
+# 마젠타 색상 범위 (cv2 채널 순서 B, G, R)와 이진화 기준값
+LOWER_PINK = np.array([200, 0, 200])[::-1]
+UPPER_PINK = np.array([255, 80, 255])[::-1]
+THRESHOLD = 100
+
+# crop 여백 제거 / 꼬리말 분리 (옵션은 crop_trim.TRIM_OPTIONS)
+TRIM_CROPS = True
+
+# 문제번호 OCR 방식
+# "tesserocr"   : 초기화된 tesseract 엔진을 워커마다 유지하며 NumPy 배열을 바로 인식 (빠름)
+# "pytesseract" : 호출마다 tesseract 프로세스 실행 (기존 방식)
+OCR_BACKEND = "tesserocr" if tesserocr is not None else "pytesseract"
+# 워커 프로세스마다 유지하는 tesserocr 엔진 수 (= 한 번에 렌더링해서 함께 인식하는 페이지 수)
+# tesserocr는 인식 중 GIL을 놓으므로 한 워커 안에서 여러 페이지의 문제번호를 동시에 인식
+OCR_THREADS = 2
+
+
+# 마젠타 문제번호 배지만 남긴 흑백 이진 이미지 생성
+# inRange → bitwise_and → cvtColor → threshold 를 거치면 중간에 3채널 배열이 여러 개 생기므로,
+# 범위 마스크(1채널)에서 밝기가 기준 이하인 픽셀만 지워 바로 이진 이미지를 만듦
+# (마스크 밖 픽셀은 bitwise_and 후 밝기 0이 되어 어차피 threshold에서 0이 되므로 결과는 동일)
+def magenta_binary(img, threshold=THRESHOLD):
+    binary = cv2.inRange(img, LOWER_PINK, UPPER_PINK)
+    binary[cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) <= threshold] = 0
+    return binary
+
+
+# 페이지를 렌더링하고 문제번호 인식용 이진 이미지 생성
+# p는 0부터 시작하는 페이지 인덱스, clip_rect는 문제번호 인식용 영역 (pt)
+# (전체 페이지 이미지, 클립 영역 시작 y(px), 이진 이미지) 반환
+def render_page(page, clip_rect=DEFAULT_CLIP_RECT, dpi=DPI):
+    # 페이지를 300dpi 해상도의 이미지(Pixmap)로 한 번만 렌더링 (alpha=False → RGB 3채널)
+    with metrics.timer("render"):
+        full_pix = page.get_pixmap(dpi=dpi, alpha=False)
 
     # Pixmap의 이미지 데이터를 NumPy 배열로 변환
     full_img = np.frombuffer(full_pix.samples, dtype=np.uint8).reshape((full_pix.height, full_pix.width, full_pix.n))
 
-    # RGBA 이미지인 경우 → RGB로 변환
-    if full_pix.n == 4:
-        full_img = cv2.cvtColor(full_img, cv2.COLOR_RGBA2RGB)
-
-    # 문제번호 인식용 클립 영역
-    clip_rect = fitz.Rect(0, 120, 300, 700) if p == 6 else fitz.Rect(0, 50, 300, 700)
-
-    # clip_rect = fitz.Rect(0, 50, 150, 680)
-    clip_pix = page.get_pixmap(dpi=300, clip=clip_rect)
-    clip_img = np.frombuffer(clip_pix.samples, dtype=np.uint8).reshape((clip_pix.height, clip_pix.width, clip_pix.n))
-    if clip_pix.n == 4:
-        clip_img = cv2.cvtColor(clip_img, cv2.COLOR_RGBA2RGB)
-
+    # 문제번호 인식용 클립 영역은 다시 렌더링하지 않고 full_img의 view로 잘라냄 (복사 없음)
+    scale = full_img.shape[0] / page.rect.height  # pt → px
+    clip_x0, clip_y0, clip_x1, clip_y1 = (int(round(v * scale)) for v in clip_rect)
+    clip_img = full_img[clip_y0:clip_y1, clip_x0:clip_x1]
 
-    # 마젠타 색상 마스킹
-    lower_pink = np.array([200, 0, 200])
-    upper_pink = np.array([255, 80, 255])
-    mask = cv2.inRange(clip_img, lower_pink[::-1], upper_pink[::-1])
-    masked_img = cv2.bitwise_and(clip_img, clip_img, mask=mask)
+    # 마젠타 색상 마스킹 + 이진화
+    with metrics.timer("mask"):
+        thresh = magenta_binary(clip_img)
 
     # 이미지 디버깅
-    # cv2.imshow("이미지3", masked_img)
+    # cv2.imshow("이미지3", thresh)
     # cv2.waitKey(0)
     # cv2.destroyAllWindows()
+    return full_img, clip_y0, thresh
 
-    # Threshold 후 OCR
-    gray = cv2.cvtColor(masked_img, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 100, 255, cv2.THRESH_BINARY)
-    config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
-    ocr_data = pytesseract.image_to_data(thresh, config=config, output_type=pytesseract.Output.DICT)
+
+# pytesseract로 이진 이미지 하나 인식 (호출마다 tesseract 프로세스 실행)
+def pytesseract_data(thresh):
+    return pytesseract.image_to_data(thresh, config=DIGIT_CONFIG, output_type=pytesseract.Output.DICT)
+
+
+# OCR 결과의 문제번호 위치로 페이지를 문제 단위로 crop → 임시 파일로 저장
+def crop_page(full_img, clip_y0, ocr_data, p, output_folder):
+    outputs = []
     # print('ocr_data',ocr_data['text'])
     # ocr_data['', '', '', '', '26', '', '27']
 
@@ -77,32 +107,98 @@ for p in range(6, 24):
     # positions[{'number': 26, 'y_clip_px': 85}, {'number': 27, 'y_clip_px': 1455}]
 
     if not positions:
-        continue
+        return outputs
 
     # 정렬
     positions.sort(key=lambda x: x['y_clip_px'])
 
-    # 보정 좌표 계산용 정보
-    clip_top_pt = clip_rect.y0
-    clip_height_pt = clip_rect.y1 - clip_rect.y0
-    clip_height_px = clip_img.shape[0]
-    full_height_px = full_img.shape[0]
-    page_height_pt = page.rect.height
-
     # 문제별 자르기
     for i, q in enumerate(positions):
-        # OCR 상대 y → 절대 y (pt) → full_img px 변환
-        y_pt = clip_top_pt + q['y_clip_px'] * clip_height_pt / clip_height_px
-        y1 = int(y_pt * full_height_px / page_height_pt)
-
-        if i + 1 < len(positions):
-            y_pt_next = clip_top_pt + positions[i + 1]['y_clip_px'] * clip_height_pt / clip_height_px
-            y2 = int(y_pt_next * full_height_px / page_height_pt)
-        else:
-            y2 = full_img.shape[0]
+        # OCR 상대 y → full_img px 변환 (클립이 full_img의 view이므로 시작 위치만 더하면 됨)
+        y1 = clip_y0 + q['y_clip_px']
+        y2 = clip_y0 + positions[i + 1]['y_clip_px'] if i + 1 < len(positions) else full_img.shape[0]
 
-        # 크롭 및 저장
+        # 크롭 및 저장 (페이지의 마지막 문제는 페이지 끝까지 잘리므로 꼬리말 분리)
         cropped = full_img[y1-20:y2, :]
+        if TRIM_CROPS:
+            with metrics.timer("trim"):
+                cropped, removed = tighten_crop(cropped, TRIM_OPTIONS, bottom=i + 1 == len(positions))
+            metrics.inc("footers_removed", len(removed))
         filename = f"{output_folder}/{q['number']:02d}.png"
-        cv2.imwrite(filename, cropped)
+        tmp_path = temp_output_path(filename, p)
+        with metrics.timer("write"):
+            cv2.imwrite(tmp_path, cropped)
+        metrics.inc("crops")
+        metrics.inc("crop_bytes", os.path.getsize(tmp_path))
+        outputs.append({'page': p, 'path': filename, 'tmp_path': tmp_path})
         print(f"Saved: {filename} ({y1}px ~ {y2}px)")
+
+    return outputs
+
+
+# 워커 프로세스: PDF를 직접 열어 할당된 페이지 구간만 처리
+# 페이지를 OCR_THREADS개씩 묶어 렌더링한 뒤, 묶음의 문제번호 영역을 엔진 풀(batch)에서 동시에 인식하고 crop
+# 페이지별 오류는 모아서 반환하고 나머지 페이지는 계속 처리
+def process_page_range(pdf_path, pages, output_folder, clip_rects=None, default_clip_rect=DEFAULT_CLIP_RECT):
+    # 프로세스 여러 개가 동시에 tesseract를 돌리므로 tesseract 내부 멀티스레드는 끔 (코어 과점유 방지)
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    doc = fitz.open(pdf_path)
+    # 워커 프로세스 하나당 엔진 풀 하나를 만들어 페이지 구간 전체에서 재사용
+    ocr_pool = TesseractPool(size=OCR_THREADS, config=DIGIT_CONFIG) if OCR_BACKEND == "tesserocr" else None
+    outputs, errors = [], []
+    pages = list(pages)
+    group_size = OCR_THREADS if ocr_pool else 1
+    for g in range(0, len(pages), group_size):
+        rendered = []
+        for p in pages[g:g + group_size]:
+            try:
+                clip_rect = (clip_rects or {}).get(p, default_clip_rect)
+                metrics.inc("pages")
+                rendered.append((p, *render_page(doc.load_page(p), clip_rect)))
+            except Exception as e:
+                errors.append({'page': p, 'error': repr(e)})
+        if not rendered:
+            continue
+
+        try:
+            with metrics.timer("ocr"):
+                threshes = [thresh for _, _, _, thresh in rendered]
+                ocr_results = ocr_pool.batch(threshes) if ocr_pool else [pytesseract_data(t) for t in threshes]
+        except Exception as e:
+            errors.extend({'page': p, 'error': repr(e)} for p, _, _, _ in rendered)
+            continue
+
+        for (p, full_img, clip_y0, _), ocr_data in zip(rendered, ocr_results):
+            try:
+                outputs.extend(crop_page(full_img, clip_y0, ocr_data, p, output_folder))
+            except Exception as e:
+                errors.append({'page': p, 'error': repr(e)})
+    if ocr_pool:
+        ocr_pool.close()
+    doc.close()
+    return outputs, errors
+
+
+# PDF의 지정한 페이지 범위를 워커 프로세스에 나누어 crop → 최종 파일명으로 이동 (각 워커가 PDF를 직접 엶)
+# (저장된 이미지 경로 목록(중복 제거, 페이지 순), 페이지별 오류 목록) 반환
+def crop_pdf(pdf_path, output_folder, pages=PAGE_RANGE, workers=WORKERS,
+             clip_rects=PAGE_CLIP_RECTS, default_clip_rect=DEFAULT_CLIP_RECT):
+    os.makedirs(output_folder, exist_ok=True)
+    outputs, errors = run_page_ranges(process_page_range, pdf_path, pages, workers=workers,
+                                      output_folder=output_folder,
+                                      clip_rects=clip_rects, default_clip_rect=default_clip_rect)
+    commit_outputs(outputs)
+    return list(dict.fromkeys(o['path'] for o in outputs)), errors
+
+
+if __name__ == "__main__":
+    # PDF 경로
+    pdf_path = "법인세법_기본문제.pdf"
+    output_folder=pdf_path.replace(".pdf","")
+
+    with metrics.run("crop_by_img", labels={"pdf": pdf_path}):
+        paths, errors = crop_pdf(pdf_path, output_folder)
+
+    print(f"\n저장 완료: {len(paths)}개 문제")
+    for e in errors:
+        print(f"!!! p{str(e['page']).zfill(2)} 처리 실패: {e['error']}")
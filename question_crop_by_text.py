@@ -1,101 +1,277 @@
-import os
-import numpy as np
-import re
-import fitz
-import statistics
-import cv2
-
-'''
-텍스트 기반 PDF 시험지에서 문제 번호(예: 1., 2., 3.)를 기준으로
-각 문제 영역을 자동으로 인식하고 이미지로 분할합니다.
-PyMuPDF를 사용해 텍스트 위치를 추출하고,
-OpenCV를 이용해 해당 영역을 잘라 이미지로 저장합니다.
-자세한 구현 방식은 블로그에 정리해두었습니다.
-링크 : https://choddu.tistory.com/27
-'''
-
-# PDF 열기
-pdf_path = "2025_재정학.pdf"
-doc = fitz.open(pdf_path)
-output_folder=pdf_path.replace(".pdf","")
-os.makedirs(output_folder, exist_ok=True)
-
-total_pages = len(doc)
-# 문제번호를 찾기 위한 숫자 패턴
-# 1~2자리 숫자((ex_1,22)로이고 마침표
-# ex_ 1. 22.
-pattern = re.compile(r'^(\d{1,2})\.')
-
-# 1. 전체 문제번호 후보 모으기
-all_question_candidates = []
-
-for p in range(total_pages):
-    page = doc.load_page(p)
-    # get_text : 페이지에서 텍스트를 볼록 단위로 추출
-    blocks = page.get_text("blocks")
-    # (x0, y0, x1, y1, text, block_no, block_type, block_flags)
-    for block in blocks:
-        x0, y0, x1, y1, text, *_ = block
-        for line in text.strip().splitlines():
-            line = line.strip()
-            match = pattern.match(line)
-            if match:
-                # "01","02","12"... 두자리 문자열로 반환
-                number = match.group(1).zfill(2)
-                all_question_candidates.append({
-                    'page': p + 1,
-                    'number': number,
-                    'x': x0,
-                    'y': y0
-                })
-                break
-
-for item in all_question_candidates:
-    print(item)
-
-# 2. 평균 좌표 기반 필터링으로 문제번호 후보 중 이상치 제거
-# 대부분의 실제 문제번호("숫자.")는 페이지 왼쪽 상단에 위치하므로 x좌표가 비슷함
-# 반면, 본문 중간에 등장하는 "숫자."는 x좌표가 비슷하지 않음
-# 따라서 모든 후보의 x좌표 평균을 구한 뒤, 평균 ±10 정도를 허용하여 문제번호만 필터링함
-# 이를 해결하기 위해, 잘못 인식된 숫자를 제거하고 실제 문제번호만 필터링함
-x_list = [q['x'] for q in all_question_candidates]
-if x_list:
-    mean_x = statistics.mean(x_list)
-    lower, upper = mean_x - 15, mean_x + 15
-else:
-    mean_x = 0
-    lower, upper = -1, -1
-
-print(f"\n 전체 문제번호 평균 x = {mean_x:.2f}, 허용 범위 = [{lower:.2f}, {upper:.2f}]")
-
-# 3. 페이지별로 필터링 후 crop
-for p in range(1, total_pages + 1):
-    question_numbers = [q for q in all_question_candidates if q['page'] == p and lower <= q['x'] <= upper]
-    question_numbers.sort(key=lambda q: q['y'])  # y좌표 순으로 정렬
-
-    if not question_numbers:
-        continue
-
-    # 3-1. 페이지 이미지 렌더링
-    page = doc.load_page(p - 1)
-    page_height = page.rect.height
-    pix = page.get_pixmap(dpi=300)
-    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape((pix.height, pix.width, pix.n))
-    if pix.n == 4:
-        img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
-
-    # 이미지 높이는 픽셀 단위이고, pdf 좌표는 점 단위
-    # scale_y : 변환 비율 계산
-    img_height = img.shape[0]
-    scale_y = img_height / page_height
-
-    # 3-2. 문제 단위로 crop
-    for i, q in enumerate(question_numbers):
-        # 각 문제의 y1부터 다음 문제 y2까지의 이미지를 잘라냄
-        y1 = int(q['y'] * scale_y)
-        y2 = int(question_numbers[i + 1]['y'] * scale_y) if i + 1 < len(question_numbers) else img_height
-        cropped = img[y1:y2, :]
-
-        filename = f"{q['number']}.png"
-        cv2.imwrite(os.path.join(output_folder, filename), cropped, [cv2.IMWRITE_PNG_COMPRESSION, 0])
-        print(f"Saved: {output_folder}/{filename} / p{str(p).zfill(2)} ({y1}px ~ {y2}px)")
+import os
+import numpy as np
+import re
+import fitz
+import statistics
+import cv2
+from page_pool import run_page_ranges, temp_output_path, commit_outputs
+from crop_trim import TRIM_OPTIONS, tighten_crop
+from metrics import metrics
+
+'''
+텍스트 기반 PDF 시험지에서 문제 번호(예: 1., 2., 3.)를 기준으로
+각 문제 영역을 자동으로 인식하고 이미지로 분할합니다.
+PyMuPDF를 사용해 텍스트 위치를 추출하고,
+OpenCV를 이용해 해당 영역을 잘라 이미지로 저장합니다.
+2단 시험지는 문제번호 x좌표로 단을 찾아, 각 문제를 자기 단의 영역만큼만 잘라냅니다.
+단은 페이지마다 그 페이지의 문제번호로 다시 찾으므로, 1단 / 2단 페이지가 섞인 문제집도 페이지별 단 구성대로 자릅니다.
+(문제번호 후보가 너무 적은 페이지는 문서 전체에서 찾은 단을 사용)
+저장 전에 crop_trim.py로 잉크가 없는 여백과 페이지 끝의 꼬리말을 잘라냅니다.
+자세한 구현 방식은 블로그에 정리해두었습니다.
+링크 : https://choddu.tistory.com/27
+'''
+
+# 렌더링 해상도
+DPI = 300
+# 렌더링 방식
+# "clip" : 문제 영역(PDF 좌표)만 잘라서 렌더링 (문제 1개씩 지연 생성, 메모리/시간 절약)
+# "full" : 페이지 전체를 렌더링한 뒤 numpy 배열에서 잘라냄 (기존 방식)
+RENDER_MODE = "clip"
+# crop 여백 제거 / 꼬리말 분리 (옵션은 crop_trim.TRIM_OPTIONS)
+TRIM_CROPS = True
+# 렌더링/crop 병렬 프로세스 수 (1이면 단일 프로세스)
+WORKERS = os.cpu_count() or 1
+
+# 단 구분 (gap detection)
+# 문제번호 x좌표를 정렬했을 때 이웃한 값의 간격이 COLUMN_GAP(pt)보다 크면 다른 무리로 나눔
+COLUMN_GAP = 15
+# 단으로 인정할 최소 문제번호 수 (전체 후보 대비 비율과 최소 개수 중 큰 값)
+COLUMN_MIN_SHARE = 0.1
+COLUMN_MIN_COUNT = 2
+# 단 사이 최소 거리 (pt), 이보다 가까운 무리는 같은 단 안의 들여쓴 번호로 보고 후보가 많은 쪽만 남김
+MIN_COLUMN_WIDTH = 150
+# 페이지별 단 찾기에 필요한 최소 문제번호 후보 수 (이보다 적으면 문서 전체의 단 사용)
+PAGE_COLUMN_MIN_CANDIDATES = 2
+# 단 중심 x좌표 ± X_TOLERANCE 안의 후보만 문제번호로 인정 (pt)
+X_TOLERANCE = 15
+# 단 경계: 다음 단 문제번호 x좌표보다 COLUMN_PADDING(pt)만큼 왼쪽
+COLUMN_PADDING = 6
+
+# 문제번호를 찾기 위한 숫자 패턴
+# 1~2자리 숫자((ex_1,22)로이고 마침표
+# ex_ 1. 22.
+pattern = re.compile(r'^(\d{1,2})\.')
+
+
+# 페이지의 문제별 영역을 PDF 좌표(pt)로 계산
+# 각 문제는 자기 단의 가로 범위로 자르고, 같은 단의 다음 문제 y까지 (단의 마지막 문제는 페이지 끝까지)
+# columns : 이 페이지의 단 (find_page_columns), 오른쪽 단에만 문제가 있는 페이지도 왼쪽 단을 포함하지 않음
+# 1단 페이지면 기존처럼 페이지 전체 폭을 사용
+def iter_question_rects(page, question_numbers, columns):
+    page_rect = page.rect
+    bounds = [page_rect.x0] + [x - COLUMN_PADDING for x in columns[1:]] + [page_rect.x1]
+    for i, q in enumerate(question_numbers):
+        k = q['column']
+        following = question_numbers[i + 1] if i + 1 < len(question_numbers) else None
+        y_end = following['y'] if following and following['column'] == q['column'] else page_rect.y1
+        yield q, fitz.Rect(bounds[k], q['y'], bounds[k + 1], y_end)
+
+
+# 문제 영역만 렌더링 → numpy 배열 (alpha=False 이므로 RGBA→RGB 변환 불필요)
+# 제너레이터로 문제 1개씩 필요할 때 렌더링하여 페이지 전체 pixmap을 만들지 않음
+def iter_clip_crops(page, question_numbers, columns, dpi=DPI):
+    for q, rect in iter_question_rects(page, question_numbers, columns):
+        with metrics.timer("render"):
+            pix = page.get_pixmap(dpi=dpi, clip=rect, alpha=False)
+        cropped = np.frombuffer(pix.samples, dtype=np.uint8).reshape((pix.height, pix.width, pix.n))
+        yield q, rect, cropped
+
+
+# 1. 전체 문제번호 후보 모으기
+# 텍스트 레이어만 읽으므로 렌더링보다 훨씬 가벼움 → x좌표 필터링을 위해 전체 페이지를 한 번에 훑음
+def collect_question_candidates(doc):
+    all_question_candidates = []
+
+    for p in range(len(doc)):
+        page = doc.load_page(p)
+        # get_text : 페이지에서 텍스트를 볼록 단위로 추출
+        blocks = page.get_text("blocks")
+        # (x0, y0, x1, y1, text, block_no, block_type, block_flags)
+        for block in blocks:
+            x0, y0, x1, y1, text, *_ = block
+            for line in text.strip().splitlines():
+                line = line.strip()
+                match = pattern.match(line)
+                if match:
+                    # "01","02","12"... 두자리 문자열로 반환
+                    number = match.group(1).zfill(2)
+                    all_question_candidates.append({
+                        'page': p + 1,
+                        'number': number,
+                        'x': x0,
+                        'y': y0
+                    })
+                    break
+
+    return all_question_candidates
+
+
+# 2. 문제번호 x좌표를 단(column)별로 묶어 단 중심 x좌표 목록 계산
+# 실제 문제번호("숫자.")는 각 단의 왼쪽 끝에 세로로 정렬되어 x좌표가 거의 같고,
+# 본문 중간에 등장하는 "숫자."는 x좌표가 흩어져 있거나 들여쓰기 되어 있음
+# x좌표를 정렬해 간격이 COLUMN_GAP보다 큰 곳에서 나누고(gap detection), 후보가 충분히 많은 무리만 단으로 인정
+# anchors에 있는 x좌표(문서 전체의 단)와 X_TOLERANCE 안에 있는 무리는 후보가 적어도 단으로 인정
+# 전체 평균 ±15로 거르던 방식은 2단 시험지에서 평균이 두 단 사이에 놓여 문제번호를 모두 버렸음
+def find_columns(all_question_candidates, anchors=()):
+    xs = sorted(q['x'] for q in all_question_candidates)
+    clusters = []
+    for x in xs:
+        if clusters and x - clusters[-1][-1] <= COLUMN_GAP:
+            clusters[-1].append(x)
+        else:
+            clusters.append([x])
+
+    min_count = max(COLUMN_MIN_COUNT, COLUMN_MIN_SHARE * len(xs))
+    columns = []  # [(중심 x좌표, 후보 수)]
+    for cluster in clusters:
+        center = statistics.median(cluster)
+        if len(cluster) < min_count and not any(abs(center - x) <= X_TOLERANCE for x in anchors):
+            continue
+        if columns and center - columns[-1][0] < MIN_COLUMN_WIDTH:
+            if len(cluster) > columns[-1][1]:
+                columns[-1] = (center, len(cluster))
+            continue
+        columns.append((center, len(cluster)))
+    return [center for center, _ in columns]
+
+
+# 페이지별 단 {페이지: [단 중심 x좌표, ...]}
+# 페이지마다 그 페이지의 후보만으로 단을 다시 찾음 (1단 / 2단 페이지가 섞인 문제집에서 1단 페이지를 반으로 자르지 않도록)
+# 2단 페이지에서 한쪽 단에 문제가 하나뿐이어도 문서 전체의 단과 x좌표가 맞으면 단으로 인정
+# 후보가 PAGE_COLUMN_MIN_CANDIDATES보다 적거나 단을 찾지 못한 페이지는 문서 전체의 단(columns) 사용
+def find_page_columns(all_question_candidates, columns):
+    candidates_by_page = {}
+    for q in all_question_candidates:
+        candidates_by_page.setdefault(q['page'], []).append(q)
+    page_columns = {}
+    for p, candidates in candidates_by_page.items():
+        found = find_columns(candidates, anchors=columns) if len(candidates) >= PAGE_COLUMN_MIN_CANDIDATES else []
+        page_columns[p] = found or columns
+    return page_columns
+
+
+# 문제번호를 페이지별 단에 배정하고 페이지별로 묶어 단 순서 → y좌표 순으로 정렬 (후보 목록을 한 번만 훑음)
+# 어느 단 중심에서도 X_TOLERANCE 밖에 있는 후보는 본문 속 숫자로 보고 제외
+def group_questions_by_page(all_question_candidates, page_columns):
+    questions_by_page = {}
+    for q in all_question_candidates:
+        columns = page_columns[q['page']]
+        column = next((c for c, x in enumerate(columns) if abs(q['x'] - x) <= X_TOLERANCE), None)
+        if column is not None:
+            questions_by_page.setdefault(q['page'], []).append({**q, 'column': column})
+    for question_numbers in questions_by_page.values():
+        question_numbers.sort(key=lambda q: (q['column'], q['y']))  # 왼쪽 단부터 위에서 아래로
+    return questions_by_page
+
+
+# 3. 한 페이지의 문제들을 crop하여 (최종 경로, 임시 경로) 목록 반환
+# verbose가 꺼져 있으면 저장 로그를 출력하지 않음 (벤치마크에서 터미널 출력 시간이 섞이지 않도록)
+def crop_page(page, p, question_numbers, columns, output_folder, render_mode=RENDER_MODE, verbose=True):
+    outputs = []
+
+    # rect가 페이지 끝까지 닿으면(단의 마지막 문제) 꼬리말이 들어갔을 수 있음
+    def save(q, rect, cropped, log):
+        if TRIM_CROPS:
+            with metrics.timer("trim"):
+                cropped, removed = tighten_crop(cropped, TRIM_OPTIONS, bottom=rect.y1 >= page.rect.y1)
+            metrics.inc("footers_removed", len(removed))
+        path = os.path.join(output_folder, f"{q['number']}.png")
+        tmp_path = temp_output_path(path, p)
+        with metrics.timer("write"):
+            cv2.imwrite(tmp_path, cropped, [cv2.IMWRITE_PNG_COMPRESSION, 0])
+        metrics.inc("crops")
+        metrics.inc("crop_bytes", os.path.getsize(tmp_path))
+        outputs.append({'page': p, 'path': path, 'tmp_path': tmp_path})
+        if verbose:
+            print(f"Saved: {path} / p{str(p).zfill(2)} ({log})")
+
+    if render_mode == "clip":
+        # 3-1. 문제 영역만 렌더링하여 저장
+        for q, rect, cropped in iter_clip_crops(page, question_numbers, columns):
+            save(q, rect, cropped, f"{rect.y0:.1f}pt ~ {rect.y1:.1f}pt, x {rect.x0:.1f}pt ~ {rect.x1:.1f}pt")
+        return outputs
+
+    # 3-1. 페이지 이미지 렌더링
+    page_height = page.rect.height
+    with metrics.timer("render"):
+        pix = page.get_pixmap(dpi=DPI)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape((pix.height, pix.width, pix.n))
+    if pix.n == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
+
+    # 이미지는 픽셀 단위이고, pdf 좌표는 점 단위
+    # scale : 변환 비율 계산
+    img_height, img_width = img.shape[:2]
+    scale_y = img_height / page_height
+    scale_x = img_width / page.rect.width
+
+    # 3-2. 문제 단위로 crop (자기 단의 가로 범위만)
+    for q, rect in iter_question_rects(page, question_numbers, columns):
+        y1, y2 = int(rect.y0 * scale_y), int(rect.y1 * scale_y)
+        x1, x2 = int(rect.x0 * scale_x), int(rect.x1 * scale_x)
+        cropped = img[y1:y2, x1:x2]
+        save(q, rect, cropped, f"{y1}px ~ {y2}px, x {x1}px ~ {x2}px")
+    return outputs
+
+
+# 워커 프로세스: PDF를 직접 열어 할당된 페이지 구간만 처리
+# 페이지별 오류는 모아서 반환하고 나머지 페이지는 계속 처리
+def crop_page_range(pdf_path, pages, questions_by_page, page_columns, output_folder, render_mode=RENDER_MODE,
+                    verbose=True):
+    doc = fitz.open(pdf_path)
+    outputs, errors = [], []
+    for p in pages:
+        try:
+            page = doc.load_page(p - 1)
+            metrics.inc("pages")
+            outputs.extend(crop_page(page, p, questions_by_page[p], page_columns[p], output_folder, render_mode,
+                                     verbose))
+        except Exception as e:
+            errors.append({'page': p, 'error': repr(e)})
+    doc.close()
+    return outputs, errors
+
+
+# PDF 전체 crop: 문제번호 후보 수집 → 단 찾기 (문서 전체 → 페이지별) → 페이지별 병렬 crop → 최종 파일명으로 이동
+# (저장된 이미지 경로 목록(중복 제거, 페이지 순), 페이지별 오류 목록) 반환
+def crop_pdf(pdf_path, output_folder, workers=WORKERS, render_mode=RENDER_MODE, verbose=True):
+    os.makedirs(output_folder, exist_ok=True)
+    doc = fitz.open(pdf_path)
+    with metrics.timer("text_scan"):
+        all_question_candidates = collect_question_candidates(doc)
+    doc.close()
+
+    if verbose:
+        for item in all_question_candidates:
+            print(item)
+
+    columns = find_columns(all_question_candidates)
+    page_columns = find_page_columns(all_question_candidates, columns)
+    if verbose:
+        print(f"\n 단 {len(columns)}개, 문제번호 x = {[round(x, 2) for x in columns]} (허용 범위 ±{X_TOLERANCE})")
+        for p, page_cols in sorted(page_columns.items()):
+            if page_cols != columns:
+                print(f" p{str(p).zfill(2)} 단 {len(page_cols)}개, 문제번호 x = {[round(x, 2) for x in page_cols]}")
+
+    # 3. 페이지별로 단에 배정 후 crop (문제가 있는 페이지만 워커에 분배)
+    questions_by_page = group_questions_by_page(all_question_candidates, page_columns)
+    outputs, errors = run_page_ranges(
+        crop_page_range, pdf_path, sorted(questions_by_page), workers=workers,
+        questions_by_page=questions_by_page, page_columns=page_columns, output_folder=output_folder,
+        render_mode=render_mode, verbose=verbose,
+    )
+    commit_outputs(outputs)
+    return list(dict.fromkeys(o['path'] for o in outputs)), errors
+
+
+if __name__ == "__main__":
+    # PDF 열기
+    pdf_path = "2025_재정학.pdf"
+    output_folder=pdf_path.replace(".pdf","")
+
+    with metrics.run("crop_by_text", labels={"pdf": pdf_path}):
+        paths, errors = crop_pdf(pdf_path, output_folder)
+
+    print(f"\n저장 완료: {len(paths)}개 문제")
+    for e in errors:
+        print(f"!!! p{str(e['page']).zfill(2)} 처리 실패: {e['error']}")
@@ -1,7 +1,14 @@
 import os
+import re
 import openai
 import base64
 from dotenv import load_dotenv
+from ocr_dispatcher import dispatch, is_retryable, call_with_retry, RateLimiter
+from ocr_cache import OCRCache
+from ocr_journal import OCRJournal
+from phash_index import PHashIndex, VERIFY_MAX_DIFF, image_hash, verify_entry
+from metrics import metrics
+from image_encoder import ENCODER_OPTIONS, encode_for_upload, estimate_image_tokens, read_png_size, downscaled_size
 
 '''
 문제 이미지에서 수식과 텍스트를 추출하는 OpenAI 기반 프롬프트 코드입니다.
@@ -13,138 +20,548 @@ from dotenv import load_dotenv
 문장 내 인라인 수식은 물론, 배열(array), 정렬(aligned) 등 다양한 수식 형태를 지원합니다.
 
 3. 복잡하거나 누락된 표 형태도 예외사항을 LaTeX 주석(% ⚠)으로 표시하며, 추론 없이 이미지에 보이는 내용만 정확히 추출되도록 튜닝되었습니다.
+
+4. 업로드 전에 image_encoder.py로 여백 제거 / 흑백 변환 / 축소 / PNG·WebP 중 작은 형식 선택을 거쳐 전송량과 비전 토큰을 줄입니다.
+
+5. PACK_SIZE > 1 이면 문제 이미지 K장을 한 요청에 묶어 보내 긴 시스템 프롬프트를 요청마다 반복하지 않습니다.
+응답의 ```latex 블록을 이미지별로 나누고, 개수가 다르거나 <<problem_num>>이 없으면 해당 묶음만 한 장씩 다시 요청합니다.
+
+6. 다른 시험지 / 문제집에 다시 실린 같은 문제(지각 해시가 거의 같은 이미지)는 지각 해시 색인에서 찾아 중복 후보로 알려줍니다. (phash_index.py)
+금액 / 연도만 다른 문제도 해시가 거의 같으므로, PHASH_REUSE가 켜져 있을 때만 원본 이미지와 픽셀 비교(pixel_difference)까지
+통과한 후보의 결과를 문제번호만 바꾸어 재사용합니다. 원본 이미지가 없거나 비교를 통과하지 못하면 새로 요청합니다.
 '''
 
 # 1. .env 파일에서 OPENAI_API_KEY 불러오기
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# 모델 호출 파라미터
+MODEL = "gpt-4o"
+MAX_TOKENS = 4096
+TEMPERATURE = 0
+
+# 동시 요청 / rate limit 설정 (계정 등급에 맞게 조정)
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+MAX_RETRIES = 6
+
+# 업로드 전 이미지 인코딩 사용 여부 (옵션은 image_encoder.ENCODER_OPTIONS)
+ENCODE_IMAGES = True
+
+# 한 요청에 묶어 보낼 이미지 수 (1이면 한 장씩 요청)
+PACK_SIZE = 1
+# 묶음 요청의 최대 응답 토큰 (이미지 수 × MAX_TOKENS 와 이 값 중 작은 값)
+PACK_MAX_TOKENS = 16384
+
+# 캐시에 없는 이미지는 지각 해시 색인(phash_index.py)에서 같은 문제를 찾아 결과 재사용
+# 꺼져 있으면 중복 후보만 출력하고 결과는 재사용하지 않음
+PHASH_REUSE = False
+
+# 이미지 크기를 알 수 없을 때의 입력 토큰 추정치 (high detail 기준 타일 6개 + 기본 85)
+IMAGE_TOKENS_ESTIMATE = 1105
+
+SYSTEM_PROMPT = (
+    "You are a highly accurate OCR-to-LaTeX converter for web-based math rendering, specializing in exam documents with tables, equations, and structured multi-choice formats.\n\n"
+    "Your goal is to convert image or PDF content into **MathJax-compatible LaTeX**, suitable for rendering inside web applications like React or React Native WebView.\n\n"
+
+    "Output Rules:\n"
+    "- Output must be **pure LaTeX math blocks**, fully compatible with MathJax.\n"
+    "- Inline math must be wrapped in `$...$`, **not** `\\(...\\)`.\n"
+    "- Display math must be wrapped in `$$...$$` or `\\[...\\]` (for arrays, aligned blocks, or long statements).\n"
+    "- Use `\\text{...}` to wrap Korean or label text **only inside array/aligned environments**.\n"
+    "- Do **not** use `\\text{}` in inline choice lists (e.g., ① $\\,$ 70,000,000원) — leave as raw text.\n"
+    "- For label-value formatting, use `\\begin{array}` or `\\begin{aligned}` with appropriate alignment columns (`l`, `r`, etc.).\n"
+    "- For sentences with embedded math symbols (e.g., `\\sim`, `\\triangle`), wrap the full sentence in `$$...$$`, and math segments in `$...$`.\n"
+    "  Example: `$$다음은 제25기(2025.1.1. $\\sim$ 12.31.) 자료이다.$$`\n"
+    "- Do **not** use `array` environments for regular text blocks. Only use them for clearly tabular or numerically aligned content.\n"
+    "- Avoid layout commands like `\\dotfill`, `\\hfill`, `\\flushleft`, etc.\n"
+    "- Do **not** use environments like `enumerate`, `itemize`, `tabular`, `figure`, `algorithm2e`, etc.\n"
+    "- Preserve visible symbols like ①, ②, 가, 나, 다 — do not convert or normalize.\n"
+    "- NEVER repeat `\\,` more than 3 times consecutively. Use `$\\quad$` instead if spacing is needed.\n\n"
+    "- Carefully cross-check all tables against the question text to ensure no referenced years, rows, or columns are missing.\\n"
+    "If any expected data (e.g., a year like '20X4년') is mentioned in the question but not present in the table, you must flag the table as incomplete."
+
+
+    "Table Recognition Requirements:\n"
+    "- You MUST detect and transcribe **every table visible in the image**.\n"
+    "- Pay special attention to **all columns and rows** — do NOT skip small or light-colored cells.\n"
+    "- If a table has less than 2 rows or 2 columns, still output it, and add this LaTeX comment: `% ⚠ 표 내용 일부 누락 또는 식별 어려움`\n"
+    "- If a table appears **cropped or cut off**, still output all visible parts and add: `% ⚠ 표가 이미지에서 잘렸을 수 있음`\n"
+    "- If the question or explanation **mentions a specific year (e.g., 20X4년)** but the table only contains **columns like 20X2년, 20X3년**, then the table is **incomplete**.\n"
+    "- In such cases, add this comment to the LaTeX output: `% ⚠ 20X4년 column is missing in table — table is incomplete`\n"
+    "- Do **not** hallucinate or fill in missing rows/columns. Only transcribe what is visibly present.\n\n"
+
+    "Structure Tagging:\n"
+    "- Wrap **answer choices first**, using `<<choice>> ... <</choice>>`\n"
+    "  - Always look for multiple-choice options like ①, ②, ③, ④, ⑤ — even if they are placed at the **bottom** or **separate** from the question text.\n"
+    "  - Start this block where such options appear.\n"
+    "  - Include all answer options regardless of whether they are inline, block, or table-style.\n"
+    "  - If answer choices are in tabular form, use JSON format (see below).\n"
+    "\n"
+    "- Wrap **problem number** using `<<problem_num>> ... <</problem_num>>`\n"
+    "\n"
+    "- Wrap **everything between the problem number and the start of the answer choices** using `<<description>> ... <</description>>`\n"
+    "  - Include all conditions, boxed content, explanations, formulas, and tables.\n"
+    "  - If the sentence ends with “다음 중 옳은 것은?” or similar, include it as part of the `<<description>>` block.\n"
+    "  - Do NOT include any part of the answer choices inside this block.\n"
+    "\n"
+    "- Wrap **metadata** (e.g., exam year, subject, issuer — such as '2020. 세무사' or '2009. CPA') using `<<problemInfo>> ... <</problemInfo>>`\n"
+    "  - This is usually found near the top corner or near the title, even in small font.\n"
+    "\n"
+    "Choices Formatting:\n"
+    "- Always wrap answer options inside:\n"
+    "  <<choice>>\n"
+    "  ...choices...\n"
+    "  <</choice>>\n"
+    "\n"
+    "- If the choices are inline (e.g., ① ~ ⑤), format as:\n"
+    "  <<choice>>\n"
+    "  ① $\\,$ 1,000,000원 $\\quad$ ② $\\,$ 2,000,000원 $\\quad$ ③ ...\n"
+    "  <</choice>>\n"
+    "\n"
+    "- If the choices are in **table format** with categories like '상여', '배당', etc., format them as JSON:\n"
+    "  <<choice>>\n"
+    "  {\n"
+    "    \"choices\": [\n"
+    "      { \"number\": \"①\", \"상여\": \"$11,000,000$\", \"배당\": \"$1,000,000$\" },\n"
+    "      { \"number\": \"②\", \"상여\": \"$10,000,000$\", \"배당\": \"$2,000,000$\" }\n"
+    "    ]\n"
+    "  }\n"
+    "  <</choice>>\n"
+
+
+    "Do NOT hallucinate or infer missing content. Only transcribe what is clearly shown in the image.\n"
+    "Do NOT include document-level LaTeX commands like `\\documentclass`, `\\usepackage`, or `\\begin{document}`.\n\n"
+
+    "The entire output must be wrapped inside a LaTeX code block using triple backticks and the `latex` identifier:\n"
+    "```latex\n"
+    "... content ...\n"
+    "```"
+)
+
+USER_TEXT = (
+    "This image contains tables that may include merged cells.\n"
+    # "Please express those using \\multirow or \\multicolumn where appropriate."
+)
+
+# 묶음 요청에서 이미지 뒤에 붙이는 지시문 (이미지 수만 바뀌고, 그 앞의 시스템 프롬프트 / USER_TEXT는 항상 같은 바이트)
+PACK_INSTRUCTION = (
+    "The {count} images above are separate exam questions, labeled Image 1 to Image {count}.\n"
+    "Convert each image independently, in the given order, following all rules above.\n"
+    "Output exactly {count} separate ```latex code blocks, one per image, and nothing between them."
+)
+
+# 응답에서 ```latex 블록 하나씩 추출
+LATEX_BLOCK_PATTERN = re.compile(r'```latex\b.*?```', re.DOTALL)
+# 결과의 문제번호 태그
+PROBLEM_NUM_PATTERN = re.compile(r'(<<problem_num>>).*?(<</problem_num>>)', re.DOTALL)
 
 
 # 2. 이미지 base64 인코딩 함수
-def encode_image(image_path):
+def read_image(image_path):
     with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
-
-input_folder = "2024_행정소송법"
-# 3. 이미지 경로 및 base64 변환
-for f in sorted(os.listdir(input_folder))[40:]:
-    # if f not in ['32.png']:
-    #     continue
-    image_path = f'{input_folder}/{f}'
-    base64_image = encode_image(image_path)
-
-    # 4. GPT-4o Vision 호출
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a highly accurate OCR-to-LaTeX converter for web-based math rendering, specializing in exam documents with tables, equations, and structured multi-choice formats.\n\n"
-                    "Your goal is to convert image or PDF content into **MathJax-compatible LaTeX**, suitable for rendering inside web applications like React or React Native WebView.\n\n"
-
-                    "Output Rules:\n"
-                    "- Output must be **pure LaTeX math blocks**, fully compatible with MathJax.\n"
-                    "- Inline math must be wrapped in `$...$`, **not** `\\(...\\)`.\n"
-                    "- Display math must be wrapped in `$$...$$` or `\\[...\\]` (for arrays, aligned blocks, or long statements).\n"
-                    "- Use `\\text{...}` to wrap Korean or label text **only inside array/aligned environments**.\n"
-                    "- Do **not** use `\\text{}` in inline choice lists (e.g., ① $\\,$ 70,000,000원) — leave as raw text.\n"
-                    "- For label-value formatting, use `\\begin{array}` or `\\begin{aligned}` with appropriate alignment columns (`l`, `r`, etc.).\n"
-                    "- For sentences with embedded math symbols (e.g., `\\sim`, `\\triangle`), wrap the full sentence in `$$...$$`, and math segments in `$...$`.\n"
-                    "  Example: `$$다음은 제25기(2025.1.1. $\\sim$ 12.31.) 자료이다.$$`\n"
-                    "- Do **not** use `array` environments for regular text blocks. Only use them for clearly tabular or numerically aligned content.\n"
-                    "- Avoid layout commands like `\\dotfill`, `\\hfill`, `\\flushleft`, etc.\n"
-                    "- Do **not** use environments like `enumerate`, `itemize`, `tabular`, `figure`, `algorithm2e`, etc.\n"
-                    "- Preserve visible symbols like ①, ②, 가, 나, 다 — do not convert or normalize.\n"
-                    "- NEVER repeat `\\,` more than 3 times consecutively. Use `$\\quad$` instead if spacing is needed.\n\n"
-                    "- Carefully cross-check all tables against the question text to ensure no referenced years, rows, or columns are missing.\\n"
-                    "If any expected data (e.g., a year like '20X4년') is mentioned in the question but not present in the table, you must flag the table as incomplete."
-
-
-                    "Table Recognition Requirements:\n"
-                    "- You MUST detect and transcribe **every table visible in the image**.\n"
-                    "- Pay special attention to **all columns and rows** — do NOT skip small or light-colored cells.\n"
-                    "- If a table has less than 2 rows or 2 columns, still output it, and add this LaTeX comment: `% ⚠ 표 내용 일부 누락 또는 식별 어려움`\n"
-                    "- If a table appears **cropped or cut off**, still output all visible parts and add: `% ⚠ 표가 이미지에서 잘렸을 수 있음`\n"
-                    "- If the question or explanation **mentions a specific year (e.g., 20X4년)** but the table only contains **columns like 20X2년, 20X3년**, then the table is **incomplete**.\n"
-                    "- In such cases, add this comment to the LaTeX output: `% ⚠ 20X4년 column is missing in table — table is incomplete`\n"
-                    "- Do **not** hallucinate or fill in missing rows/columns. Only transcribe what is visibly present.\n\n"
-
-                    "Structure Tagging:\n"
-                    "- Wrap **answer choices first**, using `<<choice>> ... <</choice>>`\n"
-                    "  - Always look for multiple-choice options like ①, ②, ③, ④, ⑤ — even if they are placed at the **bottom** or **separate** from the question text.\n"
-                    "  - Start this block where such options appear.\n"
-                    "  - Include all answer options regardless of whether they are inline, block, or table-style.\n"
-                    "  - If answer choices are in tabular form, use JSON format (see below).\n"
-                    "\n"
-                    "- Wrap **problem number** using `<<problem_num>> ... <</problem_num>>`\n"
-                    "\n"
-                    "- Wrap **everything between the problem number and the start of the answer choices** using `<<description>> ... <</description>>`\n"
-                    "  - Include all conditions, boxed content, explanations, formulas, and tables.\n"
-                    "  - If the sentence ends with “다음 중 옳은 것은?” or similar, include it as part of the `<<description>>` block.\n"
-                    "  - Do NOT include any part of the answer choices inside this block.\n"
-                    "\n"
-                    "- Wrap **metadata** (e.g., exam year, subject, issuer — such as '2020. 세무사' or '2009. CPA') using `<<problemInfo>> ... <</problemInfo>>`\n"
-                    "  - This is usually found near the top corner or near the title, even in small font.\n"
-                    "\n"
-                    "Choices Formatting:\n"
-                    "- Always wrap answer options inside:\n"
-                    "  <<choice>>\n"
-                    "  ...choices...\n"
-                    "  <</choice>>\n"
-                    "\n"
-                    "- If the choices are inline (e.g., ① ~ ⑤), format as:\n"
-                    "  <<choice>>\n"
-                    "  ① $\\,$ 1,000,000원 $\\quad$ ② $\\,$ 2,000,000원 $\\quad$ ③ ...\n"
-                    "  <</choice>>\n"
-                    "\n"
-                    "- If the choices are in **table format** with categories like '상여', '배당', etc., format them as JSON:\n"
-                    "  <<choice>>\n"
-                    "  {\n"
-                    "    \"choices\": [\n"
-                    "      { \"number\": \"①\", \"상여\": \"$11,000,000$\", \"배당\": \"$1,000,000$\" },\n"
-                    "      { \"number\": \"②\", \"상여\": \"$10,000,000$\", \"배당\": \"$2,000,000$\" }\n"
-                    "    ]\n"
-                    "  }\n"
-                    "  <</choice>>\n"
-
-
-                    "Do NOT hallucinate or infer missing content. Only transcribe what is clearly shown in the image.\n"
-                    "Do NOT include document-level LaTeX commands like `\\documentclass`, `\\usepackage`, or `\\begin{document}`.\n\n"
-
-                    "The entire output must be wrapped inside a LaTeX code block using triple backticks and the `latex` identifier:\n"
-                    "```latex\n"
-                    "... content ...\n"
-                    "```"
-                )
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            "This image contains tables that may include merged cells.\n"
-                            # "Please express those using \\multirow or \\multicolumn where appropriate."
-                        )
+        return img_file.read()
+
+
+def encode_image(image_bytes):
+    return base64.b64encode(image_bytes).decode()
+
+
+# 업로드할 (이미지 바이트, mime 타입) 반환, 인코딩 전후 크기/토큰 출력
+def prepare_image(image_path, image_bytes):
+    metrics.inc("image_bytes_original", len(image_bytes))
+    if not ENCODE_IMAGES:
+        metrics.inc("bytes_uploaded", len(image_bytes))
+        return image_bytes, "image/png"
+    with metrics.timer("encode"):
+        encoded = encode_for_upload(image_bytes)
+    metrics.inc("bytes_uploaded", encoded['encoded_bytes'])
+    metrics.inc("image_tokens_estimated", encoded['tokens_after'])
+    metrics.inc("image_tokens_saved", encoded['tokens_before'] - encoded['tokens_after'])
+    saved = 1 - encoded['encoded_bytes'] / max(1, encoded['original_bytes'])
+    print(f"인코딩: {os.path.basename(image_path)} "
+          f"{encoded['original_bytes'] / 1024:,.0f}KB → {encoded['encoded_bytes'] / 1024:,.0f}KB ({saved:.0%} 감소), "
+          f"토큰 {encoded['tokens_before']} → {encoded['tokens_after']} ({encoded['mime']})")
+    return encoded['data'], encoded['mime']
+
+
+# 3. GPT-4o Vision 요청 메시지 구성
+def build_messages(base64_image, mime_type="image/png"):
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": USER_TEXT
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime_type};base64,{base64_image}",
                     },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}",
-                        },
-                    }
-                ],
-            },
-        ],
-        max_tokens=4096,
-        temperature=0
+                }
+            ],
+        },
+    ]
+
+
+# 이미지 여러 장을 한 요청으로 묶은 메시지
+# 프롬프트 캐싱이 적용되도록 시스템 프롬프트와 USER_TEXT를 맨 앞에 그대로 두고, 이미지 수에 따라 바뀌는 지시문은 맨 뒤에 둠
+def build_packed_messages(images):
+    content = [{"type": "text", "text": USER_TEXT}]
+    for i, (base64_image, mime_type) in enumerate(images, start=1):
+        content.append({"type": "text", "text": f"Image {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}})
+    content.append({"type": "text", "text": PACK_INSTRUCTION.format(count=len(images))})
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+# 이미지 입력 토큰 추정: PNG 헤더의 크기에 축소를 반영해 타일 수 계산 (여백 제거 전 기준이므로 상한값)
+def estimate_image_request_tokens(image_path):
+    with open(image_path, "rb") as f:
+        size = read_png_size(f.read(24))
+    if size is None:
+        return IMAGE_TOKENS_ESTIMATE
+    if ENCODE_IMAGES:
+        size = downscaled_size(*size, ENCODER_OPTIONS["max_long_edge"])
+    return estimate_image_tokens(*size)
+
+
+# TPM 제한용 요청 토큰 추정 (문자 4개 ≈ 1토큰, max_tokens도 한도에 포함됨)
+def estimate_request_tokens(image_path):
+    return (len(SYSTEM_PROMPT) + len(USER_TEXT)) // 4 + estimate_image_request_tokens(image_path) + MAX_TOKENS
+
+
+# 묶음 요청 토큰 추정 (프롬프트는 한 번만 포함)
+def estimate_pack_tokens(image_paths):
+    text_tokens = (len(SYSTEM_PROMPT) + len(USER_TEXT) + len(PACK_INSTRUCTION)) // 4
+    images_tokens = sum(estimate_image_request_tokens(path) for path in image_paths)
+    return text_tokens + images_tokens + pack_max_tokens(len(image_paths))
+
+
+def pack_max_tokens(count):
+    return min(MAX_TOKENS * count, PACK_MAX_TOKENS)
+
+
+# 응답 캐시 키: 원본 이미지 + 결과에 영향을 주는 모든 요청 파라미터 (인코딩 옵션 포함)
+# 묶음 요청 결과는 한 장씩 요청한 결과와 다를 수 있으므로 PACK_SIZE > 1 이면 키를 구분
+def cache_key(image_bytes):
+    if PACK_SIZE > 1:
+        return OCRCache.make_key(image_bytes, base=single_cache_key(image_bytes),
+                                 pack_size=PACK_SIZE, pack_instruction=PACK_INSTRUCTION)
+    return single_cache_key(image_bytes)
+
+
+def single_cache_key(image_bytes):
+    return OCRCache.make_key(
+        image_bytes,
+        api="openai",
+        model=MODEL,
+        system_prompt=SYSTEM_PROMPT,
+        user_text=USER_TEXT,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        encoder=ENCODER_OPTIONS if ENCODE_IMAGES else None,
     )
 
-    # 결과 출력
-    latex_output = response.choices[0].message.content
-    print(f, latex_output)
 
-    # 결과 .tex 파일로 저장
-    with open(f'{input_folder}.tex', "a", encoding="utf-8") as f:
-        f.write(latex_output)
+# 결과를 만든 요청 설정의 지문 (이미지 없이 요청 파라미터만으로 만든 캐시 키)
+def settings_key():
+    return cache_key(b"")
+
+
+# 캐시에 저장된 결과가 있으면 반환 (없으면 None)
+# 묶음 모드에서는 한 장씩 요청했던 결과(묶음 실패 후 재요청 포함)도 사용
+# index가 있으면 캐시에 없는 이미지는 지각 해시 색인에서 같은 문제를 찾아 재사용
+def cached_latex(cache, image_path, index=None):
+    image_bytes = read_image(image_path)
+    keys = [cache_key(image_bytes)]
+    if PACK_SIZE > 1:
+        keys.append(single_cache_key(image_bytes))
+    # 두 키를 모두 찾아본 뒤 이미지 한 장당 hit / miss를 한 번만 셈
+    entry = cache.get_any(keys)
+    metrics.inc("cache_hits" if entry else "cache_misses")
+    if entry:
+        return entry['content']
+    if index is not None:
+        return similar_latex(cache, index, image_path, image_bytes)
+    return None
+
+
+# 재사용한 결과의 문제번호를 이미지 파일명 기준으로 바꿈 (03.png → <<problem_num>> 3. <</problem_num>>)
+def renumber_latex(latex_output, image_path):
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    if not stem.isdigit():
+        return latex_output
+    return PROBLEM_NUM_PATTERN.sub(lambda m: f"{m.group(1)} {int(stem)}. {m.group(2)}", latex_output, count=1)
+
+
+# 지각 해시 색인에서 같은 설정으로 변환된 비슷한 이미지를 찾아 그 결과를 반환 (없으면 None)
+# 해시만으로는 금액 / 연도만 다른 문제를 구별할 수 없으므로, 원본 이미지와 픽셀 비교를 통과한 후보만 재사용
+# PHASH_REUSE가 꺼져 있으면 중복 후보만 출력하고 None 반환
+# 재사용한 결과는 이 이미지의 캐시 키로도 저장하여 다음 실행부터는 캐시에서 바로 가져옴
+def similar_latex(cache, index, image_path, image_bytes):
+    value, aspect = image_hash(image_bytes)
+    if value is None:
+        return None
+    metrics.inc("phash_lookups")
+    settings = settings_key()
+    match = index.search(value, aspect, accept=lambda entry: entry.get("settings") == settings)
+    entry = cache.get(match[1]["key"], count=False) if match else None
+    if entry is None:
+        return None
+
+    distance, source = match
+    metrics.inc("phash_candidates")
+    name = os.path.basename(image_path)
+    if not PHASH_REUSE:
+        print(f"중복 후보: {name} ≈ {source.get('path')} (해밍 거리 {distance}, 재사용 안 함)")
+        return None
+    difference = verify_entry(image_bytes, source)
+    if difference is None or difference > VERIFY_MAX_DIFF:
+        metrics.inc("phash_rejected")
+        reason = "원본 이미지 없음" if difference is None else f"픽셀 차이 {difference:.3f}"
+        print(f"중복 후보 제외: {name} ≈ {source.get('path')} (해밍 거리 {distance}, {reason})")
+        return None
+
+    metrics.inc("phash_hits")
+    print(f"재사용: {name} ≈ {source.get('path')} (해밍 거리 {distance}, 픽셀 차이 {difference:.3f})")
+    latex_output = renumber_latex(entry['content'], image_path)
+    key = cache_key(image_bytes)
+    cache.put(key, {'content': latex_output})
+    index.add(value, aspect, key=key, settings=settings, path=image_path, source=source.get("path"))
+    return latex_output
+
+
+# 변환된 이미지를 지각 해시 색인에 추가 (이미 색인된 캐시 키면 해시를 다시 계산하지 않음)
+def index_latex(index, image_path):
+    image_bytes = read_image(image_path)
+    key = cache_key(image_bytes)
+    if key in index:
+        return
+    value, aspect = image_hash(image_bytes)
+    if value is not None:
+        index.add(value, aspect, key=key, settings=settings_key(), path=image_path)
+
+
+# chat completions 요청 본문 (동기 요청과 배치 요청(openai_batch.py)이 같은 본문을 사용)
+def build_request_body(image_path, image_bytes):
+    upload_bytes, mime_type = prepare_image(image_path, image_bytes)
+    return {
+        "model": MODEL,
+        "messages": build_messages(encode_image(upload_bytes), mime_type),
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+
+
+# 4. GPT-4o Vision 호출 → LaTeX 결과 반환
+def request_latex(client, image_path, cache=None):
+    image_bytes = read_image(image_path)
+    body = build_request_body(image_path, image_bytes)
+    latex_output = send_request(client, body)
+    if cache:
+        cache.put(single_cache_key(image_bytes), {'content': latex_output})
+    return latex_output
+
+
+def send_request(client, body):
+    metrics.inc("requests")
+    with metrics.timer("request"):
+        response = client.chat.completions.create(**body)
+    # 사용량 기록 (과금 기준 토큰, 캐시된 프롬프트 토큰 포함)
+    if response.usage:
+        metrics.inc("prompt_tokens", response.usage.prompt_tokens)
+        metrics.inc("completion_tokens", response.usage.completion_tokens)
+        details = getattr(response.usage, "prompt_tokens_details", None)
+        if details and getattr(details, "cached_tokens", None):
+            metrics.inc("cached_prompt_tokens", details.cached_tokens)
+    return response.choices[0].message.content
+
+
+# 묶음 응답을 이미지별 ```latex 블록으로 분리, 개수가 다르거나 <<problem_num>>이 없는 블록이 있으면 None
+def split_packed_output(text, count):
+    blocks = LATEX_BLOCK_PATTERN.findall(text or "")
+    if len(blocks) != count or any('<<problem_num>>' not in block for block in blocks):
+        return None
+    return blocks
+
+
+# 이미지 여러 장을 한 요청으로 변환 → 이미지 순서대로 (LaTeX 결과, 오류) 목록
+# 응답을 나눌 수 없으면 묶음 안의 이미지를 한 장씩 다시 요청 (재시도 포함)
+# 한 장씩 요청으로 넘어간 뒤에는 이미지별 오류를 결과에 담아 반환하고 예외를 올리지 않음
+# (dispatch가 묶음 전체를 다시 요청하면 이미 성공한 이미지와 묶음 요청 비용을 다시 내게 됨)
+def request_latex_packed(client, image_paths, cache=None, limiter=None, on_retry=None):
+    if len(image_paths) == 1:
+        return [(request_latex(client, image_paths[0], cache), None)]
+
+    images_bytes = [read_image(path) for path in image_paths]
+    images = [prepare_image(path, data) for path, data in zip(image_paths, images_bytes)]
+    body = {
+        "model": MODEL,
+        "messages": build_packed_messages([(encode_image(data), mime) for data, mime in images]),
+        "max_tokens": pack_max_tokens(len(image_paths)),
+        "temperature": TEMPERATURE,
+    }
+    metrics.inc("pack_requests")
+    blocks = split_packed_output(send_request(client, body), len(image_paths))
+    if blocks is None:
+        metrics.inc("pack_fallbacks")
+        print(f"묶음 응답 분리 실패 → 한 장씩 다시 요청: {', '.join(os.path.basename(p) for p in image_paths)}")
+        results = []
+        for path in image_paths:
+            try:
+                results.append((request_latex_single(client, path, cache, limiter, on_retry), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    if cache:
+        for data, block in zip(images_bytes, blocks):
+            cache.put(cache_key(data), {'content': block})
+    return [(block, None) for block in blocks]
+
+
+# 묶음 요청 실패 후 한 장씩 요청 (dispatch 밖에서 호출되므로 재시도를 직접 처리)
+# 이전 시도에서 이미 한 장씩 받아 캐시에 저장한 이미지는 다시 요청하지 않음
+# 요청마다 dispatch와 같은 RateLimiter에서 RPM / TPM을 차감 (API가 오류를 내는 중에 한도 밖 요청이 몰리지 않도록)
+def request_latex_single(client, image_path, cache=None, limiter=None, on_retry=None):
+    if cache:
+        entry = cache.get(single_cache_key(read_image(image_path)), count=False)
+        if entry:
+            metrics.inc("pack_fallback_cached")
+            return entry['content']
+    return call_with_retry(request_latex, client, image_path, cache,
+                           max_retries=MAX_RETRIES, retryable=is_retryable_openai,
+                           before_attempt=(lambda: limiter.wait(estimate_request_tokens(image_path))) if limiter else None,
+                           on_retry=(lambda n, e, d: on_retry(image_path, n, e, d)) if on_retry else None)
+
+
+# 네트워크 오류(상태코드 없음)도 재시도 대상에 포함
+def is_retryable_openai(exc):
+    return isinstance(exc, openai.APIConnectionError) or is_retryable(exc)
+
+
+# 이미지 여러 장을 병렬 변환, (이미지 경로, LaTeX 결과, 오류)를 입력 순서대로 반환
+# PACK_SIZE > 1 이면 캐시에 없는 이미지를 PACK_SIZE장씩 묶어 요청
+def ocr_images(client, image_paths, cache=None, on_retry=None, index=None):
+    def count_retry(item, attempt, error, delay):
+        metrics.inc("retries")
+        if on_retry:
+            on_retry(item, attempt, error, delay)
+
+    if PACK_SIZE > 1:
+        results = ocr_images_packed(client, image_paths, cache, count_retry, index)
+    else:
+        results = dispatch(
+            image_paths,
+            lambda path: request_latex(client, path, cache),
+            concurrency=CONCURRENCY,
+            requests_per_minute=REQUESTS_PER_MINUTE,
+            tokens_per_minute=TOKENS_PER_MINUTE,
+            cost=estimate_request_tokens,
+            max_retries=MAX_RETRIES,
+            retryable=is_retryable_openai,
+            on_retry=count_retry,
+            lookup=(lambda path: cached_latex(cache, path, index)) if cache else None,
+        )
+
+    for path, latex_output, error in results:
+        metrics.inc("ocr_failures" if error else "ocr_images")
+        # 변환된 이미지는 지각 해시 색인에 추가 (결과는 캐시에 있음)
+        if not error and cache and index is not None:
+            index_latex(index, path)
+        yield path, latex_output, error
+
+    counters = metrics.snapshot()["counters"]
+    if counters.get("phash_lookups"):
+        metrics.set_gauge("duplicate_rate", round(counters.get("phash_candidates", 0) / counters["phash_lookups"], 4))
+
+
+def ocr_images_packed(client, image_paths, cache, on_retry, index=None):
+    cached = {}
+    if cache:
+        for path in image_paths:
+            latex_output = cached_latex(cache, path, index)
+            if latex_output is not None:
+                cached[path] = latex_output
+    pending = [path for path in image_paths if path not in cached]
+    packs = [tuple(pending[i:i + PACK_SIZE]) for i in range(0, len(pending), PACK_SIZE)]
+
+    # 묶음 요청과 묶음 실패 후 한 장씩 보내는 요청이 같은 RPM / TPM 한도를 사용
+    limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+    results = dispatch(
+        packs,
+        lambda pack: request_latex_packed(client, list(pack), cache, limiter, on_retry),
+        concurrency=CONCURRENCY,
+        cost=estimate_pack_tokens,
+        max_retries=MAX_RETRIES,
+        retryable=is_retryable_openai,
+        on_retry=on_retry,
+        limiter=limiter,
+    )
+    # 캐시 결과와 묶음 결과를 입력 순서대로 합침 (묶음은 pending 순서대로 반환됨)
+    pack_results = {}
+    for path in image_paths:
+        if path in cached:
+            yield path, cached[path], None
+            continue
+        if path not in pack_results:
+            pack, outputs, error = next(results)
+            for i, pack_path in enumerate(pack):
+                pack_results[pack_path] = outputs[i] if outputs else (None, error)
+        latex_output, error = pack_results.pop(path)
+        yield path, latex_output, error
+
+
+if __name__ == "__main__":
+    # 재시도는 dispatcher에서 처리하므로 클라이언트 자체 재시도는 끔
+    # OPENAI_BASE_URL 환경변수로 스텁 서버(stub_server.py)를 지정할 수 있음
+    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    # 이미 변환한 이미지는 캐시에서 바로 가져옴 (OCR_CACHE_DIR 환경변수로 위치 지정)
+    cache = OCRCache()
+    # 다른 시험지 / 문제집에서 이미 변환한 같은 문제는 지각 해시 색인으로 찾음 (PHASH_INDEX_DIR 환경변수로 위치 지정)
+    # PHASH_REUSE가 꺼져 있으면 중복 후보만 출력
+    index = PHashIndex()
+
+    input_folder = "2024_행정소송법"
+    # 진행 상황은 <폴더>.journal.json에 기록되므로, 중간에 종료되어도 다시 실행하면 끝나지 않은 이미지만 요청
+    journal = OCRJournal(input_folder)
+    files = journal.start()
+
+    def on_retry(path, attempt, error, delay):
+        print(f"재시도 {attempt}회: {os.path.basename(path)} ({error.__class__.__name__}) → {delay:.1f}s 후")
+
+    # 5. 병렬 요청, 결과는 문제별 파일(<폴더>_latex/<이름>.tex)로 저장
+    with metrics.run("run_openai", labels={"input": input_folder, "model": MODEL}):
+        for path, latex_output, error in ocr_images(
+            client, [f'{input_folder}/{f}' for f in files], cache, on_retry, index
+        ):
+            f = os.path.basename(path)
+            if error:
+                print(f"!!! 에러 발생: {f} ({error})")
+                journal.mark_failed(f, error)
+                continue
+
+            # 결과 출력
+            print(f, latex_output)
+
+            # 결과 저장 후 저널에 완료 기록
+            journal.mark_done(f, latex_output)
+
+    # 6. 문제별 결과를 문제 순서대로 모아 .tex 파일을 새로 작성 (이어 붙이지 않음)
+    count = journal.assemble_tex(f'{input_folder}.tex')
+    print(f".tex 저장 완료: {input_folder}.tex ({count}개 문제), 진행 상황: {journal.summary()}")
+    print(f"캐시 통계: {cache.stats()}")
+    counters = metrics.counters
+    print(f"중복 후보: {counters.get('phash_candidates', 0)}/{counters.get('phash_lookups', 0)}개, "
+          f"재사용 {counters.get('phash_hits', 0)}개 (중복률 {metrics.gauges.get('duplicate_rate', 0):.1%}), "
+          f"픽셀 비교 제외 {counters.get('phash_rejected', 0)}개, 색인 항목 {len(index):,}개")
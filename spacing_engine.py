@@ -0,0 +1,98 @@
+import numpy as np
+
+'''
+PyKoSpacing 띄어쓰기 교정을 묶음(batch) 단위로 실행하는 엔진입니다.
+
+PyKoSpacing의 Spacing()은 문장 하나마다 TensorFlow 모델을 한 번씩 실행합니다.
+mathpix_spacing.py는 줄 경계마다, 그리고 그 안의 한글 구간마다 spacing()을 호출하므로
+페이지 하나에도 수십 번의 모델 실행이 발생합니다.
+
+1. 교정할 문장을 모두 모은 뒤 중복을 제거하고, 패딩된 묶음으로 모델을 한 번에 실행합니다.
+2. 한 번 교정한 문장은 메모 캐시에 저장하여 다시 추론하지 않습니다. (세법 지문은 같은 단어 조합이 매우 많음)
+3. 묶음 추론은 Spacing 내부 구현(모델, 사전, 결과 조합 함수)을 그대로 사용하므로 spacing(문장) 결과와 같습니다.
+   처음 한 번은 spacing(문장) 결과와 비교해 확인하고, 다르거나 내부 구현을 찾을 수 없으면 문장 단위 호출로 처리합니다.
+'''
+
+# 모델 입력 길이 (PyKoSpacing 기본값, 시작/끝 기호 포함)
+MODEL_INPUT_LEN = 200
+
+
+class SpacingEngine:
+    def __init__(self, spacing=None, batch_size=128):
+        if spacing is None:
+            from pykospacing import Spacing
+            spacing = Spacing()
+        self.spacing = spacing
+        self.batch_size = batch_size
+        self.cache = {}
+        self.model_calls = 0
+        self.encode = self._find_encoder()
+        self.verified = False
+
+    # 묶음 추론에 필요한 Spacing 내부 구현이 있으면 인코딩 함수 반환 (없으면 None)
+    def _find_encoder(self):
+        try:
+            from pykospacing.kospacing import encoding_and_padding
+        except ImportError:
+            return None
+        required = ('_model', '_w2idx', 'max_len', 'make_pred_sents')
+        if not all(hasattr(self.spacing, name) for name in required):
+            return None
+        return encoding_and_padding
+
+    # 문장 여러 개를 교정하여 입력 순서대로 반환 (캐시에 없는 문장만 추론)
+    def space_many(self, sentences):
+        pending = list(dict.fromkeys(s for s in sentences if s not in self.cache))
+        if pending:
+            for sentence, spaced in zip(pending, self._infer(pending)):
+                self.cache[sentence] = spaced
+        return [self.cache[s] for s in sentences]
+
+    def __call__(self, sentence):
+        return self.space_many([sentence])[0]
+
+    def _infer(self, sentences):
+        if self.encode is None:
+            return [self._infer_one(s) for s in sentences]
+
+        results = [None] * len(sentences)
+        # 모델 입력 길이를 넘는 문장은 Spacing이 직접 나누어 처리하도록 문장 단위로 호출
+        short = [i for i, s in enumerate(sentences) if len(s) <= self.spacing.max_len]
+        for i, s in enumerate(sentences):
+            if len(s) > self.spacing.max_len:
+                results[i] = self._infer_one(s)
+
+        for start in range(0, len(short), self.batch_size):
+            indices = short[start:start + self.batch_size]
+            for i, spaced in zip(indices, self._infer_batch([sentences[i] for i in indices])):
+                results[i] = spaced
+
+        if not self.verified and short:
+            # 묶음 추론 결과가 spacing(문장)과 같은지 처음 한 번 확인
+            self.verified = True
+            sample = short[0]
+            if results[sample] != self._infer_one(sentences[sample]):
+                self.encode = None
+                return [self._infer_one(s) for s in sentences]
+        return results
+
+    def _infer_one(self, sentence):
+        self.model_calls += 1
+        return self.spacing(sentence)
+
+    # Spacing.get_spaced_sent()를 문장 여러 개에 대해 한 번의 predict로 실행
+    def _infer_batch(self, sentences):
+        raw_sents = [("«" + s + "»").replace(' ', '^') for s in sentences]
+        mat_in = self.encode(word2idx_dic=self.spacing._w2idx, sequences=raw_sents,
+                             maxlen=MODEL_INPUT_LEN, padding='post', truncating='post')
+        self.model_calls += 1
+        predictions = self.spacing._model.predict(mat_in, verbose=0)
+
+        results = []
+        for raw_sent, probs in zip(raw_sents, predictions):
+            preds = np.array(['1' if p > 0.5 else '0' for p in probs[:len(raw_sent)]])
+            spaced = self.spacing.make_pred_sents(raw_sent, preds)
+            if getattr(self.spacing, 'rules', None):
+                spaced = self.spacing.apply_rules(spaced)
+            results.append(spaced.strip())
+        return results
@@ -0,0 +1,319 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+'''
+OCR API를 흉내내는 로컬 스텁 HTTP 서버입니다.
+실제 API 비용을 쓰지 않고 동시 요청, rate limit, 재시도 동작을 확인하기 위해 사용합니다.
+
+- POST /v1/chat/completions : OpenAI chat completions 응답을 흉내냅니다.
+- POST /v3/text             : Mathpix 이미지 OCR 응답을 흉내냅니다.
+- POST /v3/pdf, GET /v3/pdf/{pdf_id}[.형식] : Mathpix PDF 비동기 처리(제출 → 상태 확인 → 결과)를 흉내냅니다.
+  상태 확인은 처음 두 번은 "split", 세 번째부터 "completed"를 반환합니다.
+- POST /v1/files, GET /v1/files/{file_id}/content, POST /v1/batches, GET /v1/batches/{batch_id}
+  : OpenAI Batch API(입력 파일 업로드 → 배치 생성 → 상태 확인 → 결과 파일)를 흉내냅니다.
+  상태 확인은 "validating" → "in_progress" → "completed" 순서로 바뀌며,
+  완료 시 요청마다 error_rate 비율로 실패(500) 응답을 섞어 결과 / 오류 파일을 만듭니다.
+- 응답 지연(latency, jitter)과 오류 비율(error_rate)을 설정할 수 있으며,
+  오류는 429 또는 500/503 중 하나로 임의 반환됩니다.
+
+실행 예시 >
+  python stub_server.py --port 8000 --latency 0.5 --error-rate 0.1
+  OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=stub python run_openai.py
+  MATHPIX_API_URL=http://127.0.0.1:8000 python mathpix.py
+'''
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # 서버 설정값 (serve()에서 채워짐)
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    batch_error_rate = 0.0
+    routes = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def handle_request(self, method):
+        path = self.path.split('?')[0]
+        for route_method, route_pattern, handler in self.routes:
+            match = re.fullmatch(route_pattern, path)
+            if route_method == method and match:
+                # 지연 및 오류 주입
+                time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+                if random.random() < self.error_rate:
+                    status = random.choice([429, 500, 503])
+                    self.send_json(status, {'error': {'message': f'stub error {status}', 'type': 'stub_error'}},
+                                   headers={'Retry-After': '0'} if status == 429 else None)
+                    return
+                handler(self, match)
+                return
+        self.send_json(404, {'error': {'message': f'unknown route {method} {path}'}})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+
+# POST /v1/chat/completions
+def chat_completions(handler, match):
+    request = json.loads(handler.read_body() or b'{}')
+    # 이미지 수만큼 ```latex 블록 반환 (여러 이미지를 묶은 요청 확인용)
+    images = sum(1 for m in request.get('messages', []) if isinstance(m.get('content'), list)
+                 for part in m['content'] if part.get('type') == 'image_url')
+    content = '\n'.join(
+        f'```latex\n<<problem_num>> {i}. <</problem_num>>\n<<description>> stub <</description>>\n'
+        '<<choice>> ① $\\,$ 1 <</choice>>\n```'
+        for i in range(1, max(1, images) + 1)
+    )
+    handler.send_json(200, {
+        'id': f'chatcmpl-stub-{random.getrandbits(32):08x}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', 'stub'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': {'prompt_tokens': 1000, 'completion_tokens': 100, 'total_tokens': 1100},
+    })
+
+
+# POST /v3/text
+def mathpix_text(handler, match):
+    handler.read_body()
+    handler.send_json(200, {
+        'request_id': f'stub-{random.getrandbits(32):08x}',
+        'text': '1. 다음 중 옳은 것은? $x+y$',
+        'latex_styled': 'x+y',
+        'line_data': [
+            {'type': 'text', 'text': '1. 다음 중 옳은 것은?'},
+            {'type': 'text', 'text': '$x+y$'},
+        ],
+    })
+
+
+# Mathpix PDF 처리 상태 (pdf_id → 상태 확인 횟수)
+pdf_jobs = {}
+pdf_jobs_lock = threading.Lock()
+
+
+# POST /v3/pdf
+def mathpix_pdf_submit(handler, match):
+    handler.read_body()
+    pdf_id = f'stub-pdf-{random.getrandbits(32):08x}'
+    with pdf_jobs_lock:
+        pdf_jobs[pdf_id] = 0
+    handler.send_json(200, {'pdf_id': pdf_id})
+
+
+# GET /v3/pdf/{pdf_id}
+def mathpix_pdf_status(handler, match):
+    pdf_id = match.group(1)
+    with pdf_jobs_lock:
+        if pdf_id not in pdf_jobs:
+            handler.send_json(404, {'error': 'unknown pdf_id'})
+            return
+        pdf_jobs[pdf_id] += 1
+        polls = pdf_jobs[pdf_id]
+    if polls < 3:
+        handler.send_json(200, {'status': 'split', 'num_pages': 2, 'num_pages_completed': polls - 1})
+    else:
+        handler.send_json(200, {'status': 'completed', 'num_pages': 2, 'num_pages_completed': 2})
+
+
+# GET /v3/pdf/{pdf_id}.{형식}
+def mathpix_pdf_result(handler, match):
+    pdf_id, fmt = match.groups()
+    if pdf_id not in pdf_jobs:
+        handler.send_json(404, {'error': 'unknown pdf_id'})
+        return
+    handler.send_json(200, {'pages': [
+        {'page': 1, 'lines': [{'text': '1. 다음 중 옳은 것은?'}]},
+        {'page': 2, 'lines': [{'text': '2. 다음 중 틀린 것은?'}]},
+    ], 'format': fmt})
+
+
+# OpenAI 파일 / 배치 (file_id → 내용, batch_id → 배치 객체)
+files = {}
+batches = {}
+batch_lock = threading.Lock()
+
+
+def stub_id(prefix):
+    return f'{prefix}-stub-{random.getrandbits(48):012x}'
+
+
+# POST /v1/files (multipart/form-data)
+def openai_file_upload(handler, match):
+    body = handler.read_body()
+    message = BytesParser(policy=policy.default).parsebytes(
+        f"Content-Type: {handler.headers['Content-Type']}\r\n\r\n".encode('utf-8') + body)
+    fields = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+              for part in message.iter_parts()}
+    file_id = stub_id('file')
+    with batch_lock:
+        files[file_id] = fields.get('file', b'')
+    handler.send_json(200, {
+        'id': file_id,
+        'object': 'file',
+        'bytes': len(files[file_id]),
+        'created_at': int(time.time()),
+        'filename': 'batch.jsonl',
+        'purpose': (fields.get('purpose') or b'batch').decode(),
+    })
+
+
+# GET /v1/files/{file_id}/content
+def openai_file_content(handler, match):
+    data = files.get(match.group(1))
+    if data is None:
+        handler.send_json(404, {'error': {'message': 'unknown file'}})
+        return
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'application/octet-stream')
+    handler.send_header('Content-Length', str(len(data)))
+    handler.end_headers()
+    handler.wfile.write(data)
+
+
+# 배치 입력 파일의 요청마다 chat completion 응답(또는 실패)을 만들어 결과 / 오류 파일 생성
+def complete_batch(batch):
+    output_lines, error_lines = [], []
+    for line in files[batch['input_file_id']].decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if random.random() < StubHandler.batch_error_rate:
+            error_lines.append({'id': stub_id('batch_req'), 'custom_id': request['custom_id'],
+                                'response': {'status_code': 500, 'body': {'error': {'message': 'stub error'}}},
+                                'error': None})
+            continue
+        content = ('```latex\n<<problem_num>> 1. <</problem_num>>\n<<description>> '
+                   f"{request['custom_id']} <</description>>\n<<choice>> ① $\\,$ 1 <</choice>>\n```")
+        output_lines.append({'id': stub_id('batch_req'), 'custom_id': request['custom_id'], 'response': {
+            'status_code': 200,
+            'body': {
+                'id': stub_id('chatcmpl'),
+                'object': 'chat.completion',
+                'model': request['body'].get('model', 'stub'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 1000, 'completion_tokens': 100, 'total_tokens': 1100},
+            },
+        }, 'error': None})
+
+    for key, lines in (('output_file_id', output_lines), ('error_file_id', error_lines)):
+        if lines:
+            file_id = stub_id('file')
+            files[file_id] = ''.join(json.dumps(l, ensure_ascii=False) + '\n' for l in lines).encode('utf-8')
+            batch[key] = file_id
+    batch['request_counts'] = {'total': len(output_lines) + len(error_lines),
+                               'completed': len(output_lines), 'failed': len(error_lines)}
+
+
+# POST /v1/batches
+def openai_batch_create(handler, match):
+    request = json.loads(handler.read_body() or b'{}')
+    if request.get('input_file_id') not in files:
+        handler.send_json(400, {'error': {'message': 'unknown input_file_id'}})
+        return
+    batch = {
+        'id': stub_id('batch'),
+        'object': 'batch',
+        'endpoint': request.get('endpoint'),
+        'input_file_id': request['input_file_id'],
+        'completion_window': request.get('completion_window', '24h'),
+        'status': 'validating',
+        'created_at': int(time.time()),
+        'output_file_id': None,
+        'error_file_id': None,
+        'metadata': request.get('metadata'),
+        'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        'polls': 0,
+    }
+    with batch_lock:
+        batches[batch['id']] = batch
+    handler.send_json(200, {k: v for k, v in batch.items() if k != 'polls'})
+
+
+# GET /v1/batches/{batch_id}
+def openai_batch_retrieve(handler, match):
+    with batch_lock:
+        batch = batches.get(match.group(1))
+        if batch is None:
+            handler.send_json(404, {'error': {'message': 'unknown batch'}})
+            return
+        batch['polls'] += 1
+        if batch['status'] == 'validating':
+            batch['status'] = 'in_progress'
+        elif batch['status'] == 'in_progress':
+            complete_batch(batch)
+            batch['status'] = 'completed'
+    handler.send_json(200, {k: v for k, v in batch.items() if k != 'polls'})
+
+
+StubHandler.routes.append(('POST', r'/v1/chat/completions', chat_completions))
+StubHandler.routes.append(('POST', r'/v3/text', mathpix_text))
+StubHandler.routes.append(('POST', r'/v3/pdf', mathpix_pdf_submit))
+StubHandler.routes.append(('GET', r'/v3/pdf/([\w-]+)', mathpix_pdf_status))
+StubHandler.routes.append(('GET', r'/v3/pdf/([\w-]+)\.([\w.]+)', mathpix_pdf_result))
+StubHandler.routes.append(('POST', r'/v1/files', openai_file_upload))
+StubHandler.routes.append(('GET', r'/v1/files/([\w-]+)/content', openai_file_content))
+StubHandler.routes.append(('POST', r'/v1/batches', openai_batch_create))
+StubHandler.routes.append(('GET', r'/v1/batches/([\w-]+)', openai_batch_retrieve))
+
+
+# 스텁 서버 실행 (백그라운드 스레드), 서버 객체 반환
+# batch_error_rate : 배치 결과에서 요청별로 실패시킬 비율
+def serve(port=8000, latency=0.0, jitter=0.0, error_rate=0.0, batch_error_rate=0.0):
+    StubHandler.batch_error_rate = batch_error_rate
+    handler = type('ConfiguredStubHandler', (StubHandler,), {
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    parser.add_argument('--batch-error-rate', type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.jitter, args.error_rate, args.batch_error_rate)
+    print(f"스텁 서버 실행 중: http://127.0.0.1:{args.port} (latency={args.latency}s, error_rate={args.error_rate})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
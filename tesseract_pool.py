@@ -0,0 +1,115 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+'''
+tesserocr(Tesseract C++ API 바인딩)로 초기화된 엔진을 계속 살려두고 재사용하는 OCR 풀입니다.
+
+pytesseract.image_to_data는 호출할 때마다 이미지를 임시 PNG로 저장하고 tesseract 프로세스를 새로 띄워
+언어 데이터를 다시 읽습니다. 숫자만 인식하는 문제번호 OCR은 인식 자체보다 이 시작 비용이 더 큽니다.
+
+1. 스레드마다 엔진을 하나씩 만들어 두고 계속 재사용합니다. (tesserocr는 인식 중 GIL을 놓으므로 스레드 병렬 가능)
+2. NumPy 배열을 그대로 넘기므로 임시 파일을 만들지 않습니다.
+3. pytesseract와 같은 config 문자열(--oem, --psm, -c key=value)을 그대로 사용할 수 있습니다.
+4. batch()로 여러 페이지의 문제번호 영역을 한 번에 넘겨 풀 전체에서 나누어 인식합니다.
+5. 결과는 pytesseract.Output.DICT 형식(text, left, top, width, height, conf)과 같은 키를 사용합니다.
+'''
+
+try:
+    import tesserocr
+except ImportError:  # tesserocr 미설치 시 pytesseract 경로만 사용 가능
+    tesserocr = None
+
+DIGIT_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
+
+
+# pytesseract config 문자열 → (oem, psm, 변수 dict)
+def parse_config(config):
+    oem = re.search(r'--oem\s+(\d+)', config)
+    psm = re.search(r'--psm\s+(\d+)', config)
+    variables = dict(re.findall(r'-c\s+(\w+)=(\S+)', config))
+    return (int(oem.group(1)) if oem else 3,
+            int(psm.group(1)) if psm else 3,
+            variables)
+
+
+class TesseractPool:
+    def __init__(self, size=4, lang='eng', config=DIGIT_CONFIG):
+        if tesserocr is None:
+            raise ImportError("tesserocr가 설치되어 있지 않습니다. (pip install tesserocr)")
+        self.size = size
+        self.lang = lang
+        self.oem, self.psm, self.variables = parse_config(config)
+        self.local = threading.local()
+        self.engines = []
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=size)
+
+    # 현재 스레드의 엔진 (처음 한 번만 초기화)
+    def _engine(self):
+        api = getattr(self.local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.psm, oem=self.oem)
+            for key, value in self.variables.items():
+                api.SetVariable(key, value)
+            self.local.api = api
+            with self.lock:
+                self.engines.append(api)
+        return api
+
+    # NumPy 이미지(흑백 또는 RGB) 인식 → pytesseract DICT 형식 결과
+    def image_to_data(self, img):
+        api = self._engine()
+        img = np.ascontiguousarray(img)
+        height, width = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        api.SetImageBytes(img.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        api.Recognize()
+
+        data = {'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'conf': []}
+        iterator = api.GetIterator()
+        if iterator is None:
+            return data
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(iterator, level):
+            text = word.GetUTF8Text(level)
+            box = word.BoundingBox(level)
+            if text is None or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            data['text'].append(text.strip())
+            data['left'].append(x1)
+            data['top'].append(y1)
+            data['width'].append(x2 - x1)
+            data['height'].append(y2 - y1)
+            data['conf'].append(word.Confidence(level))
+        return data
+
+    # 풀의 모든 스레드에서 엔진을 미리 초기화 (barrier로 작업 하나씩이 서로 다른 스레드에 배정되도록 함)
+    def warm_up(self):
+        barrier = threading.Barrier(self.size)
+
+        def init():
+            self._engine()
+            barrier.wait()
+
+        list(self.executor.map(lambda _: init(), range(self.size)))
+
+    # 여러 이미지를 풀의 엔진들에 나누어 인식, 입력 순서대로 결과 반환
+    def batch(self, images):
+        return list(self.executor.map(self.image_to_data, images))
+
+    def close(self):
+        self.executor.shutdown()
+        with self.lock:
+            for api in self.engines:
+                api.End()
+            self.engines.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,285 @@
+import io
+import os
+import re
+import argparse
+import fitz
+import numpy as np
+import cv2
+from page_pool import run_page_ranges, temp_output_path, commit_outputs
+from question_crop_by_text import (collect_question_candidates, find_columns, find_page_columns,
+                                   group_questions_by_page, iter_question_rects, DPI, TRIM_CROPS, WORKERS)
+from crop_trim import TRIM_OPTIONS, tighten_crop
+from parse import JsonArrayWriter, JsonLinesWriter, OUTPUT_FORMAT, iter_records
+from metrics import metrics
+
+'''
+텍스트 레이어가 있는 PDF 시험지(born-digital)에서 문제 데이터를 바로 추출하는 스크립트입니다.
+question_crop_by_text.py는 텍스트 레이어로 문제 위치만 찾고 이미지로 잘라 GPT-4o로 다시 읽었지만,
+이 스크립트는 같은 위치 정보로 문제 영역의 글자(get_text("dict")의 span: 글꼴, 위치, 플래그)를 직접 읽어
+parse.py 결과와 같은 형태의 레코드를 만듭니다.
+
+1. 문제번호 찾기 / 문제 영역 계산은 question_crop_by_text.py와 같습니다.
+2. 문제 영역의 텍스트 줄을 읽기 순서대로 모은 뒤
+   - problem_num : 첫 줄의 "1." → "1"
+   - description : 문제번호 뒤부터 첫 번째 원문자(①~⑤) 전까지
+   - choice      : 첫 번째 원문자부터 끝까지
+   - problem_info: "• 2024. 세무사" 형태의 줄이 있으면 그 값, 없으면 --problem-info 값
+3. 아래 경우는 텍스트만으로 정확히 옮길 수 없으므로 문제 이미지를 잘라 <이름>_vision/ 에 저장하고 비전 OCR로 보냅니다.
+   - table : 문제 영역에 가로선 / 세로선이 TABLE_MIN_LINES개 이상 (표)
+   - image : 이미지 블록 포함
+   - math  : 수식 글꼴(Symbol, CMMI 등), 위/아래 첨자, 유니코드로 매핑되지 않는 글자(사용자 정의 영역, U+FFFD)
+   - layout: 원문자가 없거나 문제번호 뒤 본문이 비어 있음
+4. --ocr 을 주면 비전 OCR 대상만 run_openai.py로 변환하여(캐시 사용) parse.py 방식으로 파싱한 뒤 문제번호 순서대로 합칩니다.
+   대부분의 국가시험 PDF는 API 호출 없이 몇 초 안에 변환됩니다.
+
+결과 >
+  <이름>.json            : parse.py 결과와 같은 형식
+  <이름>_exception.json  : 비전 OCR 결과 중 필수 태그가 없는 블록 (parse.py와 같은 형식)
+  <이름>_vision/         : 비전 OCR 대상 문제 이미지
+
+실행 예시 >
+  python text_layer_extract.py 2025_재정학.pdf --problem-info "2025. 세무사"
+  python text_layer_extract.py 2025_재정학.pdf --ocr
+'''
+
+# 원문자 선택지
+CHOICE_PATTERN = re.compile(r'[①-⑤]')
+# 문제번호 ("1." / "12.")
+NUMBER_PATTERN = re.compile(r'^\s*(\d{1,2})\.\s*')
+# 문제별 출처 표시 ("• 2024. 세무사")
+PROBLEM_INFO_PATTERN = re.compile(r'^\s*•\s*(\d{4}\.\s*\S.*?)\s*$')
+# 페이지 번호 ("- 3 -", "3")
+PAGE_NUMBER_PATTERN = re.compile(r'^\s*-?\s*\d{1,3}\s*-?\s*$')
+# 수식 글꼴 이름
+MATH_FONT_PATTERN = re.compile(r'(?i)symbol|math|cmmi|cmsy|cmex|cmr\d|mtextra|equation')
+# 유니코드로 매핑되지 않은 글자: 사용자 정의 영역, 대체 문자
+UNMAPPED_PATTERN = re.compile('[\ue000-\uf8ff\ufffd]')
+# span flags의 위 첨자 비트 (PyMuPDF TEXT_FONT_SUPERSCRIPT)
+SUPERSCRIPT_FLAG = 1
+# 표로 판단할 최소 가로선 / 세로선 수 (<보기> 같은 테두리 상자 하나는 가로 2 / 세로 2)
+TABLE_MIN_LINES = 3
+# 선 판단 허용 오차 (pt)
+LINE_TOLERANCE = 1.0
+
+
+# 페이지의 가로선 / 세로선 목록 (표 판단용), 사각형은 네 변으로 나눔
+def page_lines(page):
+    horizontal, vertical = [], []
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                segments = [(item[1], item[2])]
+            elif item[0] == "re":
+                r = item[1]
+                segments = [(r.tl, r.tr), (r.bl, r.br), (r.tl, r.bl), (r.tr, r.br)]
+            else:
+                continue
+            for p1, p2 in segments:
+                if abs(p1.y - p2.y) <= LINE_TOLERANCE and abs(p1.x - p2.x) > LINE_TOLERANCE:
+                    horizontal.append(fitz.Rect(min(p1.x, p2.x), p1.y, max(p1.x, p2.x), p1.y))
+                elif abs(p1.x - p2.x) <= LINE_TOLERANCE and abs(p1.y - p2.y) > LINE_TOLERANCE:
+                    vertical.append(fitz.Rect(p1.x, min(p1.y, p2.y), p1.x, max(p1.y, p2.y)))
+    return horizontal, vertical
+
+
+def count_lines_in(lines, rect):
+    return sum(1 for line in lines if rect.contains(line.tl) and rect.contains(line.br))
+
+
+# 문제 영역 → (텍스트 줄 목록, 비전 OCR이 필요한 이유 목록)
+# 블록 안의 줄바꿈은 공백으로, 블록 사이는 줄바꿈으로 이어 붙임
+def read_question(page, rect, lines):
+    flags = set()
+    horizontal, vertical = lines
+    if count_lines_in(horizontal, rect) >= TABLE_MIN_LINES and count_lines_in(vertical, rect) >= TABLE_MIN_LINES:
+        flags.add("table")
+
+    text_blocks = []
+    for block in page.get_text("dict", clip=rect, sort=True)["blocks"]:
+        if block["type"] == 1:
+            flags.add("image")
+            continue
+        block_lines = []
+        for line in block["lines"]:
+            spans = line["spans"]
+            text = "".join(span["text"] for span in spans).strip()
+            if not text or PAGE_NUMBER_PATTERN.match(text):
+                continue
+            for span in spans:
+                if not span["text"].strip():
+                    continue
+                if MATH_FONT_PATTERN.search(span["font"]) or span["flags"] & SUPERSCRIPT_FLAG \
+                        or UNMAPPED_PATTERN.search(span["text"]):
+                    flags.add("math")
+            block_lines.append(text)
+        if block_lines:
+            text_blocks.append(" ".join(block_lines))
+    return text_blocks, flags
+
+
+# 텍스트 줄 → parse.py 형식 레코드 (형식이 맞지 않으면 None)
+def build_record(text_blocks, problem_info=None):
+    body = []
+    for text in text_blocks:
+        match = PROBLEM_INFO_PATTERN.match(text)
+        if match:
+            problem_info = match.group(1)
+        else:
+            body.append(text)
+
+    text = "\n".join(body)
+    match = NUMBER_PATTERN.match(text)
+    choice_at = CHOICE_PATTERN.search(text)
+    if not match or not choice_at:
+        return None
+    description = text[match.end():choice_at.start()].strip()
+    choice = re.sub(r'\s+', ' ', text[choice_at.start():]).strip()
+    if not description:
+        return None
+
+    record = {
+        'problem_num': match.group(1),
+        'description': description,
+        'choice': choice,
+    }
+    if problem_info:  # 있을 때만 포함
+        record['problem_info'] = problem_info
+    return record
+
+
+# 비전 OCR 대상 문제 이미지 저장 (question_crop_by_text.py의 clip 렌더링과 같은 방식)
+def save_crop(page, p, q, rect, image_folder, dpi=DPI):
+    with metrics.timer("render"):
+        pix = page.get_pixmap(dpi=dpi, clip=rect, alpha=False)
+    cropped = np.frombuffer(pix.samples, dtype=np.uint8).reshape((pix.height, pix.width, pix.n))
+    if TRIM_CROPS:
+        cropped, _ = tighten_crop(cropped, TRIM_OPTIONS, bottom=rect.y1 >= page.rect.y1)
+    path = os.path.join(image_folder, f"{q['number']}.png")
+    tmp_path = temp_output_path(path, p)
+    with metrics.timer("write"):
+        cv2.imwrite(tmp_path, cropped, [cv2.IMWRITE_PNG_COMPRESSION, 0])
+    return path, tmp_path
+
+
+# 워커 프로세스: 할당된 페이지의 문제를 텍스트로 추출하거나 비전 OCR용 이미지로 저장
+# outputs : [{'page', 'number', 'record' 또는 'path' / 'tmp_path', 'flags'}, ...]
+def extract_page_range(pdf_path, pages, questions_by_page, page_columns, image_folder, problem_info=None):
+    doc = fitz.open(pdf_path)
+    outputs, errors = [], []
+    for p in pages:
+        try:
+            page = doc.load_page(p - 1)
+            metrics.inc("pages")
+            with metrics.timer("text_extract"):
+                lines = page_lines(page)
+                questions = [(q, rect, *read_question(page, rect, lines))
+                             for q, rect in iter_question_rects(page, questions_by_page[p], page_columns[p])]
+            for q, rect, text_blocks, flags in questions:
+                record = None if flags else build_record(text_blocks, problem_info)
+                output = {'page': p, 'number': q['number'], 'flags': sorted(flags)}
+                if record:
+                    metrics.inc("text_layer_questions")
+                    output['record'] = record
+                else:
+                    output['flags'] = output['flags'] or ["layout"]
+                    metrics.inc("vision_questions")
+                    output['path'], output['tmp_path'] = save_crop(page, p, q, rect, image_folder)
+                outputs.append(output)
+        except Exception as e:
+            errors.append({'page': p, 'error': repr(e)})
+    doc.close()
+    return outputs, errors
+
+
+# PDF 전체 추출: 문제번호 후보 수집 → 단 찾기 → 페이지별 병렬 추출
+# 같은 문제번호가 여러 페이지에서 나오면 마지막 페이지 결과를 사용 (question_crop_by_text.py와 같음)
+# (문제번호 순서의 결과 목록, 페이지별 오류 목록) 반환
+def extract_pdf(pdf_path, image_folder, problem_info=None, workers=WORKERS):
+    os.makedirs(image_folder, exist_ok=True)
+    doc = fitz.open(pdf_path)
+    with metrics.timer("text_scan"):
+        all_question_candidates = collect_question_candidates(doc)
+    doc.close()
+
+    page_columns = find_page_columns(all_question_candidates, find_columns(all_question_candidates))
+    questions_by_page = group_questions_by_page(all_question_candidates, page_columns)
+    outputs, errors = run_page_ranges(
+        extract_page_range, pdf_path, sorted(questions_by_page), workers=workers,
+        questions_by_page=questions_by_page, page_columns=page_columns, image_folder=image_folder,
+        problem_info=problem_info,
+    )
+    commit_outputs([o for o in outputs if 'path' in o])
+
+    by_number = {}
+    for o in outputs:
+        by_number[o['number']] = o
+    return [by_number[number] for number in sorted(by_number)], errors
+
+
+# 비전 OCR 대상 이미지를 run_openai.py로 변환 → parse.py 방식으로 파싱하여 record / exception 채움
+def ocr_flagged(results):
+    import openai
+    import run_openai
+    from ocr_cache import OCRCache
+
+    flagged = {o['path']: o for o in results if 'path' in o}
+    if not flagged:
+        return
+    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    for path, latex_output, error in run_openai.ocr_images(client, list(flagged), OCRCache()):
+        o = flagged[path]
+        if error:
+            o['error'] = f"{error.__class__.__name__}: {error}"
+            continue
+        o['record'], o['exception'] = next(iter_records(io.StringIO(latex_output)), (None, None))
+
+
+# 결과 / 예외 파일 저장 → (결과 경로, 예외 경로, 결과 개수, 예외 개수)
+def write_results(results, output_file, output_format=OUTPUT_FORMAT):
+    ext = 'jsonl' if output_format == 'jsonl' else 'json'
+    writer_class = JsonLinesWriter if output_format == 'jsonl' else JsonArrayWriter
+    result_path = f'{output_file}.{ext}'
+    exception_path = f'{output_file}_exception.{ext}'
+    with open(result_path, 'w', encoding='utf-8') as out, open(exception_path, 'w', encoding='utf-8') as exc_out:
+        result_writer = writer_class(out)
+        exception_writer = writer_class(exc_out)
+        for o in results:
+            if o.get('record'):
+                result_writer.write(o['record'])
+            elif o.get('exception'):
+                exception_writer.write(o['exception'])
+        result_writer.close()
+        exception_writer.close()
+    return result_path, exception_path, result_writer.count, exception_writer.count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf_path")
+    parser.add_argument("--output", help="결과 파일 이름 (확장자 제외, 기본값은 PDF 이름)")
+    parser.add_argument("--problem-info", help='문제별 출처 표시가 없을 때 사용할 값 (예: "2025. 세무사")')
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--ocr", action="store_true", help="비전 OCR 대상을 run_openai.py로 변환하여 합침")
+    args = parser.parse_args()
+
+    output_file = args.output or os.path.splitext(args.pdf_path)[0]
+    image_folder = f"{output_file}_vision"
+
+    with metrics.run("text_layer_extract", labels={"pdf": args.pdf_path}):
+        results, errors = extract_pdf(args.pdf_path, image_folder, args.problem_info, args.workers)
+        flagged = [o for o in results if 'path' in o]
+        print(f"텍스트 레이어 추출: {len(results) - len(flagged)}개 / 비전 OCR 대상: {len(flagged)}개")
+        for o in flagged:
+            print(f"  {o['number']}번 ({', '.join(o['flags'])}) → {o['path']}")
+        if args.ocr:
+            ocr_flagged(results)
+        result_path, exception_path, result_count, exception_count = write_results(results, output_file)
+
+    print(f"\n저장 완료: {result_count}개 문제 → {result_path}")
+    if exception_count:
+        print(f"예외 처리된 항목: {exception_count}개 → {exception_path}에서 확인")
+    missing = [o['number'] for o in results if not o.get('record') and not o.get('exception')]
+    if missing:
+        print(f"비전 OCR 결과 없음: {', '.join(missing)} (--ocr 로 변환하거나 {image_folder}를 run_openai.py로 변환)")
+    for e in errors:
+        print(f"!!! p{str(e['page']).zfill(2)} 처리 실패: {e['error']}")